@@ -0,0 +1,341 @@
+"""
+Offline batch detection over frame folders and video files.
+
+Each input (a directory of images or a video file) is split into chunks
+of frames. Chunks are decoded in a process pool and downscaled there to
+the model input size. Inference runs batched in the main process. Both
+steps run as stages of a ``pipeline.Pipeline`` named ``batch``, so
+executors can be retuned with PIPELINE_BATCH like the servers.
+
+Progress is checkpointed per chunk, so an interrupted run resumes where
+it stopped. Per input, the output directory gets the same files the
+servers produce:
+
+    <out>/<input>/detections.json     server-format rows
+    <out>/<input>/compactedLog.json   consecutive same-label ranges
+    <out>/<input>/CorrectedLog.json   decoded words
+    <out>/<input>/summary.json        frames, detections and timings (marks the input as done)
+    <out>/report.json                 aggregate throughput
+
+    python batch_detect.py sessions/frames_0001 videos/*.mp4 --out batch-out --decode-workers 4 --batch 16
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT / "python"))
+
+import pipeline  # noqa: E402
+import stages  # noqa: E402
+from realtime_detect import find_latest_weights, write_rows  # noqa: E402
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+VIDEO_SUFFIXES = {".mp4", ".avi", ".mov", ".mkv", ".webm", ".m4v"}
+
+
+# ----- chunking / decoding (runs in the decode pool) -----
+
+def plan_chunks(source: Path, chunk_size: int):
+    """Split an input into ``(kind, ...)`` chunk specs in frame order."""
+    if source.is_dir():
+        files = sorted(p for p in source.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        return [("images", i, [str(p) for p in files[i:i + chunk_size]]) for i in range(0, len(files), chunk_size)]
+    import cv2
+    cap = cv2.VideoCapture(str(source))
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+    cap.release()
+    if total <= 0:
+        # Unknown length (some containers): decode the whole video as one chunk
+        return [("video", str(source), 0, None)]
+    # The container's frame count is an estimate: the last chunk reads to the end of the stream
+    starts = range(0, total, chunk_size)
+    return [("video", str(source), start, chunk_size if start + chunk_size < total else None) for start in starts]
+
+
+def _fit(image, max_side: int):
+    import cv2
+    h, w = image.shape[:2]
+    if not max_side or max(h, w) <= max_side:
+        return image
+    scale = max_side / max(h, w)
+    return cv2.resize(image, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def decode_chunk(chunk: tuple, max_side: int) -> dict:
+    """Decode one chunk to model-sized BGR frames; ``refs`` are 0-based frame indices within the input."""
+    started = time.perf_counter()
+    frames, refs, failed = [], [], 0
+    if chunk[0] == "images":
+        _, start, paths = chunk
+        for index, path in enumerate(paths, start=start):
+            try:
+                with open(path, "rb") as f:
+                    frames.append(stages.decode_image(f.read(), max_side))
+                refs.append(index)
+            except (OSError, stages.InvalidImage) as e:
+                print(f"WARNING: skipping {path}: {e}")
+                failed += 1
+    else:
+        import cv2
+        _, path, start, count = chunk
+        cap = cv2.VideoCapture(path)
+        if start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+            if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start:
+                # Seeking is inexact on some codecs/backends: step to the start frame instead
+                cap.release()
+                cap = cv2.VideoCapture(path)
+                for _ in range(start):
+                    if not cap.grab():
+                        break
+        index = start
+        while count is None or index < start + count:
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frames.append(_fit(frame, max_side))
+            refs.append(index)
+            index += 1
+        cap.release()
+    return {"frames": frames, "refs": refs, "failed": failed, "decode_seconds": time.perf_counter() - started}
+
+
+# ----- main process -----
+
+def check_continuous(source: Path, chunks: list, done: dict):
+    """Raise ValueError if the decoded video chunks leave a gap (bad frame count or seek)."""
+    expected = 0
+    for index in range(len(chunks)):
+        entry = done[index]
+        if not entry["frames"]:
+            continue
+        start = chunks[index][2]
+        if start != expected:
+            raise ValueError(f"frames {expected}-{start - 1} could not be decoded (chunk {index - 1} ended early)")
+        expected += entry["frames"]
+
+
+class BatchRunner:
+    def __init__(self, args):
+        self.args = args
+        weights = args.weights or os.environ.get("YOLO_WEIGHTS") or find_latest_weights() or ROOT / "lastest.pt"
+        from ultralytics import YOLO
+        self.model = stages.ModelHandle(weights, YOLO(str(weights)))
+        self.max_side = args.imgsz or self.model.input_size
+        print(f"Model: {weights} (frames decoded at <= {self.max_side}px)")
+        self.pipeline = pipeline.Pipeline("batch", [
+            pipeline.Stage("decode", decode_chunk, ("chunk", "max_side"), ("frames", "refs", "failed", "decode_seconds"),
+                           executor="process", workers=args.decode_workers, queue_size=args.decode_workers * 2,
+                           process_safe=True),
+            pipeline.Stage("predict", self._predict, ("frames",), ("predictions", "predict_seconds"),
+                           executor="thread", workers=1, queue_size=args.decode_workers * 2),
+        ], provided=("chunk", "max_side"), submit_timeout=None)
+
+    def _predict(self, frames):
+        started = time.perf_counter()
+        predictions = []
+        for i in range(0, len(frames), self.args.batch):
+            predictions.extend(stages.predict_batch(
+                self.model, frames[i:i + self.args.batch], self.args.conf, self.args.iou, self.args.max_det,
+            ))
+        return {"predictions": predictions, "predict_seconds": time.perf_counter() - started}
+
+    def rows_for(self, source: Path, chunk: tuple, refs: list, predictions: list, fps: float) -> list:
+        """Server-format detection rows; frame_count is the 1-based frame number within the input."""
+        rows = []
+        for ref, prediction in zip(refs, predictions):
+            label, conf, _ = prediction.best()
+            if label is None or conf < self.args.conf:
+                if not self.args.log_empty:
+                    continue
+                label, conf = "none", 0.0
+            if chunk[0] == "images":
+                frame_path = chunk[2][ref - chunk[1]]
+                timestamp = os.path.getmtime(frame_path)
+            else:
+                frame_path = f"{source}#{ref}"
+                timestamp = os.path.getmtime(source) + (ref / fps if fps else 0.0)
+            rows.append({
+                "frame_count": ref + 1,
+                "timestamp": datetime.fromtimestamp(timestamp).isoformat(),
+                "label": label,
+                "confidence": conf,
+                "frame_path": frame_path,
+            })
+        return rows
+
+    def process(self, source: Path, out_dir: Path) -> dict:
+        out_dir.mkdir(parents=True, exist_ok=True)
+        summary_path = out_dir / "summary.json"
+        if summary_path.exists() and not self.args.force:
+            print(f"{source}: already done, skipping (--force to redo)")
+            with open(summary_path, encoding="utf-8") as f:
+                return dict(json.load(f), skipped=True)
+
+        chunks = plan_chunks(source, self.args.chunk)
+        fps = 0.0
+        if source.is_file():
+            import cv2
+            cap = cv2.VideoCapture(str(source))
+            fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+            cap.release()
+
+        # Checkpoint: one JSON line per finished chunk; a resumed run skips those chunks
+        checkpoint = out_dir / "checkpoint.jsonl"
+        done: dict[int, dict] = {}
+        if checkpoint.exists() and not self.args.force:
+            with open(checkpoint, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break  # torn last line from an interrupted run
+                    done[entry["chunk"]] = entry
+            if done:
+                print(f"{source}: resuming, {len(done)}/{len(chunks)} chunks already processed")
+        # Rewrite without any torn tail so new entries append after valid ones
+        with open(checkpoint, "w", encoding="utf-8") as f:
+            for entry in done.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        started = time.perf_counter()
+        totals = {"frames": 0, "failed": 0, "decode_seconds": 0.0, "predict_seconds": 0.0}
+        pending = deque()
+        window = max(2, self.args.decode_workers * 2)
+        with open(checkpoint, "a", encoding="utf-8") as ckpt:
+            def finish(index, future):
+                ctx = future.result()
+                entry = {
+                    "chunk": index,
+                    "rows": self.rows_for(source, chunks[index], ctx["refs"], ctx["predictions"], fps),
+                    "frames": len(ctx["refs"]),
+                    "failed": ctx["failed"],
+                    "decode_seconds": ctx["decode_seconds"],
+                    "predict_seconds": ctx["predict_seconds"],
+                }
+                ckpt.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                ckpt.flush()
+                done[index] = entry
+                for key in totals:
+                    totals[key] += entry[key]
+
+            for index, chunk in enumerate(chunks):
+                if index in done:
+                    continue
+                pending.append((index, self.pipeline.submit({"chunk": chunk, "max_side": self.max_side})))
+                # Bound decoded frames held in memory to a few chunks per worker
+                while len(pending) >= window:
+                    finish(*pending.popleft())
+            while pending:
+                finish(*pending.popleft())
+        elapsed = time.perf_counter() - started
+        if source.is_file():
+            check_continuous(source, chunks, done)
+
+        rows = [row for index in sorted(done) for row in done[index]["rows"]]
+        compacted = stages.compact_ranges(rows)
+        write_rows(out_dir / "detections.json", rows)
+        write_rows(out_dir / "compactedLog.json", compacted)
+        write_rows(out_dir / "CorrectedLog.json", stages.correct_words(compacted))
+
+        frames_total = sum(entry["frames"] for entry in done.values())
+        summary = {
+            "input": str(source),
+            "frames": frames_total,
+            "frames_this_run": totals["frames"],
+            "failed": sum(entry["failed"] for entry in done.values()),
+            "detections": len(rows),
+            "seconds": round(elapsed, 3),
+            "fps": round(totals["frames"] / elapsed, 2) if elapsed > 0 else None,
+            "decode_seconds": round(totals["decode_seconds"], 3),
+            "predict_seconds": round(totals["predict_seconds"], 3),
+        }
+        with open(summary_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+            f.write("\n")
+        print(f"{source}: {summary['frames']} frames, {summary['detections']} detections, "
+              f"{summary['fps']} frames/s this run")
+        return summary
+
+
+def collect_inputs(paths: list) -> list:
+    inputs = []
+    for raw in paths:
+        path = Path(raw)
+        if path.suffix.lower() == ".txt" and path.is_file():
+            # A list file: one input path per line
+            inputs.extend(Path(line.strip()) for line in path.read_text().splitlines() if line.strip())
+        elif path.is_dir() or path.suffix.lower() in VIDEO_SUFFIXES:
+            inputs.append(path)
+        else:
+            print(f"WARNING: skipping {path}: not a frame directory, video or .txt list")
+    return inputs
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Batch ASL detection over frame folders and video files")
+    ap.add_argument("inputs", nargs="+", help="frame directories, video files, or .txt files listing them")
+    ap.add_argument("--out", default="batch-out", help="output directory")
+    ap.add_argument("--weights", default=None, help="path to trained weights")
+    ap.add_argument("--imgsz", type=int, default=0, help="decode size (default: the model input size)")
+    ap.add_argument("--conf", type=float, default=0.4, help="confidence threshold")
+    ap.add_argument("--iou", type=float, default=0.5, help="NMS IoU threshold")
+    ap.add_argument("--max-det", type=int, default=1, help="max detections per frame")
+    ap.add_argument("--log-empty", action="store_true", help="write a 'none' row for frames without a detection")
+    ap.add_argument("--decode-workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="decode processes")
+    ap.add_argument("--batch", type=int, default=16, help="frames per inference call")
+    ap.add_argument("--chunk", type=int, default=64, help="frames per decode task / checkpoint")
+    ap.add_argument("--force", action="store_true", help="ignore checkpoints and finished outputs")
+    args = ap.parse_args()
+
+    inputs = collect_inputs(args.inputs)
+    if not inputs:
+        print("No inputs to process.")
+        sys.exit(2)
+    out = Path(args.out)
+    runner = BatchRunner(args)
+
+    started = time.perf_counter()
+    summaries = []
+    used = set()
+    for source in inputs:
+        name = source.stem if source.is_file() else source.name
+        # Keep per-input output directories distinct when names collide
+        suffix = 1
+        while name in used:
+            suffix += 1
+            name = f"{source.stem if source.is_file() else source.name}-{suffix}"
+        used.add(name)
+        try:
+            summaries.append(runner.process(source, out / name))
+        except Exception as e:
+            print(f"ERROR: {source}: {e}")
+            summaries.append({"input": str(source), "error": str(e)})
+    elapsed = time.perf_counter() - started
+
+    processed = sum(s.get("frames_this_run", 0) for s in summaries if not s.get("skipped"))
+    report = {
+        "inputs": summaries,
+        "frames": sum(s.get("frames", 0) for s in summaries),
+        "frames_this_run": processed,
+        "seconds": round(elapsed, 3),
+        "fps": round(processed / elapsed, 2) if elapsed > 0 else None,
+        "decode_workers": args.decode_workers,
+        "batch": args.batch,
+    }
+    out.mkdir(parents=True, exist_ok=True)
+    with open(out / "report.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+    print(f"Done: {processed} frames in {elapsed:.1f}s ({report['fps']} frames/s) -> {out / 'report.json'}")
+    sys.exit(1 if any("error" in s for s in summaries) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
 // Detection utilities for client-side logs, compaction, and correction
 // Stores logs locally to replace server endpoints (except vision processing)
+// Works on detections held in localStorage (e.g. demo files), which the servers never see, so it
+// keeps a browser copy of python/stages.py compact_ranges/correct_words and decoder.match_word;
+// python/tests/test_detection_utils.py checks that both give the same logs.
+// For the server's own buffer use GET /logs/compacted and /logs/corrected instead.
 
 (() => {
     const DETECTIONS_KEY = 'detectionsLog';
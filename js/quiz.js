@@ -15,6 +15,7 @@ class QuizManager {
         this.checkboxGrid = document.getElementById('checkboxGrid');
         this.status = document.getElementById('status');
         this.backendBaseUrl = this.getBackendBaseUrl();
+        this.sessionId = this.getSessionId();
         
         this.isQuizActive = false;
         this.selectedCharacters = [];
@@ -30,6 +31,11 @@ class QuizManager {
         // Request throttling to prevent memory buildup
         this.pendingFrameUploads = 0;
         this.maxPendingFrames = 3; // Only allow 3 concurrent frame uploads
+        // Set from Retry-After when the server sheds load (429/503)
+        this.uploadsPausedUntil = 0;
+        // Overridden by the server's /capabilities
+        this.captureSettings = { maxSide: 0, jpegQuality: 0.6, intervalMs: 33 };
+        this.loadCaptureSettings();
         
         this.initCheckboxes();
         this.initEventListeners();
@@ -152,6 +158,19 @@ class QuizManager {
         return 'http://localhost:5000';
     }
     
+    getSessionId() {
+        // One session per tab (sessionStorage survives reloads, not new tabs): the server's
+        // admission limits, frame stride and router placement are all per session
+        let id = window.sessionStorage.getItem('captureSessionId');
+        if (!id) {
+            id = (window.crypto && crypto.randomUUID)
+                ? crypto.randomUUID()
+                : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+            window.sessionStorage.setItem('captureSessionId', id);
+        }
+        return id;
+    }
+    
     initEventListeners() {
         this.startBtn.addEventListener('click', (e) => {
             e.preventDefault();
@@ -379,13 +398,13 @@ class QuizManager {
                     this.frameCount++;
                 }
                 
-                setTimeout(captureLoop, 33); // ~30fps
+                setTimeout(captureLoop, this.captureSettings.intervalMs); // server max_fps (default ~30fps)
             } catch (err) {
                 console.error('❌ Frame capture loop error (attempt', captureAttempts, '):', err);
                 console.error('Stack:', err.stack);
                 // Continue capture even if there's an error
                 if (this.isQuizActive) {
-                    setTimeout(captureLoop, 33);
+                    setTimeout(captureLoop, this.captureSettings.intervalMs);
                 }
             }
         };
@@ -394,6 +413,34 @@ class QuizManager {
         captureLoop();
     }
     
+    async loadCaptureSettings() {
+        // Ask the server which frame size/quality/rate it wants so no discarded pixels are uploaded
+        try {
+            const response = await fetch(`${this.backendBaseUrl}/capabilities`, {
+                headers: { 'X-Session-Id': this.sessionId },
+                signal: AbortSignal.timeout(3000)
+            });
+            if (!response.ok) return;
+            const caps = await response.json();
+            if (caps.input_size > 0) this.captureSettings.maxSide = caps.input_size;
+            if (caps.jpeg_quality > 0) this.captureSettings.jpegQuality = Math.min(1, caps.jpeg_quality / 100);
+            if (caps.max_fps > 0) this.captureSettings.intervalMs = Math.max(1, Math.round(1000 / caps.max_fps));
+            console.log('📐 Capture settings from server:', this.captureSettings);
+        } catch (err) {
+            console.warn('Capture settings unavailable, using defaults:', err.message);
+        }
+    }
+
+    sizeCanvasToVideo() {
+        // Scale the long side down to the model input size; never upscale
+        const width = this.videoElement.videoWidth;
+        const height = this.videoElement.videoHeight;
+        const maxSide = this.captureSettings.maxSide;
+        const scale = maxSide > 0 && width > 0 && height > 0 ? Math.min(1, maxSide / Math.max(width, height)) : 1;
+        this.canvas.width = Math.round(width * scale);
+        this.canvas.height = Math.round(height * scale);
+    }
+
     captureFrameToServer() {
         try {
             if (!this.videoElement.srcObject) {
@@ -401,8 +448,7 @@ class QuizManager {
                 return;
             }
             
-            this.canvas.width = this.videoElement.videoWidth;
-            this.canvas.height = this.videoElement.videoHeight;
+            this.sizeCanvasToVideo();
             
             if (this.canvas.width === 0 || this.canvas.height === 0) {
                 // Video stream not ready yet
@@ -410,7 +456,7 @@ class QuizManager {
                 return;
             }
             
-            this.canvasContext.drawImage(this.videoElement, 0, 0);
+            this.canvasContext.drawImage(this.videoElement, 0, 0, this.canvas.width, this.canvas.height);
             
             this.canvas.toBlob((blob) => {
                 try {
@@ -432,7 +478,7 @@ class QuizManager {
                 } catch (err) {
                     console.error('Error in toBlob callback:', err);
                 }
-            }, 'image/jpeg', 0.6); // Reduced quality from 0.8 to 0.6 to reduce blob size
+            }, 'image/jpeg', this.captureSettings.jpegQuality);
             
             // Clear canvas to prevent memory buildup
             this.canvasContext.clearRect(0, 0, this.canvas.width, this.canvas.height);
@@ -448,6 +494,11 @@ class QuizManager {
             return;
         }
         
+        // Back off while the server is shedding load; live frames are dropped, not queued
+        if (Date.now() < this.uploadsPausedUntil) {
+            return;
+        }
+        
         // Throttle requests if too many are pending
         if (this.pendingFrameUploads >= this.maxPendingFrames) {
             console.warn(`Too many pending frames (${this.pendingFrameUploads}), skipping upload`);
@@ -464,11 +515,16 @@ class QuizManager {
             
             const response = await fetch(`${this.backendBaseUrl}/send-frame`, {
                 method: 'POST',
+                headers: { 'X-Session-Id': this.sessionId },
                 body: formData,
                 signal: AbortSignal.timeout(5000) // 5 second timeout
             });
             
-            if (!response.ok) {
+            if (response.status === 429 || response.status === 503) {
+                const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 1;
+                this.uploadsPausedUntil = Date.now() + retryAfter * 1000;
+                console.warn(`⚠️ Server busy (${response.status}), pausing uploads for ${retryAfter}s`);
+            } else if (!response.ok) {
                 console.warn('⚠️ Frame upload returned status:', response.status);
                 this.storeFrameLocally(blob);
             } else {
@@ -29,6 +29,12 @@ class VideoCaptureManager {
         this.lastFrameAt = 0;
         this.logPoller = null;
         this.backendBaseUrl = this.getBackendBaseUrl();
+        this.sessionId = this.getSessionId();
+        // Overridden by the server's /capabilities
+        this.captureSettings = { maxSide: 0, jpegQuality: 0.8, intervalMs: 33 };
+        this.loadCaptureSettings();
+        // Set from Retry-After when the server sheds load (429/503)
+        this.uploadsPausedUntil = 0;
 
         this.initEventListeners();
         this.startLogPolling();
@@ -85,6 +91,19 @@ class VideoCaptureManager {
         return 'http://localhost:5000';
     }
 
+    getSessionId() {
+        // One session per tab (sessionStorage survives reloads, not new tabs): the server's
+        // admission limits, frame stride and router placement are all per session
+        let id = window.sessionStorage.getItem('captureSessionId');
+        if (!id) {
+            id = (window.crypto && crypto.randomUUID)
+                ? crypto.randomUUID()
+                : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+            window.sessionStorage.setItem('captureSessionId', id);
+        }
+        return id;
+    }
+
     startLogPolling() {
         if (this.logPoller) return;
         const poll = async () => {
@@ -294,12 +313,12 @@ class VideoCaptureManager {
                 this.frameCount++;
                 this.updateStatus(`Recording... ${this.frameCount}/${this.maxFrames} frames captured. Textbox 1: ${this.textbox1.value.substring(0, 20)}...`, 'recording');
                 
-                setTimeout(captureLoop, 33); // ~30fps
+                setTimeout(captureLoop, this.captureSettings.intervalMs); // server max_fps (default ~30fps)
             } catch (err) {
                 console.error('Frame capture loop error:', err);
                 // Continue capture even if there's an error
                 if (this.isRecording) {
-                    setTimeout(captureLoop, 33);
+                    setTimeout(captureLoop, this.captureSettings.intervalMs);
                 }
             }
         };
@@ -307,6 +326,34 @@ class VideoCaptureManager {
         captureLoop();
     }
     
+    async loadCaptureSettings() {
+        // Ask the server which frame size/quality/rate it wants so no discarded pixels are uploaded
+        try {
+            const response = await fetch(`${this.backendBaseUrl}/capabilities`, {
+                headers: { 'X-Session-Id': this.sessionId },
+                signal: AbortSignal.timeout(3000)
+            });
+            if (!response.ok) return;
+            const caps = await response.json();
+            if (caps.input_size > 0) this.captureSettings.maxSide = caps.input_size;
+            if (caps.jpeg_quality > 0) this.captureSettings.jpegQuality = Math.min(1, caps.jpeg_quality / 100);
+            if (caps.max_fps > 0) this.captureSettings.intervalMs = Math.max(1, Math.round(1000 / caps.max_fps));
+            console.log('📐 Capture settings from server:', this.captureSettings);
+        } catch (err) {
+            console.warn('Capture settings unavailable, using defaults:', err.message);
+        }
+    }
+
+    sizeCanvasToVideo() {
+        // Scale the long side down to the model input size; never upscale
+        const width = this.videoElement.videoWidth;
+        const height = this.videoElement.videoHeight;
+        const maxSide = this.captureSettings.maxSide;
+        const scale = maxSide > 0 && width > 0 && height > 0 ? Math.min(1, maxSide / Math.max(width, height)) : 1;
+        this.canvas.width = Math.round(width * scale);
+        this.canvas.height = Math.round(height * scale);
+    }
+
     captureFrame() {
         if (!this.videoElement.srcObject) {
             this.updateStatus('No video stream active. Start recording first.', 'error');
@@ -314,9 +361,8 @@ class VideoCaptureManager {
         }
         
         try {
-            this.canvas.width = this.videoElement.videoWidth;
-            this.canvas.height = this.videoElement.videoHeight;
-            this.canvasContext.drawImage(this.videoElement, 0, 0);
+            this.sizeCanvasToVideo();
+            this.canvasContext.drawImage(this.videoElement, 0, 0, this.canvas.width, this.canvas.height);
             this.lastFrameAt = Date.now();
             
             this.canvas.toBlob((blob) => {
@@ -335,22 +381,21 @@ class VideoCaptureManager {
         if (!this.videoElement.srcObject) return;
         
         try {
-            this.canvas.width = this.videoElement.videoWidth;
-            this.canvas.height = this.videoElement.videoHeight;
+            this.sizeCanvasToVideo();
             
             if (this.canvas.width === 0 || this.canvas.height === 0) {
                 // Video stream not ready yet
                 return;
             }
             
-            this.canvasContext.drawImage(this.videoElement, 0, 0);
+            this.canvasContext.drawImage(this.videoElement, 0, 0, this.canvas.width, this.canvas.height);
             this.lastFrameAt = Date.now();
             
             this.canvas.toBlob((blob) => {
                 if (blob && this.isRecording) {
                     this.sendFrameToServer(blob);
                 }
-            }, 'image/jpeg', 0.8);
+            }, 'image/jpeg', this.captureSettings.jpegQuality);
         } catch (err) {
             console.error('Error capturing frame:', err);
         }
@@ -358,6 +403,8 @@ class VideoCaptureManager {
     
     async sendFrameToServer(blob) {
         if (!blob || blob.size === 0) return;
+        // Back off while the server is shedding load; live frames are dropped, not queued
+        if (Date.now() < this.uploadsPausedUntil) return;
         
         try {
             const formData = new FormData();
@@ -365,9 +412,13 @@ class VideoCaptureManager {
             
             fetch(`${this.backendBaseUrl}/send-frame`, {
                 method: 'POST',
+                headers: { 'X-Session-Id': this.sessionId },
                 body: formData
             }).then(response => {
-                if (!response.ok) {
+                if (response.status === 429 || response.status === 503) {
+                    const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 1;
+                    this.uploadsPausedUntil = Date.now() + retryAfter * 1000;
+                } else if (!response.ok) {
                     console.warn('Frame upload returned status:', response.status);
                 }
             }).catch(err => {
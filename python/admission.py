@@ -0,0 +1,228 @@
+"""
+Admission control for the inference endpoints.
+
+Without it every request runs the model inline, so under overload all
+sessions slow down together until clients time out and retry. An
+``AdmissionController`` sits in front of an endpoint's pipeline instead:
+
+    concurrency   at most ``max_concurrency`` requests run at once; the
+                  rest wait in per-session queues
+    per session   a session with ``session_limit`` requests running or
+                  waiting gets 429 (it is sending faster than it is served)
+    latency       the expected wait (queue length x smoothed service time)
+                  is checked on arrival; over ``latency_budget`` the
+                  request is shed at once with 503 rather than queued
+    fairness      a freed slot goes to the waiting session with the fewest
+                  running requests, round-robin among equals, so one busy
+                  tab cannot starve the others
+
+Rejections raise ``Rejected`` carrying the status and a ``Retry-After``
+in whole seconds. Outcomes are counted in ``admission_requests_total``.
+
+Configuration (environment, per endpoint with a fallback, e.g.
+ADMIT_SEND_FRAME_MAX_CONCURRENCY then ADMIT_MAX_CONCURRENCY):
+    ADMIT_ENABLE                 0 to disable admission control (default 1)
+    ADMIT_MAX_CONCURRENCY        requests running at once (default 2)
+    ADMIT_SESSION_LIMIT          running + waiting requests per session (default 4)
+    ADMIT_LATENCY_BUDGET_MS      longest expected wait before shedding (default 500)
+    ADMIT_MAX_QUEUE              waiting requests across sessions (default 64)
+"""
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+
+import metrics
+
+ADMISSION_REQUESTS = metrics.counter(
+    'admission_requests_total', 'Admission decisions, by endpoint and outcome.', ('endpoint', 'outcome'),
+)
+ADMISSION_RUNNING = metrics.gauge('admission_running', 'Admitted requests currently running.', ('endpoint',))
+ADMISSION_WAITING = metrics.gauge('admission_waiting', 'Requests waiting for a slot.', ('endpoint',))
+ADMISSION_WAIT = metrics.histogram(
+    'admission_wait_seconds', 'Time admitted requests spent waiting for a slot.', ('endpoint',),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+OUTCOMES = ('admitted', 'shed_session', 'shed_latency', 'shed_queue', 'timeout')
+
+
+class Rejected(Exception):
+    def __init__(self, status: int, retry_after: int, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class _Waiter:
+    __slots__ = ('session', 'granted', 'queued_at')
+
+    def __init__(self, session: str):
+        self.session = session
+        self.granted = False
+        self.queued_at = time.perf_counter()
+
+
+class _Slot:
+    def __init__(self, controller: 'AdmissionController', session: str):
+        self._controller = controller
+        self._session = session
+        self._started = time.perf_counter()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._controller._release(self._session, time.perf_counter() - self._started)
+        return False
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int = 2,
+        session_limit: int = 4,
+        latency_budget: float = 0.5,
+        max_queue: int = 64,
+        service_time: float = 0.05,
+    ):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.session_limit = max(1, session_limit)
+        self.latency_budget = latency_budget
+        self.max_queue = max(0, max_queue)
+        self.service_time = service_time      # EWMA of slot hold time, seeds the first estimates
+        self._running = 0
+        self._running_by: Counter = Counter()
+        self._waiting: OrderedDict[str, deque] = OrderedDict()
+        self._queued = 0
+        self._cond = threading.Condition()
+
+    @property
+    def waiting(self) -> int:
+        return self._queued
+
+    # ----- decisions -----
+
+    def expected_wait(self) -> float:
+        """Seconds a request arriving now would wait for a slot."""
+        if self._running < self.max_concurrency and not self._queued:
+            return 0.0
+        return (self._queued + 1) / self.max_concurrency * self.service_time
+
+    def _reject(self, outcome: str, status: int, retry_after: float, reason: str):
+        ADMISSION_REQUESTS.inc(endpoint=self.name, outcome=outcome)
+        raise Rejected(status, max(1, math.ceil(retry_after)), reason)
+
+    def admit(self, session: str = 'default') -> _Slot:
+        """Block until a slot is free (within the latency budget) or raise ``Rejected``."""
+        with self._cond:
+            held = self._running_by[session] + len(self._waiting.get(session, ()))
+            if held >= self.session_limit:
+                self._reject('shed_session', 429, self.service_time * held,
+                             f'session {session!r} has {held} requests in flight')
+            wait = self.expected_wait()
+            if wait == 0.0:
+                self._start(session)
+                ADMISSION_REQUESTS.inc(endpoint=self.name, outcome='admitted')
+                ADMISSION_WAIT.observe(0.0, endpoint=self.name)
+                return _Slot(self, session)
+            if wait > self.latency_budget:
+                self._reject('shed_latency', 503, wait - self.latency_budget,
+                             f'expected wait {wait * 1000:.0f}ms exceeds the {self.latency_budget * 1000:.0f}ms budget')
+            if self._queued >= self.max_queue:
+                self._reject('shed_queue', 503, wait, 'admission queue full')
+
+            waiter = _Waiter(session)
+            self._waiting.setdefault(session, deque()).append(waiter)
+            self._queued += 1
+            ADMISSION_WAITING.set(self._queued, endpoint=self.name)
+            deadline = time.monotonic() + self.latency_budget
+            while not waiter.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if not waiter.granted:
+                self._waiting[session].remove(waiter)
+                if not self._waiting[session]:
+                    del self._waiting[session]
+                self._queued -= 1
+                ADMISSION_WAITING.set(self._queued, endpoint=self.name)
+                self._reject('timeout', 503, self.expected_wait(), 'timed out waiting for an inference slot')
+            ADMISSION_REQUESTS.inc(endpoint=self.name, outcome='admitted')
+            ADMISSION_WAIT.observe(time.perf_counter() - waiter.queued_at, endpoint=self.name)
+            return _Slot(self, session)
+
+    # ----- slots -----
+
+    def _start(self, session: str):
+        self._running += 1
+        self._running_by[session] += 1
+        ADMISSION_RUNNING.set(self._running, endpoint=self.name)
+
+    def _release(self, session: str, held: float):
+        with self._cond:
+            self._running -= 1
+            self._running_by[session] -= 1
+            if self._running_by[session] <= 0:
+                del self._running_by[session]
+            self.service_time = 0.8 * self.service_time + 0.2 * held
+            self._dispatch()
+            ADMISSION_RUNNING.set(self._running, endpoint=self.name)
+
+    def _dispatch(self):
+        # Fair share: the waiting session with the fewest running requests goes first;
+        # OrderedDict order (moved to the end when served) breaks ties round-robin
+        granted = False
+        while self._running < self.max_concurrency and self._waiting:
+            session = min(self._waiting, key=lambda s: self._running_by[s])
+            queue = self._waiting[session]
+            waiter = queue.popleft()
+            if queue:
+                self._waiting.move_to_end(session)
+            else:
+                del self._waiting[session]
+            self._queued -= 1
+            waiter.granted = True
+            self._start(session)
+            granted = True
+        if granted:
+            ADMISSION_WAITING.set(self._queued, endpoint=self.name)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'running': self._running,
+                'waiting': self._queued,
+                'waiting_sessions': {s: len(q) for s, q in self._waiting.items()},
+                'max_concurrency': self.max_concurrency,
+                'session_limit': self.session_limit,
+                'latency_budget_ms': round(self.latency_budget * 1000),
+                'service_time_ms': round(self.service_time * 1000, 1),
+                'expected_wait_ms': round(self.expected_wait() * 1000, 1),
+                'outcomes': {o: int(ADMISSION_REQUESTS.value(endpoint=self.name, outcome=o)) for o in OUTCOMES},
+            }
+
+
+def _env(name: str, key: str, default: str) -> str:
+    prefix = name.upper().replace('-', '_')
+    return os.environ.get(f'ADMIT_{prefix}_{key}', os.environ.get(f'ADMIT_{key}', default))
+
+
+def controller_from_env(name: str) -> AdmissionController | None:
+    if _env(name, 'ENABLE', '1') != '1':
+        return None
+    return AdmissionController(
+        name,
+        max_concurrency=int(_env(name, 'MAX_CONCURRENCY', '2')),
+        session_limit=int(_env(name, 'SESSION_LIMIT', '4')),
+        latency_budget=float(_env(name, 'LATENCY_BUDGET_MS', '500')) / 1000.0,
+        max_queue=int(_env(name, 'MAX_QUEUE', '64')),
+    )
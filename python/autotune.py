@@ -0,0 +1,216 @@
+"""
+Latency-driven auto-tuning of inference resolution and frame stride.
+
+Inference runs at a fixed ``imgsz`` on every frame, so a saturated box
+just gets slower. An ``AutoTuner`` watches the recent inference latency
+(p95 of the frames inferred since its last decision) and the admission
+backlog, and moves one step along a ladder of settings, cheapest last:
+
+    imgsz_max, imgsz_max - step, ..., imgsz_min        every frame inferred
+    imgsz_min with stride 2, 3, ..., stride_max        every Nth frame per session
+
+It steps down when p95 exceeds the target or the backlog is over its
+limit, and back up once p95 is under ``headroom x target`` with nothing
+queued. Decisions are at least ``interval`` seconds and MIN_SAMPLES
+frames apart, and each looks only at frames inferred since the previous
+one. Every adjustment is printed, kept in ``stats()['adjustments']``
+and optionally appended to a JSONL file, so the accuracy/latency
+trade-off made at any time is visible afterwards.
+
+Configuration (environment):
+    AUTOTUNE_TARGET_MS      p95 inference latency to hold; unset disables tuning
+    AUTOTUNE_IMGSZ_MIN      smallest inference size (default 320)
+    AUTOTUNE_IMGSZ_MAX      largest inference size (default: the model's imgsz, followed across reloads)
+    AUTOTUNE_IMGSZ_STEP     size change per step, a multiple of 32 (default 64)
+    AUTOTUNE_STRIDE_MAX     infer at least every Nth frame per session (default 3)
+    AUTOTUNE_INTERVAL_S     seconds between decisions (default 2)
+    AUTOTUNE_HEADROOM       step up below this fraction of the target (default 0.6)
+    AUTOTUNE_MAX_BACKLOG    queued requests that force a step down (default 2)
+    AUTOTUNE_LOG            JSONL file for adjustments (default: not written)
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+import metrics
+
+AUTOTUNE_IMGSZ = metrics.gauge('autotune_imgsz', 'Current inference image size.', ('endpoint',))
+AUTOTUNE_STRIDE = metrics.gauge('autotune_stride', 'Current frame stride (1 = every frame).', ('endpoint',))
+AUTOTUNE_ADJUSTMENTS = metrics.counter(
+    'autotune_adjustments_total', 'Auto-tuner steps, by direction (down = cheaper).', ('endpoint', 'direction'),
+)
+AUTOTUNE_SKIPPED = metrics.counter('autotune_skipped_frames_total', 'Frames not inferred because of the stride.', ('endpoint',))
+
+MIN_SAMPLES = 5
+# Frame counters kept for this many recently seen sessions (session ids come from clients)
+MAX_SESSIONS = 1024
+
+
+def ladder(imgsz_max: int, imgsz_min: int, step: int, stride_max: int) -> list[tuple[int, int]]:
+    """``(imgsz, stride)`` settings from most to least expensive."""
+    step = max(32, step // 32 * 32)
+    imgsz_max = max(32, imgsz_max // 32 * 32)
+    imgsz_min = min(imgsz_max, max(32, imgsz_min // 32 * 32))
+    sizes = list(range(imgsz_max, imgsz_min, -step)) + [imgsz_min]
+    return [(size, 1) for size in sizes] + [(imgsz_min, stride) for stride in range(2, stride_max + 1)]
+
+
+class AutoTuner:
+    def __init__(
+        self,
+        name: str,
+        target: float,
+        imgsz_max: int,
+        imgsz_min: int = 320,
+        imgsz_step: int = 64,
+        stride_max: int = 3,
+        interval: float = 2.0,
+        headroom: float = 0.6,
+        max_backlog: int = 2,
+        backlog_fn=None,
+        log_path: str | None = None,
+    ):
+        self.name = name
+        self.target = target
+        self.interval = interval
+        self.headroom = headroom
+        self.max_backlog = max_backlog
+        self.backlog_fn = backlog_fn
+        self.log_path = log_path
+        self.imgsz_min = imgsz_min
+        self.imgsz_step = imgsz_step
+        self.stride_max = stride_max
+        self.ladder = ladder(imgsz_max, imgsz_min, imgsz_step, stride_max)
+        self.level = 0
+        self._samples: list[float] = []      # inference seconds since the last decision
+        self._last_p95: float | None = None
+        self._counts: OrderedDict[str, int] = OrderedDict()
+        self._adjustments: deque[dict] = deque(maxlen=50)
+        self._last_eval = time.monotonic()
+        self._lock = threading.Lock()
+        self._publish()
+
+    @property
+    def imgsz(self) -> int:
+        return self.ladder[self.level][0]
+
+    @property
+    def stride(self) -> int:
+        return self.ladder[self.level][1]
+
+    def set_imgsz_max(self, imgsz_max: int):
+        """Rebuild the ladder for a new model input size, keeping the current step (clamped)."""
+        with self._lock:
+            self.ladder = ladder(imgsz_max, self.imgsz_min, self.imgsz_step, self.stride_max)
+            self.level = min(self.level, len(self.ladder) - 1)
+            self._samples = []
+            self._publish()
+
+    def should_infer(self, session: str) -> bool:
+        """False for the frames a session skips at the current stride."""
+        with self._lock:
+            stride = self.stride
+            count = self._counts.pop(session, 0)
+            self._counts[session] = count + 1
+            if len(self._counts) > MAX_SESSIONS:
+                self._counts.popitem(last=False)
+        if stride > 1 and count % stride:
+            AUTOTUNE_SKIPPED.inc(endpoint=self.name)
+            return False
+        return True
+
+    def observe(self, seconds: float, frames: int = 1):
+        """Record the inference latency of ``frames`` frames; may adjust the settings."""
+        now = time.monotonic()
+        with self._lock:
+            self._samples.extend([seconds] * frames)
+            if now - self._last_eval < self.interval or len(self._samples) < MIN_SAMPLES:
+                return
+            ordered = sorted(self._samples)
+            self._samples = []
+            self._last_eval = now
+            self._last_p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            self._evaluate(self._last_p95)
+
+    def _evaluate(self, p95: float):
+        backlog = self.backlog_fn() if self.backlog_fn is not None else 0
+        if p95 > self.target or backlog > self.max_backlog:
+            if self.level == len(self.ladder) - 1:
+                return
+            reason = (f'p95 {p95 * 1000:.0f}ms > target {self.target * 1000:.0f}ms' if p95 > self.target
+                      else f'backlog {backlog} > {self.max_backlog}')
+            self._adjust(self.level + 1, 'down', reason, p95, backlog)
+        elif p95 < self.target * self.headroom and backlog == 0 and self.level > 0:
+            reason = f'p95 {p95 * 1000:.0f}ms < {self.headroom:.0%} of target {self.target * 1000:.0f}ms'
+            self._adjust(self.level - 1, 'up', reason, p95, backlog)
+
+    def _adjust(self, level: int, direction: str, reason: str, p95: float, backlog: int):
+        before = self.ladder[self.level]
+        self.level = level
+        after = self.ladder[level]
+        record = {
+            'time': datetime.now().isoformat(),
+            'direction': direction,
+            'reason': reason,
+            'p95_ms': round(p95 * 1000, 1),
+            'backlog': backlog,
+            'from': {'imgsz': before[0], 'stride': before[1]},
+            'to': {'imgsz': after[0], 'stride': after[1]},
+        }
+        self._adjustments.append(record)
+        AUTOTUNE_ADJUSTMENTS.inc(endpoint=self.name, direction=direction)
+        self._publish()
+        print(f"AUTOTUNE {self.name}: imgsz {before[0]}->{after[0]}, stride {before[1]}->{after[1]} ({reason})")
+        if self.log_path:
+            try:
+                with open(self.log_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({'endpoint': self.name, **record}) + '\n')
+            except OSError as e:
+                print(f"WARNING: could not append to AUTOTUNE_LOG: {e}")
+
+    def _publish(self):
+        AUTOTUNE_IMGSZ.set(self.imgsz, endpoint=self.name)
+        AUTOTUNE_STRIDE.set(self.stride, endpoint=self.name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'imgsz': self.imgsz,
+                'stride': self.stride,
+                'level': self.level,
+                'levels': len(self.ladder),
+                'target_ms': round(self.target * 1000),
+                'last_p95_ms': round(self._last_p95 * 1000, 1) if self._last_p95 is not None else None,
+                'adjustments': list(self._adjustments)[-10:],
+            }
+
+
+def tuner_from_env(name: str, input_size: int, backlog_fn=None) -> AutoTuner | None:
+    target = os.environ.get('AUTOTUNE_TARGET_MS', '')
+    if not target or not input_size:
+        return None
+    return AutoTuner(
+        name,
+        target=float(target) / 1000.0,
+        imgsz_max=int(os.environ.get('AUTOTUNE_IMGSZ_MAX', '0')) or input_size,
+        imgsz_min=int(os.environ.get('AUTOTUNE_IMGSZ_MIN', '320')),
+        imgsz_step=int(os.environ.get('AUTOTUNE_IMGSZ_STEP', '64')),
+        stride_max=int(os.environ.get('AUTOTUNE_STRIDE_MAX', '3')),
+        interval=float(os.environ.get('AUTOTUNE_INTERVAL_S', '2')),
+        headroom=float(os.environ.get('AUTOTUNE_HEADROOM', '0.6')),
+        max_backlog=int(os.environ.get('AUTOTUNE_MAX_BACKLOG', '2')),
+        backlog_fn=backlog_fn,
+        log_path=os.environ.get('AUTOTUNE_LOG') or None,
+    )
+
+
+def follow_model(tuner: AutoTuner | None, input_size: int):
+    """After a model swap: rebuild the ladder for its input size unless AUTOTUNE_IMGSZ_MAX pins it."""
+    if tuner is None or not input_size or int(os.environ.get('AUTOTUNE_IMGSZ_MAX', '0')):
+        return
+    tuner.set_imgsz_max(input_size)
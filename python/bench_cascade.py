@@ -0,0 +1,128 @@
+"""
+Benchmark: full model alone vs the fast/full model cascade.
+
+Decodes a set of frames once (image folders, single images or session
+archives from RECORD_DIR), runs them through the full model alone, then
+through a ``cascade.Cascade`` for each ``--accept-conf``, and prints
+throughput, the fast-stage hit ratio and how often the cascade's label
+differs from the full model's, which is the accuracy cost:
+
+    python python/bench_cascade.py frames/ --full weights/lastest.pt --fast weights/small.pt
+    python python/bench_cascade.py recordings/alice-20260101_120000.sprc --full weights/lastest.pt \\
+        --fast weights/small.pt --accept-conf 0.7 0.8 0.9 --batch 8 --json cascade.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+PYTHON_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(PYTHON_DIR))
+
+import cascade  # noqa: E402
+import session_record  # noqa: E402
+import stages  # noqa: E402
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.bmp', '.webp'}
+
+
+def load_frames(inputs: list[str], max_side: int, limit: int | None) -> list:
+    blobs = []
+    for name in inputs:
+        path = Path(name)
+        if path.is_dir():
+            blobs += [p.read_bytes() for p in sorted(path.iterdir()) if p.suffix.lower() in IMAGE_SUFFIXES]
+        elif path.suffix == '.sprc':
+            blobs += [data for _, data in session_record.read_archive(path)]
+        else:
+            blobs.append(path.read_bytes())
+        if limit and len(blobs) >= limit:
+            break
+    frames = []
+    for data in blobs[:limit] if limit else blobs:
+        try:
+            frames.append(stages.decode_image(data, max_side))
+        except stages.InvalidImage:
+            pass
+    return frames
+
+
+def run(model, frames: list, batch: int, conf: float, iou: float, max_det: int) -> tuple[list, float]:
+    """Labels per frame (None = nothing above ``conf``) and the wall time."""
+    labels = []
+    started = time.perf_counter()
+    for i in range(0, len(frames), batch):
+        for prediction in stages.predict_batch(model, frames[i:i + batch], conf, iou, max_det):
+            labels.append(prediction.best()[0])
+    return labels, time.perf_counter() - started
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Full model vs fast/full cascade: throughput and label agreement')
+    ap.add_argument('inputs', nargs='+', help='image folders, images or session archives (.sprc)')
+    ap.add_argument('--full', required=True, help='weights of the full model')
+    ap.add_argument('--fast', required=True, help='weights of the fast model')
+    ap.add_argument('--accept-conf', type=float, nargs='+', default=[0.8], help='cascade accept thresholds to compare')
+    ap.add_argument('--empty-conf', type=float, default=0.25, help='cascade empty threshold')
+    ap.add_argument('--conf', type=float, default=0.6, help='detection confidence (YOLO_CONF)')
+    ap.add_argument('--iou', type=float, default=0.5)
+    ap.add_argument('--max-det', type=int, default=1)
+    ap.add_argument('--batch', type=int, default=1, help='frames per predict call')
+    ap.add_argument('--limit', type=int, default=None, help='use only the first N frames')
+    ap.add_argument('--json', default=None, help='also write the results here')
+    args = ap.parse_args()
+
+    full = stages.ModelHandle(args.full)
+    fast = stages.ModelHandle(args.fast)
+    if dict(full.names) != dict(fast.names):
+        print('WARNING: the models have different class names; labels are compared by name')
+    frames = load_frames(args.inputs, full.input_size, args.limit)
+    if not frames:
+        print('ERROR: no decodable frames in the inputs')
+        sys.exit(2)
+    print(f"{len(frames)} frames at {full.input_size}px, batch {args.batch}")
+
+    # Warm both models up so the first configuration is not charged for it
+    for model in (full, fast):
+        stages.predict_batch(model, frames[:args.batch], args.conf, args.iou, args.max_det)
+
+    baseline, base_wall = run(full, frames, args.batch, args.conf, args.iou, args.max_det)
+    results = [{
+        'config': 'full only',
+        'fps': round(len(frames) / base_wall, 2),
+        'speedup': 1.0,
+        'fast_hit_ratio': None,
+        'label_changes': 0,
+        'agreement': 1.0,
+    }]
+    for accept in args.accept_conf:
+        model = cascade.Cascade(fast, full, accept_conf=accept, empty_conf=args.empty_conf)
+        labels, wall = run(model, frames, args.batch, args.conf, args.iou, args.max_det)
+        changes = sum(1 for a, b in zip(baseline, labels) if a != b)
+        stats = model.stats()
+        results.append({
+            'config': f'cascade accept {accept} empty {model.empty_conf}',
+            'fps': round(len(frames) / wall, 2),
+            'speedup': round(base_wall / wall, 2),
+            'fast_hit_ratio': stats['fast_hit_ratio'],
+            'outcomes': stats['outcomes'],
+            'label_changes': changes,
+            'agreement': round(1 - changes / len(frames), 4),
+        })
+
+    print(f"\n{'config':<34} {'frames/s':>9} {'speedup':>8} {'fast hits':>10} {'changed':>8} {'agree':>7}")
+    for r in results:
+        hits = '-' if r['fast_hit_ratio'] is None else f"{r['fast_hit_ratio']:.1%}"
+        print(f"{r['config']:<34} {r['fps']:>9} {r['speedup']:>7}x {hits:>10} {r['label_changes']:>8} {r['agreement']:>7.1%}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'frames': len(frames), 'batch': args.batch, 'results': results}, f, indent=2)
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+Scaling demo: N local python/server.py instances behind python/router.py.
+
+For each backend count, starts that many servers on free ports (each in
+its own working directory) and a router in front of them. Clients are
+then run, one per session, each posting frames in order through the
+router. The script prints requests/sec, latency and the speedup over one
+backend. It also checks session affinity: every session's frames must
+have reached exactly one backend (the router's X-Backend header), and
+that backend's ``frames_received_total{session}`` must equal the frames
+sent.
+
+    python python/bench_router.py --backends 1 2 4 --sessions 16 --requests 800
+    YOLO_WEIGHTS=weights/lastest.pt SCHED_SLOTS=1 python python/bench_router.py --backends 1 2 4
+
+With real weights each backend is bound by its inference slots
+(SCHED_SLOTS). Throughput then grows with the backend count until the
+machine's cores run out. ``--failover`` stops one backend halfway through
+the last run and reports the failed requests and the sessions moved.
+"""
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+from urllib import request as urlrequest
+
+PYTHON_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(PYTHON_DIR))
+
+from bench_serving import _free_port, make_jpeg, stop_server, wait_healthy  # noqa: E402
+from formdata import multipart_body  # noqa: E402
+
+FRAMES_LINE = re.compile(r'^\w+_frames_received_total\{endpoint="send-frame",session="([^"]*)"\} (\S+)$', re.M)
+
+
+def start_backend(port: int, workdir: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        BACKEND_PORT=str(port),
+        DETECTIONS_LOG=os.path.join(workdir, 'detections.json'),
+        HISTORY_DB=os.path.join(workdir, 'detections.sqlite3'),
+    )
+    return subprocess.Popen([sys.executable, str(PYTHON_DIR / 'server.py')], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def start_router(port: int, backends: list[str], workdir: str) -> subprocess.Popen:
+    env = dict(os.environ, ROUTER_PORT=str(port), ROUTER_BACKENDS=','.join(backends), ROUTER_HEALTH_INTERVAL_S='1')
+    return subprocess.Popen([sys.executable, str(PYTHON_DIR / 'router.py')], cwd=workdir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_backends_up(router_url: str, count: int, timeout: float = 60.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urlrequest.urlopen(f'{router_url}/health', timeout=2) as resp:
+                if len(json.loads(resp.read())['ring']) == count:
+                    return True
+        except Exception:
+            pass
+        time.sleep(0.25)
+    return False
+
+
+def frames_per_session(backend_url: str) -> dict[str, int]:
+    with urlrequest.urlopen(f'{backend_url}/metrics', timeout=10) as resp:
+        text = resp.read().decode()
+    return {session: int(float(n)) for session, n in FRAMES_LINE.findall(text)}
+
+
+def drive(port: int, body: bytes, content_type: str, sessions: int, total: int, on_half=None) -> dict:
+    """One client thread per session, posting its share of ``total`` frames in order."""
+    latencies: list[float] = []
+    errors = Counter()
+    served: dict[str, Counter] = defaultdict(Counter)
+    lock = threading.Lock()
+    done = [0]
+    per_session = max(1, total // sessions)
+
+    def client(session: str):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        headers = {'Content-Type': content_type, 'X-Session-Id': session}
+        for _ in range(per_session):
+            start = time.perf_counter()
+            try:
+                conn.request('POST', '/send-frame', body=body, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+                status, backend = resp.status, resp.getheader('X-Backend')
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                status, backend = type(e).__name__, None
+            elapsed = time.perf_counter() - start
+            with lock:
+                done[0] += 1
+                if status == 200:
+                    latencies.append(elapsed)
+                    served[session][backend] += 1
+                else:
+                    errors[str(status)] += 1
+                if on_half is not None and done[0] == per_session * sessions // 2:
+                    threading.Thread(target=on_half).start()
+        conn.close()
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=client, args=(f's{i:03d}',)) for i in range(sessions)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+
+    def pct(p):
+        if not latencies:
+            return float('nan')
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+    per_backend = Counter()
+    for counts in served.values():
+        per_backend.update(counts)
+    return {
+        'ok': len(latencies),
+        'errors': dict(errors),
+        'rps': len(latencies) / wall if wall else 0.0,
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'served': served,
+        'per_backend': per_backend,
+    }
+
+
+def check_affinity(stats: dict, urls: list[str], before: dict) -> list[str]:
+    """Sessions split across backends, and backend frame counts (minus ``before``) that differ from what was sent."""
+    problems = []
+    for session, counts in stats['served'].items():
+        if len(counts) > 1:
+            problems.append(f'{session} served by {len(counts)} backends: {dict(counts)}')
+    for url in urls:
+        try:
+            after = frames_per_session(url)
+        except Exception as e:
+            problems.append(f'{url}: could not read /metrics ({e})')
+            continue
+        for session, n in after.items():
+            counted = n - before[url].get(session, 0)
+            expected = stats['served'].get(session, {}).get(url, 0)
+            if counted != expected:
+                problems.append(f'{url} counted {counted} frames of {session}, router sent {expected}')
+    return problems
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Throughput of 1..N local servers behind the session router')
+    ap.add_argument('--backends', type=int, nargs='+', default=[1, 2, 4], help='backend counts to try')
+    ap.add_argument('--sessions', type=int, default=16, help='concurrent sessions (one client each)')
+    ap.add_argument('--requests', type=int, default=800, help='frames per configuration')
+    ap.add_argument('--width', type=int, default=640)
+    ap.add_argument('--height', type=int, default=480)
+    ap.add_argument('--failover', action='store_true', help='stop one backend halfway through the last run')
+    args = ap.parse_args()
+
+    payload = make_jpeg(args.width, args.height)
+    body, content_type = multipart_body('frame', 'frame.jpg', payload)
+    print(f'Frame: {args.width}x{args.height} JPEG, {len(payload) / 1024:.1f} KB; '
+          f'{args.sessions} sessions x {args.requests // args.sessions} frames')
+    print(f"{'backends':<10}{'ok':>6}{'err':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'speedup':>9}  frames per backend")
+    baseline = None
+    for index, count in enumerate(args.backends):
+        failover = args.failover and index == len(args.backends) - 1 and count > 1
+        with tempfile.TemporaryDirectory() as workdir:
+            ports = [_free_port() for _ in range(count)]
+            urls = [f'http://127.0.0.1:{p}' for p in ports]
+            procs = []
+            for i, port in enumerate(ports):
+                os.makedirs(os.path.join(workdir, f'backend{i}'))
+                procs.append(start_backend(port, os.path.join(workdir, f'backend{i}')))
+            router_port = _free_port()
+            router_proc = start_router(router_port, urls, workdir)
+            router_url = f'http://127.0.0.1:{router_port}'
+            try:
+                if not all(wait_healthy(url) for url in urls) or not wait_backends_up(router_url, count):
+                    print(f'{count} backends: did not become healthy, skipping')
+                    continue
+                drive(router_port, body, content_type, args.sessions, min(100, args.requests))  # warm-up
+                # The warm-up frames are in the backends' counters too: compare the deltas
+                before = {url: frames_per_session(url) for url in urls}
+                on_half = (lambda: stop_server(procs[-1])) if failover else None
+                stats = drive(router_port, body, content_type, args.sessions, args.requests, on_half)
+                if failover:
+                    problems = []
+                    moved = sum(1 for counts in stats['served'].values() if len(counts) > 1)
+                else:
+                    problems = check_affinity(stats, urls, before)
+            finally:
+                stop_server(router_proc)
+                for proc in procs:
+                    if proc.poll() is None:
+                        stop_server(proc)
+        baseline = baseline or stats['rps']
+        errors = sum(stats['errors'].values())
+        shares = ' '.join(str(stats['per_backend'].get(url, 0)) for url in urls)
+        print(f"{count:<10}{stats['ok']:>6}{errors:>6}{stats['rps']:>10.1f}{stats['p50_ms']:>10.1f}"
+              f"{stats['p95_ms']:>10.1f}{stats['rps'] / baseline:>8.2f}x  {shares}")
+        if failover:
+            print(f"  failover: stopped {urls[-1]} halfway; {errors} failed requests {stats['errors']}, "
+                  f"{moved} of {args.sessions} sessions moved to another backend")
+        elif problems:
+            print(f"  affinity: {len(problems)} problems")
+            for problem in problems[:10]:
+                print(f"    {problem}")
+        else:
+            print(f"  affinity: every session on one backend, backend frame counts match")
+
+
+if __name__ == '__main__':
+    main()
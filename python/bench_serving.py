@@ -0,0 +1,170 @@
+"""
+Throughput/latency benchmark: Flask dev server vs gunicorn workers.
+
+Starts each server configuration on a free port, drives /send-frame with
+concurrent clients posting a synthetic JPEG, and prints requests/sec and
+latency percentiles per configuration.
+
+    python python/bench_serving.py --workers 1 2 4 --clients 16 --requests 400
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib import request as urlrequest
+
+from formdata import multipart_body
+
+PYTHON_DIR = Path(__file__).resolve().parent
+ROOT_DIR = PYTHON_DIR.parent
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def make_jpeg(width: int, height: int) -> bytes:
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(0)
+    pixels = rng.integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format='JPEG', quality=60)
+    return buf.getvalue()
+
+
+def wait_healthy(base_url: str, timeout: float = 120.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urlrequest.urlopen(f'{base_url}/health', timeout=2) as resp:
+                if resp.status == 200:
+                    return True
+        except Exception:
+            time.sleep(0.25)
+    return False
+
+
+def start_server(mode: str, port: int, workers: int, threads: int, workdir: str) -> subprocess.Popen:
+    env = dict(os.environ, BACKEND_PORT=str(port), SERVER_WORKERS=str(workers), SERVER_THREADS=str(threads))
+    if mode == 'dev':
+        cmd = [sys.executable, str(PYTHON_DIR / 'server.py')]
+    else:
+        cmd = [sys.executable, '-m', 'gunicorn', '-c', str(PYTHON_DIR / 'gunicorn.conf.py'), 'wsgi:app']
+    return subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def stop_server(proc: subprocess.Popen):
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+def drive(url: str, body: bytes, content_type: str, clients: int, total: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+    remaining = [total]
+
+    def worker():
+        nonlocal errors
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            req = urlrequest.Request(url, data=body, headers={'Content-Type': content_type}, method='POST')
+            start = time.perf_counter()
+            try:
+                with urlrequest.urlopen(req, timeout=30) as resp:
+                    resp.read()
+                    ok = resp.status == 200
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker) for _ in range(clients)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+
+    def pct(p):
+        if not latencies:
+            return float('nan')
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+
+    return {
+        'ok': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / wall if wall else 0.0,
+        'p50_ms': pct(0.50),
+        'p95_ms': pct(0.95),
+        'p99_ms': pct(0.99),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Benchmark dev server vs gunicorn workers on /send-frame')
+    ap.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='gunicorn worker counts to try')
+    ap.add_argument('--threads', type=int, default=4, help='threads per gunicorn worker')
+    ap.add_argument('--clients', type=int, default=16, help='concurrent clients')
+    ap.add_argument('--requests', type=int, default=400, help='requests per configuration')
+    ap.add_argument('--width', type=int, default=1280)
+    ap.add_argument('--height', type=int, default=720)
+    ap.add_argument('--skip-dev', action='store_true', help='only benchmark gunicorn')
+    args = ap.parse_args()
+
+    payload = make_jpeg(args.width, args.height)
+    body, content_type = multipart_body('frame', 'frame.jpg', payload)
+    configs = [] if args.skip_dev else [('dev', 1)]
+    configs += [('gunicorn', w) for w in args.workers]
+
+    print(f'Frame: {args.width}x{args.height} JPEG, {len(payload) / 1024:.1f} KB; '
+          f'{args.clients} clients x {args.requests} requests')
+    print(f"{'server':<16}{'ok':>6}{'err':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    baseline = None
+    for mode, workers in configs:
+        with tempfile.TemporaryDirectory() as workdir:
+            port = _free_port()
+            proc = start_server(mode, port, workers, args.threads, workdir)
+            base_url = f'http://127.0.0.1:{port}'
+            try:
+                if not wait_healthy(base_url):
+                    print(f'{mode}: server did not become healthy, skipping')
+                    continue
+                drive(f'{base_url}/send-frame', body, content_type, args.clients, min(50, args.requests))  # warm-up
+                stats = drive(f'{base_url}/send-frame', body, content_type, args.clients, args.requests)
+            finally:
+                stop_server(proc)
+        name = 'dev' if mode == 'dev' else f'gunicorn x{workers}'
+        baseline = baseline or stats['rps']
+        speedup = stats['rps'] / baseline if baseline else 0.0
+        print(f"{name:<16}{stats['ok']:>6}{stats['errors']:>6}{stats['rps']:>10.1f}"
+              f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}  ({speedup:.2f}x)")
+
+
+if __name__ == '__main__':
+    main()
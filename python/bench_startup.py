@@ -0,0 +1,98 @@
+"""
+Cold-start benchmark and guard for python/server.py.
+
+Imports the server module in a fresh interpreter per run and per
+SERVER_MODE, and reports import time, peak RSS and which heavy libraries
+were loaded. Exits non-zero when a limit is exceeded or when an
+ingest-only/log-only instance imported something it should not, so it can
+run as a regression check:
+
+    python python/bench_startup.py --modes ingest logs --max-seconds 1.5 --max-rss-mb 150
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+PYTHON_DIR = Path(__file__).resolve().parent
+
+HEAVY_MODULES = ('torch', 'ultralytics', 'cv2', 'PIL')
+# Modules that must stay unloaded per mode
+FORBIDDEN = {
+    'full': (),
+    'ingest': ('torch', 'ultralytics', 'cv2', 'PIL'),
+    'logs': ('torch', 'ultralytics', 'cv2', 'PIL'),
+}
+
+CHILD = r"""
+import json, resource, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {python_dir!r})
+import server
+elapsed = time.perf_counter() - started
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == 'darwin':
+    rss_kb //= 1024
+print(json.dumps({{
+    'seconds': elapsed,
+    'rss_mb': rss_kb / 1024,
+    'loaded': [m for m in {heavy!r} if m in sys.modules],
+    'model_loaded': server.model is not None,
+}}))
+"""
+
+
+def measure(mode: str, workdir: str) -> dict:
+    env = dict(
+        os.environ,
+        SERVER_MODE=mode,
+        DETECTIONS_LOG=os.path.join(workdir, 'detections.json'),
+        HISTORY_DB=os.path.join(workdir, 'detections.sqlite3'),
+    )
+    code = CHILD.format(python_dir=str(PYTHON_DIR), heavy=HEAVY_MODULES)
+    out = subprocess.run(
+        [sys.executable, '-c', code], cwd=workdir, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Measure python/server.py import time and baseline RSS per SERVER_MODE')
+    ap.add_argument('--modes', nargs='+', default=['full', 'ingest', 'logs'], choices=sorted(FORBIDDEN))
+    ap.add_argument('--runs', type=int, default=3, help='fresh interpreters per mode')
+    ap.add_argument('--max-seconds', type=float, default=None, help='fail if median import time of a lightweight mode exceeds this')
+    ap.add_argument('--max-rss-mb', type=float, default=None, help='fail if median peak RSS of a lightweight mode exceeds this')
+    args = ap.parse_args()
+
+    failures = []
+    print(f"{'mode':<8}{'import s':>10}{'rss MB':>10}  loaded")
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory() as workdir:
+            runs = [measure(mode, workdir) for _ in range(max(1, args.runs))]
+        seconds = statistics.median(r['seconds'] for r in runs)
+        rss = statistics.median(r['rss_mb'] for r in runs)
+        loaded = sorted(set().union(*(r['loaded'] for r in runs)))
+        print(f"{mode:<8}{seconds:>10.3f}{rss:>10.1f}  {', '.join(loaded) or '-'}")
+        bad = [m for m in loaded if m in FORBIDDEN[mode]]
+        if bad:
+            failures.append(f'{mode}: imported {", ".join(bad)}')
+        # Limits guard the lightweight modes; full mode cost is dominated by the model
+        if mode != 'full':
+            if args.max_seconds is not None and seconds > args.max_seconds:
+                failures.append(f'{mode}: import took {seconds:.3f}s > {args.max_seconds}s')
+            if args.max_rss_mb is not None and rss > args.max_rss_mb:
+                failures.append(f'{mode}: RSS {rss:.1f} MB > {args.max_rss_mb} MB')
+
+    for failure in failures:
+        print(f'FAIL {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Threaded latest-frame camera capture.
+
+``cv2.VideoCapture`` buffers frames internally; when inference is slower
+than the camera, every ``read()`` returns an older and older frame and
+latency grows without bound. ``LatestFrameCapture`` reads the device on a
+background thread and keeps only the newest frame, so the consumer always
+gets the most recent image and frames it could not keep up with are
+counted as dropped instead of queued.
+
+For video files (``drop=False``) the reader waits for each frame to be
+consumed instead, so no frame is skipped.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+
+@dataclass
+class Frame:
+    seq: int              # 1-based capture sequence number
+    image: np.ndarray
+    captured: float       # time.monotonic() right after the grab
+    captured_ns: int      # wall clock, time.time_ns()
+
+
+class LatestFrameCapture:
+    def __init__(self, source, width: int | None = None, height: int | None = None, drop: bool = True):
+        self.source = int(source) if str(source).isdigit() else source
+        self.drop = drop
+        self._cap = cv2.VideoCapture(self.source)
+        if not self._cap.isOpened():
+            raise RuntimeError(f'Could not open video source {source!r}')
+        # Keep the driver-side queue as short as the backend allows
+        self._cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        if width:
+            self._cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        if height:
+            self._cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self._cond = threading.Condition()
+        self._latest: Frame | None = None
+        self._consumed_seq = 0
+        self._running = False
+        self._thread = None
+        self.captured = 0
+        self.dropped = 0
+        self.eof = False
+
+    def start(self) -> 'LatestFrameCapture':
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name='capture', daemon=True)
+        self._thread.start()
+        return self
+
+    def _loop(self):
+        while self._running:
+            ok, image = self._cap.read()
+            if not ok:
+                with self._cond:
+                    self.eof = True
+                    self._cond.notify_all()
+                return
+            frame = Frame(self.captured + 1, image, time.monotonic(), time.time_ns())
+            with self._cond:
+                if not self.drop:
+                    while self._running and self._latest is not None and self._latest.seq > self._consumed_seq:
+                        self._cond.wait(0.1)
+                if self._latest is not None and self._latest.seq > self._consumed_seq:
+                    self.dropped += 1
+                self._latest = frame
+                self.captured = frame.seq
+                self._cond.notify_all()
+
+    def read(self, timeout: float | None = None) -> Frame | None:
+        """Newest frame not yet returned; None on timeout or end of stream."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._latest is None or self._latest.seq <= self._consumed_seq:
+                if self.eof or not self._running:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            frame = self._latest
+            self._consumed_seq = frame.seq
+            self._cond.notify_all()
+            return frame
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        self._cap.release()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class LatencyStats:
+    """Rolling capture-to-result latency window."""
+
+    def __init__(self, window: int = 300):
+        self._values: deque = deque(maxlen=window)
+        self.count = 0
+
+    def add(self, seconds: float):
+        self._values.append(seconds)
+        self.count += 1
+
+    def summary(self) -> dict:
+        if not self._values:
+            return {'count': self.count}
+        ms = np.asarray(self._values) * 1000.0
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        return {
+            'count': self.count,
+            'p50_ms': round(float(p50), 1),
+            'p95_ms': round(float(p95), 1),
+            'p99_ms': round(float(p99), 1),
+            'max_ms': round(float(ms.max()), 1),
+        }
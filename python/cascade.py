@@ -0,0 +1,158 @@
+"""
+Two-stage model cascade: a small fast detector first, the full model only when unsure.
+
+Most frames are either empty or a steady letter the small model already
+gets right. ``Cascade`` runs the fast model on every frame (one batched
+pass) and routes each frame by the fast model's best score:
+
+    >= accept_conf     confident   the fast prediction is the answer
+    <  empty_conf      empty       answered as "nothing detected"
+    in between         escalated   re-run on the full model (one batched pass)
+
+Both models must share class names. A cascade stands in for a
+``stages.ModelHandle`` wherever one is used (``stages.predict`` /
+``predict_batch``, ``names``, ``input_size``) and pickles as two handles,
+so process-pool stages load both models per worker. ``cascade_frames_total{stage,outcome}`` counts the routing
+decisions, so the fast-stage hit ratio is (confident + empty) / total.
+``python/bench_cascade.py`` measures the throughput gained and the label
+agreement with the full model for a set of thresholds.
+
+Configuration (environment):
+    CASCADE_WEIGHTS       weights of the fast model; unset disables the cascade
+    CASCADE_ACCEPT_CONF   fast-model score accepted as final (default 0.8)
+    CASCADE_EMPTY_CONF    below this fast-model score a frame counts as empty (default 0.25)
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import Counter
+
+import metrics
+import stages
+
+CASCADE_FRAMES = metrics.counter(
+    'cascade_frames_total',
+    'Frames through the model cascade, by stage and outcome (fast: confident/empty/escalated, full: answered).',
+    ('stage', 'outcome'),
+)
+CASCADE_SECONDS = metrics.histogram(
+    'cascade_stage_seconds', 'Inference time per cascade stage call.', ('stage',),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+
+
+class Cascade:
+    def __init__(self, fast: stages.ModelHandle, full: stages.ModelHandle, accept_conf: float = 0.8, empty_conf: float = 0.25):
+        self.fast = fast
+        self.full = full
+        self.accept_conf = accept_conf
+        self.empty_conf = min(empty_conf, accept_conf)
+        self.counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'fast': self.fast, 'full': self.full, 'accept_conf': self.accept_conf, 'empty_conf': self.empty_conf}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def weights(self) -> str:
+        return self.full.weights
+
+    @property
+    def names(self) -> dict:
+        return self.full.names
+
+    @property
+    def input_size(self) -> int:
+        return self.full.input_size
+
+    def route(self, prediction: stages.Prediction) -> str:
+        if prediction.probs is not None and len(prediction.probs):
+            best = float(prediction.probs.max())
+        else:
+            best = float(prediction.conf.max()) if len(prediction.conf) else 0.0
+        if best >= self.accept_conf:
+            return 'confident'
+        if best < self.empty_conf:
+            return 'empty'
+        return 'escalated'
+
+    def predict_frames(self, frames: list, conf: float, iou: float, max_det: int, imgsz: int | None = None) -> list:
+        # The fast pass keeps boxes down to empty_conf so "unsure" is visible
+        started = time.perf_counter()
+        fast = stages.predict_batch(self.fast, frames, min(conf, self.empty_conf), iou, max_det, imgsz)
+        CASCADE_SECONDS.observe(time.perf_counter() - started, stage='fast')
+
+        outs: list = [None] * len(frames)
+        escalate = []
+        outcomes = Counter()
+        for i, prediction in enumerate(fast):
+            outcome = self.route(prediction)
+            outcomes[outcome] += 1
+            if outcome == 'escalated':
+                escalate.append(i)
+            elif outcome == 'empty':
+                # Nothing here scored empty_conf; a lower conf (e.g. for the sidecar) must not revive it
+                outs[i] = stages.Prediction(names=prediction.names)
+            else:
+                outs[i] = prediction.above(conf)
+        if escalate:
+            started = time.perf_counter()
+            full = stages.predict_batch(self.full, [frames[i] for i in escalate], conf, iou, max_det, imgsz)
+            CASCADE_SECONDS.observe(time.perf_counter() - started, stage='full')
+            for i, prediction in zip(escalate, full):
+                outs[i] = prediction
+
+        for outcome, n in outcomes.items():
+            CASCADE_FRAMES.inc(n, stage='fast', outcome=outcome)
+        if escalate:
+            CASCADE_FRAMES.inc(len(escalate), stage='full', outcome='answered')
+        with self._lock:
+            self.counts.update(outcomes)
+        return outs
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self.counts)
+        total = sum(counts.values())
+        answered = counts.get('confident', 0) + counts.get('empty', 0)
+        return {
+            'fast_weights': self.fast.weights,
+            'full_weights': self.full.weights,
+            'accept_conf': self.accept_conf,
+            'empty_conf': self.empty_conf,
+            'frames': total,
+            'outcomes': counts,
+            'fast_hit_ratio': round(answered / total, 4) if total else None,
+        }
+
+
+def cascade_from_env(full: stages.ModelHandle | None):
+    """``full`` wrapped in a ``Cascade`` when CASCADE_WEIGHTS is set and loads; otherwise ``full``."""
+    weights = os.environ.get('CASCADE_WEIGHTS', '')
+    if full is None or not weights:
+        return full
+    if not os.path.exists(weights):
+        print(f"WARNING: cascade weights not found at {weights}, using the full model only.")
+        return full
+    fast = stages.ModelHandle(weights)
+    try:
+        same_labels = dict(fast.names) == dict(full.names)
+    except Exception as e:
+        print(f"WARNING: Failed to load cascade model: {e}")
+        return full
+    if not same_labels:
+        print(f"WARNING: cascade model {weights} has different class names, using the full model only.")
+        return full
+    cascade = Cascade(
+        fast, full,
+        accept_conf=float(os.environ.get('CASCADE_ACCEPT_CONF', '0.8')),
+        empty_conf=float(os.environ.get('CASCADE_EMPTY_CONF', '0.25')),
+    )
+    print(f"Model cascade: {weights} first, {full.weights} below "
+          f"{cascade.accept_conf} (empty below {cascade.empty_conf})")
+    return cascade
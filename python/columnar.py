@@ -0,0 +1,277 @@
+"""
+Columnar in-memory detection buffer.
+
+Replaces a deque of per-frame dicts with a bounded ring of numpy columns:
+
+    frame       int64   frame number
+    ts_us       int64   capture time, microseconds since the epoch (NO_TS when unknown)
+    confidence  float32
+    label_id    int32   index into an interned label table
+
+That is 24 bytes per row instead of several hundred, so million-frame
+histories fit in a few tens of MB. ``frame_path`` is not stored: the
+owner supplies ``path_fn(frame, ts_us)`` to derive it, and only rows
+whose path differs from the derived one keep an explicit override.
+
+The buffer iterates as plain dicts, so existing JSON endpoints and file
+writers keep working. ``label_histogram``, ``confidence_stats`` and
+``runs`` answer aggregate questions with vectorised numpy instead of
+Python loops.
+"""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+NO_TS = np.iinfo(np.int64).min
+_MIN_CAPACITY = 1024
+
+
+def datetime_to_us(dt: datetime) -> int:
+    """Exact microseconds since the epoch for a (naive local or aware) datetime."""
+    return int(dt.replace(microsecond=0).timestamp()) * 1_000_000 + dt.microsecond
+
+
+def us_to_datetime(ts_us: int) -> datetime:
+    """Inverse of ``datetime_to_us`` without float rounding."""
+    seconds, micros = divmod(int(ts_us), 1_000_000)
+    return datetime.fromtimestamp(seconds) + timedelta(microseconds=micros)
+
+
+def _parse_ts(value) -> int:
+    if value is None or value == '':
+        return NO_TS
+    if isinstance(value, datetime):
+        return datetime_to_us(value)
+    if isinstance(value, (int, float)):
+        return int(round(float(value) * 1_000_000))
+    try:
+        return datetime_to_us(datetime.fromisoformat(str(value)))
+    except ValueError:
+        return NO_TS
+
+
+class DetectionColumns:
+    def __init__(self, maxlen: int, path_fn=None):
+        self.maxlen = max(1, int(maxlen))
+        self.path_fn = path_fn
+        cap = min(self.maxlen, _MIN_CAPACITY)
+        self._frame = np.zeros(cap, dtype=np.int64)
+        self._ts = np.zeros(cap, dtype=np.int64)
+        self._conf = np.zeros(cap, dtype=np.float32)
+        self._label = np.zeros(cap, dtype=np.int32)
+        self._head = 0          # physical index of the oldest row
+        self._size = 0
+        self._seq = 0           # sequence number of the next appended row
+        self.labels: list[str] = []
+        self._label_ids: dict[str, int] = {}
+        self._path_overrides: dict[int, str] = {}
+
+    # ----- storage -----
+
+    def _capacity(self) -> int:
+        return len(self._frame)
+
+    def _grow(self):
+        cap = min(self.maxlen, self._capacity() * 2)
+        order = self._order()
+        for name in ('_frame', '_ts', '_conf', '_label'):
+            old = getattr(self, name)
+            new = np.zeros(cap, dtype=old.dtype)
+            new[:self._size] = old[order]
+            setattr(self, name, new)
+        self._head = 0
+
+    def _order(self) -> np.ndarray:
+        """Physical indices of all rows, oldest first."""
+        return (self._head + np.arange(self._size)) % self._capacity()
+
+    def intern(self, label: str) -> int:
+        label_id = self._label_ids.get(label)
+        if label_id is None:
+            label_id = len(self.labels)
+            self.labels.append(label)
+            self._label_ids[label] = label_id
+        return label_id
+
+    def append(self, entry: dict):
+        if self._size == self._capacity() and self._capacity() < self.maxlen:
+            self._grow()
+        cap = self._capacity()
+        if self._size == cap:
+            idx = self._head
+            self._head = (self._head + 1) % cap
+            self._path_overrides.pop(self._seq - self._size, None)
+        else:
+            idx = (self._head + self._size) % cap
+            self._size += 1
+        frame = int(entry.get('frame_count') or entry.get('frame') or 0)
+        ts_us = _parse_ts(entry.get('timestamp'))
+        self._frame[idx] = frame
+        self._ts[idx] = ts_us
+        self._conf[idx] = float(entry.get('confidence') or 0.0)
+        self._label[idx] = self.intern(str(entry.get('label', 'none')))
+        path = entry.get('frame_path')
+        if path is not None and (self.path_fn is None or path != self.path_fn(frame, ts_us)):
+            self._path_overrides[self._seq] = path
+        self._seq += 1
+
+    def drop_oldest(self, n: int) -> int:
+        n = max(0, min(int(n), self._size))
+        first_seq = self._seq - self._size
+        for seq in range(first_seq, first_seq + n):
+            self._path_overrides.pop(seq, None)
+        self._head = (self._head + n) % self._capacity()
+        self._size -= n
+        return n
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+        self._path_overrides.clear()
+
+    def rebase(self, first_seq: int):
+        """Renumber the retained rows so the oldest has sequence number ``first_seq``."""
+        shift = int(first_seq) - self.first_seq
+        self._path_overrides = {seq + shift: path for seq, path in self._path_overrides.items()}
+        self._seq += shift
+
+    def pin_paths(self):
+        """Store the derived frame path of every retained row, so a later ``path_fn`` change leaves them intact."""
+        if self.path_fn is None:
+            return
+        first = self.first_seq
+        for pos in range(self._size):
+            idx = (self._head + pos) % self._capacity()
+            path = self.path_fn(int(self._frame[idx]), int(self._ts[idx]))
+            if path is not None:
+                self._path_overrides.setdefault(first + pos, path)
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self._frame.nbytes + self._ts.nbytes + self._conf.nbytes + self._label.nbytes
+            + sum(len(p) + 50 for p in self._path_overrides.values())
+        )
+
+    # ----- dict-compatible view -----
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    def _row(self, pos: int) -> dict:
+        idx = (self._head + pos) % self._capacity()
+        frame = int(self._frame[idx])
+        ts_us = int(self._ts[idx])
+        row = {
+            'frame_count': frame,
+            'timestamp': None if ts_us == NO_TS else us_to_datetime(ts_us).isoformat(),
+            'label': self.labels[self._label[idx]],
+            'confidence': round(float(self._conf[idx]), 6),
+        }
+        seq = self._seq - self._size + pos
+        path = self._path_overrides.get(seq)
+        if path is None and self.path_fn is not None:
+            path = self.path_fn(frame, ts_us)
+        if path is not None:
+            row['frame_path'] = path
+        return row
+
+    def __getitem__(self, pos: int) -> dict:
+        if pos < 0:
+            pos += self._size
+        if not 0 <= pos < self._size:
+            raise IndexError('buffer index out of range')
+        return self._row(pos)
+
+    def __iter__(self):
+        for pos in range(self._size):
+            yield self._row(pos)
+
+    @property
+    def seq(self) -> int:
+        """Sequence number the next appended row gets (rows ever appended; never reset)."""
+        return self._seq
+
+    @property
+    def first_seq(self) -> int:
+        """Sequence number of the oldest retained row (== ``seq`` when empty)."""
+        return self._seq - self._size
+
+    def since(self, seq: int) -> list[dict]:
+        """Retained rows with sequence number >= ``seq``, oldest first."""
+        start = max(0, int(seq) - self.first_seq)
+        return [self._row(pos) for pos in range(start, self._size)]
+
+    def tail(self, n: int) -> list[dict]:
+        n = max(0, min(int(n), self._size))
+        return [self._row(pos) for pos in range(self._size - n, self._size)]
+
+    # ----- vectorised helpers -----
+
+    def columns(self) -> dict[str, np.ndarray]:
+        """Chronologically ordered copies of the numeric columns."""
+        order = self._order()
+        return {
+            'frame': self._frame[order],
+            'ts_us': self._ts[order],
+            'confidence': self._conf[order],
+            'label_id': self._label[order],
+        }
+
+    def label_histogram(self) -> dict[str, int]:
+        if not self._size:
+            return {}
+        counts = np.bincount(self._label[self._order()], minlength=len(self.labels))
+        return {self.labels[i]: int(n) for i, n in enumerate(counts) if n}
+
+    def confidence_stats(self, label: str | None = None) -> dict:
+        conf = self._conf[self._order()]
+        if label is not None:
+            label_id = self._label_ids.get(label)
+            if label_id is None:
+                conf = conf[:0]
+            else:
+                conf = conf[self._label[self._order()] == label_id]
+        if not len(conf):
+            return {'count': 0}
+        p50, p90 = np.percentile(conf, [50, 90])
+        return {
+            'count': int(len(conf)),
+            'mean': round(float(conf.mean()), 6),
+            'min': round(float(conf.min()), 6),
+            'max': round(float(conf.max()), 6),
+            'p50': round(float(p50), 6),
+            'p90': round(float(p90), 6),
+        }
+
+    def run_boundaries(self) -> np.ndarray:
+        """Positions (oldest = 0) where a new run of identical labels starts."""
+        if not self._size:
+            return np.zeros(0, dtype=np.int64)
+        labels = self._label[self._order()]
+        return np.concatenate(([0], np.flatnonzero(labels[1:] != labels[:-1]) + 1))
+
+    def runs(self) -> list[dict]:
+        """Consecutive same-label runs with frame range, length and mean confidence."""
+        if not self._size:
+            return []
+        cols = self.columns()
+        starts = self.run_boundaries()
+        ends = np.append(starts[1:], self._size) - 1
+        lengths = ends - starts + 1
+        conf_sums = np.add.reduceat(cols['confidence'].astype(np.float64), starts)
+        return [
+            {
+                'label': self.labels[cols['label_id'][s]],
+                'start_frame': int(cols['frame'][s]),
+                'end_frame': int(cols['frame'][e]),
+                'frames': int(n),
+                'mean_confidence': round(float(c / n), 6),
+            }
+            for s, e, n, c in zip(starts, ends, lengths, conf_sums)
+        ]
@@ -0,0 +1,272 @@
+"""
+Local, confidence-aware decoding of detected letter sequences into words.
+
+Per-frame detections are collapsed into runs (label, frames, mean
+confidence). Each word segment is aligned against dictionary words with a
+weighted edit distance in which confident, long runs are expensive to
+drop or substitute while short, low-confidence runs (hand transitions)
+are cheap to drop. Consecutive identical letters in a word ("ll" in
+"hello") may be covered by one run, since the detector cannot separate
+them. The best candidate's cost and its margin over the runner-up give a
+confidence in [0, 1]; callers fall back to a remote model below a
+threshold.
+"""
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import dataclass
+
+SEPARATOR_LABELS = {'sp', 'space', '_', 'fn', 'none'}
+MIN_RUN_FRAMES = int(os.environ.get('DECODER_MIN_RUN_FRAMES', '3'))
+TEXT_ONLY_CONFIDENCE = 0.85
+
+# Alignment costs
+MATCH_WEIGHT = 0.5        # x (1 - p): even a match costs a little if the detector was unsure
+INSERT_COST = 0.9         # word letter with no supporting run (detector missed it)
+REPEAT_COST = 0.1         # extra identical letter covered by the previous run
+OOV_PENALTY = 1.2         # keeping the raw letters when no dictionary word fits
+SEPARATION_SCALE = 2.0
+
+COMMON_WORDS = frozenset({
+    'a', 'i',
+    'am', 'an', 'as', 'at', 'be', 'by', 'do', 'go', 'he', 'hi', 'if', 'in',
+    'is', 'it', 'me', 'my', 'no', 'of', 'ok', 'on', 'or', 'so', 'to', 'up',
+    'us', 'we',
+    'all', 'and', 'any', 'are', 'ask', 'bad', 'big', 'boy', 'but', 'buy',
+    'can', 'car', 'cat', 'dad', 'day', 'did', 'dog', 'eat', 'end', 'eye',
+    'far', 'few', 'for', 'fun', 'get', 'god', 'got', 'guy', 'had', 'has',
+    'her', 'him', 'his', 'hot', 'how', 'its', 'job', 'joy', 'just', 'keep',
+    'key', 'kid', 'let', 'lot', 'man', 'may', 'mom', 'mrs', 'new', 'not',
+    'now', 'off', 'old', 'one', 'our', 'out', 'own', 'pay', 'put', 'ran',
+    'run', 'sad', 'sat', 'saw', 'say', 'see', 'set', 'she', 'sit', 'six',
+    'son', 'ten', 'the', 'too', 'top', 'try', 'two', 'use', 'war', 'was',
+    'way', 'who', 'why', 'win', 'won', 'yes', 'yet', 'you',
+    'able', 'also', 'back', 'ball', 'bank', 'been', 'best', 'bill', 'body',
+    'book', 'both', 'call', 'came', 'come', 'cool', 'city', 'dark', 'data',
+    'deal', 'does', 'done', 'door', 'down', 'each', 'east', 'easy', 'else',
+    'even', 'ever', 'face', 'fact', 'fall', 'feel', 'find', 'fire', 'food',
+    'four', 'free', 'from', 'full', 'game', 'gave', 'girl', 'give', 'glad',
+    'goes', 'gone', 'good', 'great', 'grow', 'hair', 'half', 'hand', 'hard',
+    'have', 'head', 'hear', 'help', 'here', 'high', 'hold', 'home', 'hope',
+    'hour', 'idea', 'into', 'kind', 'knew', 'know', 'land',
+    'last', 'late', 'left', 'less', 'life', 'like', 'line', 'live', 'long',
+    'look', 'love', 'made', 'main', 'make', 'many', 'meet', 'mind', 'more',
+    'most', 'move', 'much', 'must', 'name', 'near', 'need', 'next', 'nice',
+    'none', 'once', 'only', 'open', 'over', 'paid', 'part', 'pass', 'past',
+    'pick', 'plan', 'play', 'read', 'real', 'rest', 'right', 'road', 'room',
+    'safe', 'said', 'same', 'save', 'seen', 'self', 'send', 'show', 'side',
+    'sign', 'size', 'some', 'soon', 'stay', 'stop', 'such', 'sure', 'take',
+    'talk', 'tell', 'text', 'than', 'that', 'them', 'then', 'they', 'this',
+    'thus', 'time', 'told', 'took', 'tree', 'true', 'turn', 'type', 'upon',
+    'used', 'user', 'very', 'view', 'wait', 'walk', 'wall', 'want', 'week',
+    'well', 'went', 'were', 'west', 'what', 'when', 'will', 'with', 'word',
+    'work', 'year', 'your',
+    'about', 'above', 'after', 'again', 'being', 'below', 'black', 'bring',
+    'cause', 'child', 'clear', 'close', 'could', 'doing', 'early', 'every',
+    'field', 'first', 'found', 'front', 'given', 'going', 'green',
+    'group', 'happy', 'heard', 'heart', 'hello', 'house', 'human', 'known',
+    'large', 'later', 'learn', 'leave', 'level', 'light', 'little', 'local',
+    'might', 'money', 'month', 'never', 'night', 'often', 'order', 'other',
+    'party', 'peace', 'place', 'plant', 'point', 'power', 'press', 'quite',
+    'ready', 'river', 'round', 'seems', 'shall', 'short', 'shown',
+    'since', 'small', 'sorry', 'sound', 'south', 'space', 'start', 'state',
+    'still', 'study', 'table', 'taken', 'thank', 'thanks', 'their', 'there',
+    'these', 'thing', 'think', 'third', 'those', 'three', 'today', 'under',
+    'until', 'using', 'value', 'voice', 'watch', 'water', 'white', 'whole',
+    'woman', 'women', 'world', 'would', 'write', 'wrong', 'young',
+    'always', 'around', 'become', 'before', 'better', 'called', 'change',
+    'coming', 'enough', 'family', 'friend', 'having', 'itself',
+    'making', 'matter', 'minute', 'moment', 'mother', 'number', 'people',
+    'person', 'please', 'rather', 'really', 'reason', 'school', 'should',
+    'simple', 'social', 'system', 'things', 'though', 'together', 'toward',
+    'wanted', 'without', 'working', 'because', 'between', 'brought', 'country',
+    'during', 'example', 'father', 'general', 'getting', 'government', 'however',
+    'looking', 'morning', 'nothing', 'problem', 'program', 'several', 'something',
+    'special', 'started', 'through', 'understand', 'whether', 'another',
+})
+
+_WORDS_BY_LEN: dict[int, list[str]] = {}
+for _w in sorted(COMMON_WORDS):
+    _WORDS_BY_LEN.setdefault(len(_w), []).append(_w)
+
+
+@dataclass
+class Run:
+    label: str
+    frames: int
+    confidence: float
+
+    @property
+    def weight(self) -> float:
+        """Probability that this run is a real, intended letter."""
+        return self.confidence * min(1.0, self.frames / MIN_RUN_FRAMES)
+
+
+@dataclass
+class Decoded:
+    text: str
+    confidence: float
+    words: list[dict]
+
+
+def _row_label_conf(row):
+    if isinstance(row, dict):
+        return row.get('label'), row.get('confidence', 1.0)
+    if isinstance(row, (list, tuple)) and len(row) >= 3:
+        # realtime_detect.py rows: [frame, confidence, label]
+        return row[2], row[1]
+    return None, None
+
+
+def runs_from_frames(rows) -> list[list[Run]]:
+    """Collapse per-frame rows into runs, split into word segments at separators."""
+    segments: list[list[Run]] = [[]]
+    current = None
+    total = 0.0
+    for row in rows or []:
+        label, conf = _row_label_conf(row)
+        if not label:
+            continue
+        try:
+            conf = float(conf)
+        except (TypeError, ValueError):
+            conf = 0.0
+        label = str(label)
+        if current is not None and label == current.label:
+            current.frames += 1
+            total += conf
+            current.confidence = total / current.frames
+            continue
+        if label.lower() in SEPARATOR_LABELS:
+            current = Run(label, 1, conf)
+            total = conf
+            if segments[-1]:
+                segments.append([])
+            continue
+        current = Run(label, 1, conf)
+        total = conf
+        segments[-1].append(current)
+    return [seg for seg in segments if seg]
+
+
+def runs_from_text(text: str, confidence: float = TEXT_ONLY_CONFIDENCE) -> list[list[Run]]:
+    """Treat each letter of a plain string as one full-length run."""
+    segments = []
+    for chunk in str(text).replace('_', ' ').split():
+        segments.append([Run(ch, MIN_RUN_FRAMES, confidence) for ch in chunk])
+    return segments
+
+
+def _align_cost(runs: list[Run], word: str) -> float:
+    letters = [r.label.lower() for r in runs]
+    n, m = len(runs), len(word)
+    inf = float('inf')
+    # dp[i][j]: cost of explaining the first i runs with the first j word letters
+    dp = [[inf] * (m + 1) for _ in range(n + 1)]
+    dp[0][0] = 0.0
+    for i in range(n + 1):
+        for j in range(m + 1):
+            cur = dp[i][j]
+            if cur == inf:
+                continue
+            if i < n:
+                # Drop run i as noise
+                w = runs[i].weight
+                if cur + w < dp[i + 1][j]:
+                    dp[i + 1][j] = cur + w
+            if j < m:
+                # Word letter with no supporting run; cheap if the previous run already shows it
+                cost = INSERT_COST
+                if i > 0 and j > 0 and word[j] == word[j - 1] == letters[i - 1]:
+                    cost = REPEAT_COST
+                if cur + cost < dp[i][j + 1]:
+                    dp[i][j + 1] = cur + cost
+            if i < n and j < m:
+                w = runs[i].weight
+                if letters[i] == word[j]:
+                    cost = MATCH_WEIGHT * (1.0 - runs[i].confidence)
+                else:
+                    cost = w + MATCH_WEIGHT * (1.0 - w)
+                if cur + cost < dp[i + 1][j + 1]:
+                    dp[i + 1][j + 1] = cur + cost
+    return dp[n][m]
+
+
+def decode_segment(runs: list[Run]) -> dict:
+    raw = ''.join(r.label for r in runs)
+    raw_cost = OOV_PENALTY + sum(MATCH_WEIGHT * (1.0 - r.confidence) for r in runs)
+    scored = [(raw_cost, raw)]
+    lo = max(1, len(runs) - 2)
+    hi = len(runs) + 3
+    for length in range(lo, hi + 1):
+        for word in _WORDS_BY_LEN.get(length, ()):
+            scored.append((_align_cost(runs, word), word))
+    scored.sort(key=lambda item: item[0])
+    best_cost, best = scored[0]
+    second_cost = scored[1][0] if len(scored) > 1 else best_cost + 10.0
+    quality = math.exp(-best_cost)
+    separation = 1.0 - math.exp(-SEPARATION_SCALE * (second_cost - best_cost))
+    confidence = quality * (0.5 + 0.5 * separation)
+    if best == raw:
+        confidence = min(confidence, math.exp(-OOV_PENALTY))
+    return {
+        'raw': raw,
+        'string': best,
+        'confidence': round(confidence, 4),
+        'cost': round(best_cost, 4),
+        'runner_up': scored[1][1] if len(scored) > 1 else None,
+    }
+
+
+def decode(segments: list[list[Run]]) -> Decoded:
+    words = [decode_segment(seg) for seg in segments]
+    if not words:
+        return Decoded('', 0.0, [])
+    text = ' '.join(w['string'] for w in words)
+    return Decoded(text, min(w['confidence'] for w in words), words)
+
+
+def decode_frames(rows) -> Decoded:
+    return decode(runs_from_frames(rows))
+
+
+def decode_text(text: str) -> Decoded:
+    return decode(runs_from_text(text))
+
+
+def levenshtein(s1: str, s2: str) -> int:
+    """Plain edit distance between two strings."""
+    if len(s1) < len(s2):
+        s1, s2 = s2, s1
+    if not s2:
+        return len(s1)
+    prev_row = list(range(len(s2) + 1))
+    for i, c1 in enumerate(s1):
+        curr_row = [i + 1]
+        for j, c2 in enumerate(s2):
+            curr_row.append(min(prev_row[j + 1] + 1, curr_row[j] + 1, prev_row[j] + (c1 != c2)))
+        prev_row = curr_row
+    return prev_row[-1]
+
+
+def match_word(raw: str, max_distance: int = 2) -> str:
+    """
+    Closest dictionary word to ``raw`` within ``max_distance`` edits, else ``raw``.
+
+    The correction written to CorrectedLog.json and /logs/corrected; it ignores
+    confidences (``decode_segment`` is the confidence-aware decoder).
+    """
+    raw_lower = raw.lower()
+    if raw_lower in COMMON_WORDS:
+        return raw_lower
+    best_match = None
+    best_dist = max_distance + 1
+    for length in range(max(1, len(raw_lower) - max_distance), len(raw_lower) + max_distance + 1):
+        for word in _WORDS_BY_LEN.get(length, ()):
+            dist = levenshtein(raw_lower, word)
+            if dist < best_dist:
+                best_dist, best_match = dist, word
+    if best_match is not None and best_dist <= max_distance:
+        return best_match
+    return raw
@@ -0,0 +1,266 @@
+"""
+Local publish/subscribe stream of detections.
+
+``realtime_detect.py`` used to rewrite its whole ``--out`` JSON file every
+few frames, and every consumer re-read and re-parsed it. A ``Publisher``
+pushes each detection as one JSON line over a Unix domain socket (or
+``tcp://host:port`` where Unix sockets are unavailable), stamped with a
+monotonically increasing ``seq``. Subscribers get a replay of the most
+recent messages on connect and then live updates, with no file polling.
+
+    pub = Publisher('/tmp/sparthack-detections.sock')
+    pub.publish({'frame_count': 1, 'label': 'A', 'confidence': 0.9})
+
+    for msg in Subscriber('/tmp/sparthack-detections.sock'):
+        ...                                   # or: subscribe(address, callback)
+
+Each subscriber has a bounded send queue; a subscriber that falls behind
+loses messages (visible as a gap in ``seq``) instead of slowing the
+publisher down. ``JsonFileSink`` keeps the old JSON file as an optional
+output written on a background thread.
+"""
+from __future__ import annotations
+
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+
+import metrics
+
+DEFAULT_ADDRESS = os.environ.get(
+    'DETECTION_BUS',
+    'tcp://127.0.0.1:8765' if not hasattr(socket, 'AF_UNIX') else '/tmp/sparthack-detections.sock',
+)
+REPLAY = 256
+SUBSCRIBER_QUEUE = 1024
+
+BUS_PUBLISHED = metrics.counter('bus_messages_published_total', 'Detections published on the local bus.')
+BUS_DROPPED = metrics.counter('bus_messages_dropped_total', 'Messages dropped for slow subscribers.')
+BUS_SUBSCRIBERS = metrics.gauge('bus_subscribers', 'Connected bus subscribers.')
+
+
+def _parse(address: str):
+    if address.startswith('tcp://'):
+        host, _, port = address[len('tcp://'):].rpartition(':')
+        return socket.AF_INET, (host or '127.0.0.1', int(port))
+    return socket.AF_UNIX, address
+
+
+class _Connection:
+    def __init__(self, sock: socket.socket, on_close):
+        self.sock = sock
+        self.queue: queue.Queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE)
+        self._on_close = on_close
+        self._thread = threading.Thread(target=self._send_loop, name='bus-send', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def offer(self, data: bytes):
+        try:
+            self.queue.put_nowait(data)
+        except queue.Full:
+            BUS_DROPPED.inc()
+
+    def _send_loop(self):
+        try:
+            while True:
+                data = self.queue.get()
+                if data is None:
+                    break
+                self.sock.sendall(data)
+        except OSError:
+            pass
+        finally:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+            self._on_close(self)
+
+
+class Publisher:
+    def __init__(self, address: str = DEFAULT_ADDRESS, replay: int = REPLAY):
+        self.address = address
+        self.seq = 0
+        self.publisher_id = f'{os.getpid()}-{time.time_ns()}'
+        self._recent: deque = deque(maxlen=replay)
+        self._subs: list[_Connection] = []
+        self._lock = threading.Lock()
+        family, addr = _parse(address)
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.unlink(addr)  # stale socket from a previous run
+        self._server = socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_INET:
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(addr)
+        self._server.listen(16)
+        self._closed = False
+        threading.Thread(target=self._accept_loop, name='bus-accept', daemon=True).start()
+
+    def _hello(self) -> bytes:
+        return (json.dumps({'type': 'hello', 'publisher': self.publisher_id, 'seq': self.seq}) + '\n').encode()
+
+    def _accept_loop(self):
+        while not self._closed:
+            try:
+                sock, _ = self._server.accept()
+            except OSError:
+                return
+            conn = _Connection(sock, self._drop)
+            with self._lock:
+                # Registering under the publish lock keeps replay and live messages contiguous
+                conn.offer(self._hello())
+                for data in self._recent:
+                    conn.offer(data)
+                self._subs.append(conn)
+                BUS_SUBSCRIBERS.set(len(self._subs))
+            conn.start()
+
+    def _drop(self, conn: _Connection):
+        with self._lock:
+            if conn in self._subs:
+                self._subs.remove(conn)
+            BUS_SUBSCRIBERS.set(len(self._subs))
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subs)
+
+    def publish(self, message: dict) -> int:
+        with self._lock:
+            self.seq += 1
+            data = (json.dumps({'seq': self.seq, **message}, ensure_ascii=False) + '\n').encode()
+            self._recent.append(data)
+            for conn in self._subs:
+                conn.offer(data)
+            BUS_PUBLISHED.inc()
+            return self.seq
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            subs = list(self._subs)
+        for conn in subs:
+            conn.offer(None)
+        try:
+            self._server.close()
+        except OSError:
+            pass
+        family, addr = _parse(self.address)
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.unlink(addr)
+
+
+class Subscriber:
+    """Iterates over published detections, reconnecting (and de-duplicating replays) as needed."""
+
+    def __init__(self, address: str = DEFAULT_ADDRESS, reconnect: float = 1.0):
+        self.address = address
+        self.reconnect = reconnect
+        self.last_seq = 0
+        self.gaps = 0
+        self._publisher = None
+        self._sock = None
+        self._closed = False
+
+    def _connect(self) -> socket.socket:
+        family, addr = _parse(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.connect(addr)
+        return sock
+
+    def __iter__(self):
+        while not self._closed:
+            try:
+                self._sock = self._connect()
+                with self._sock.makefile('rb') as stream:
+                    for line in stream:
+                        msg = json.loads(line)
+                        if msg.get('type') == 'hello':
+                            if msg['publisher'] != self._publisher:
+                                # A restarted publisher counts from 1 again
+                                self._publisher = msg['publisher']
+                                self.last_seq = 0
+                            continue
+                        seq = msg.get('seq', 0)
+                        if seq <= self.last_seq:
+                            continue
+                        if self.last_seq and seq != self.last_seq + 1:
+                            self.gaps += 1
+                        self.last_seq = seq
+                        yield msg
+            except (OSError, ValueError):
+                pass
+            if not self._closed:
+                time.sleep(self.reconnect)
+
+    def close(self):
+        self._closed = True
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+                self._sock.close()
+            except OSError:
+                pass
+
+
+def subscribe(address: str, callback, name: str = 'bus-subscriber') -> Subscriber:
+    """Call ``callback(message)`` for every detection on a background thread."""
+    sub = Subscriber(address)
+
+    def run():
+        for msg in sub:
+            try:
+                callback(msg)
+            except Exception as e:
+                print(f"WARNING: detection bus callback failed: {e}")
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return sub
+
+
+class JsonFileSink:
+    """Writes the latest snapshot of rows to a file on a background thread, skipping stale snapshots."""
+
+    def __init__(self, path: str, write_fn, min_interval: float = 0.0):
+        self.path = path
+        self.write_fn = write_fn
+        self.min_interval = min_interval
+        self.writes = 0
+        self._pending = None
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._loop, name='json-sink', daemon=True)
+        self._thread.start()
+
+    def update(self, rows: list):
+        with self._cond:
+            self._pending = rows
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closed:
+                    self._cond.wait()
+                rows, self._pending = self._pending, None
+                if rows is None:
+                    return
+            try:
+                self.write_fn(self.path, rows)
+                self.writes += 1
+            except Exception as e:
+                print(f"WARNING: Failed to write {self.path}: {e}")
+            if self.min_interval:
+                time.sleep(self.min_interval)
+
+    def close(self, timeout: float = 5.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
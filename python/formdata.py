@@ -0,0 +1,21 @@
+"""
+multipart/form-data request bodies for the command-line clients.
+
+The benchmarks and ``replay.py`` post frames to ``/send-frame`` with
+``urllib``, which has no multipart encoder of its own.
+"""
+from __future__ import annotations
+
+import uuid
+
+
+def multipart_body(field: str, filename: str, payload: bytes, content_type: str = 'image/jpeg') -> tuple[bytes, str]:
+    """Encode one file field; returns ``(body, content_type_header)``."""
+    boundary = uuid.uuid4().hex
+    head = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode()
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+    return head + payload + tail, f'multipart/form-data; boundary={boundary}'
@@ -0,0 +1,142 @@
+"""
+Asynchronous frame persistence with in-memory retention.
+
+``receive_frame`` used to call ``cv2.imwrite`` and then glob, stat and
+sort the whole frames directory on every request. ``FrameWriter`` takes
+the encoded JPEG off the request thread through a bounded queue; a
+background thread writes it, appends the path to an in-memory ordered
+list of written files and deletes the oldest ones in batches once the
+list exceeds ``max_frames``. The directory is only listed once, at
+startup, to adopt frames left by a previous run.
+
+When the disk cannot keep up and the queue is full, new frames are
+dropped (and counted) rather than blocking the request.
+
+Configuration (environment):
+    FRAME_WRITE_QUEUE    frames waiting to be written before new ones are dropped (default 64)
+    FRAME_DELETE_BATCH   files deleted per retention pass (default 32)
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import memdiag
+import metrics
+
+FRAME_WRITE_LAG = metrics.histogram(
+    'frame_write_lag_seconds', 'Time from enqueueing a frame to it being on disk.',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+FRAME_WRITES = metrics.counter('frame_writes_total', 'Frames written to disk.')
+FRAME_WRITES_DROPPED = metrics.counter('frame_writes_dropped_total', 'Frames not persisted, by reason.', ('reason',))
+FRAME_WRITE_QUEUE = metrics.gauge('frame_write_queue_depth', 'Frames waiting to be written.')
+FRAMES_DELETED = metrics.counter('frames_deleted_total', 'Old frames removed by retention.')
+
+
+class FrameWriter:
+    def __init__(self, frames_dir: str, max_frames: int, queue_size: int = 64, delete_batch: int = 32):
+        self.frames_dir = Path(frames_dir)
+        self.frames_dir.mkdir(parents=True, exist_ok=True)
+        self.max_frames = max(1, max_frames)
+        self.delete_batch = max(1, delete_batch)
+        self.queued_bytes = memdiag.InflightBytes()
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self._retained: deque = deque(
+            str(p) for p in sorted(self.frames_dir.glob('*.jpg'), key=lambda p: p.stat().st_mtime)
+        )
+        self._writer = None
+        self._writer_pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_writer(self):
+        # Also restarts the writer in a forked worker, where the parent's thread does not exist
+        if self._writer is not None and self._writer.is_alive() and self._writer_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._writer is not None and self._writer.is_alive() and self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+            self._writer = threading.Thread(target=self._write_loop, name='frame-writer', daemon=True)
+            self._writer.start()
+
+    def submit(self, path: str, jpeg: bytes) -> bool:
+        """Queue encoded frame bytes for writing; False if the queue was full and the frame was dropped."""
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((path, jpeg, time.perf_counter()))
+        except queue.Full:
+            FRAME_WRITES_DROPPED.inc(reason='queue_full')
+            return False
+        self.queued_bytes.add(len(jpeg))
+        FRAME_WRITE_QUEUE.inc()
+        return True
+
+    def _write_one(self, path: str, jpeg: bytes, queued_at: float):
+        try:
+            with open(path, 'wb') as f:
+                f.write(jpeg)
+        except OSError as e:
+            FRAME_WRITES_DROPPED.inc(reason='io_error')
+            print(f"WARNING: Failed to write frame {path}: {e}")
+            return
+        FRAME_WRITES.inc()
+        FRAME_WRITE_LAG.observe(time.perf_counter() - queued_at)
+        self._retained.append(path)
+
+    def _enforce_retention(self, force: bool = False):
+        # Delete in batches so retention costs one pass per delete_batch frames, not one per frame
+        excess = len(self._retained) - self.max_frames
+        if excess <= 0 or (excess < self.delete_batch and not force):
+            return
+        for _ in range(excess):
+            path = self._retained.popleft()
+            try:
+                os.unlink(path)
+                FRAMES_DELETED.inc()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"WARNING: Failed to delete old frame {path}: {e}")
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    self._enforce_retention(force=True)
+                    continue
+                path, jpeg, queued_at = item
+                self._write_one(path, jpeg, queued_at)
+                self.queued_bytes.sub(len(jpeg))
+                FRAME_WRITE_QUEUE.dec()
+                self._enforce_retention()
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout: float = 10.0):
+        """Block until queued frames are written (used on shutdown)."""
+        if self._writer is None or not self._writer.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def stats(self) -> dict:
+        return {
+            'queued': self._queue.qsize(),
+            'queued_bytes': self.queued_bytes(),
+            'retained': len(self._retained),
+            'max_frames': self.max_frames,
+            'written': int(FRAME_WRITES.value()),
+            'dropped': int(sum(FRAME_WRITES_DROPPED.value(reason=r) for r in ('queue_full', 'encode', 'io_error'))),
+            'deleted': int(FRAMES_DELETED.value()),
+        }
@@ -1,9 +1,71 @@
+import argparse
 import cv2
+import numpy as np
 import os
 import time
+import urllib.request
 from pathlib import Path
-from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+
+from live_feed import read_mjpeg
+
+# watchdog is only needed for the legacy --frames-dir mode
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+
+def gui_available():
+    import sys
+    if 'DISPLAY' not in os.environ and sys.platform == 'darwin':
+        print("⚠ Warning: GUI display may not be available on this system")
+        return False
+    return True
+
+
+class FeedViewer:
+    """Shows the server's in-memory MJPEG feed; no files are written or read."""
+
+    def __init__(self, url, reconnect=1.0):
+        self.url = url
+        self.reconnect = reconnect
+        self.frame_count = 0
+        self.gui_available = gui_available()
+        self._running = True
+
+    def _show(self, frame, headers):
+        if self.gui_available:
+            try:
+                cv2.imshow('Frame Stream', frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    self._running = False
+            except Exception:
+                if self.frame_count == 1:
+                    print("ℹ GUI display unavailable, logging frames instead")
+                self.gui_available = False
+        if self.frame_count % 10 == 0:
+            height, width = frame.shape[:2]
+            print(f"Frame #{self.frame_count}: seq {headers.get('x-frame-seq', '?')} ({width}x{height})")
+
+    def run(self):
+        while self._running:
+            try:
+                with urllib.request.urlopen(self.url, timeout=35) as stream:
+                    print(f"✓ Connected to {self.url}")
+                    for headers, jpeg in read_mjpeg(stream):
+                        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                        if frame is None:
+                            continue
+                        self.frame_count += 1
+                        self._show(frame, headers)
+                        if not self._running:
+                            return
+            except Exception as e:
+                print(f"Feed unavailable ({e}), retrying...", end='\r')
+            time.sleep(self.reconnect)
+
 
 class FrameDisplayHandler(FileSystemEventHandler):
     def __init__(self, frames_dir):
@@ -63,9 +125,11 @@ class FrameDisplayHandler(FileSystemEventHandler):
         except Exception as e:
             print(f"Error processing frame: {e}")
 
-def main():
-    FRAMES_DIR = 'frames'
-    
+def watch_directory(FRAMES_DIR):
+    if Observer is None:
+        print("Error: watchdog is not installed (pip install watchdog)")
+        return
+
     # Check if frames directory exists
     if not os.path.exists(FRAMES_DIR):
         print(f"Error: {FRAMES_DIR} directory not found")
@@ -96,5 +160,40 @@ def main():
         pass
     print(f"✓ Stopped. Total frames received: {event_handler.frame_count}")
 
+def main():
+    ap = argparse.ArgumentParser(description='Live preview of frames received by the server')
+    ap.add_argument('--url', default=os.environ.get('FEED_URL', 'http://localhost:5000/feed.mjpg'), help='MJPEG feed URL')
+    ap.add_argument('--overlay', action='store_true', help='draw the detected label on each frame')
+    ap.add_argument('--fps', type=float, default=0, help='cap the preview frame rate (0 = as received)')
+    ap.add_argument('--frames-dir', default=None, help='legacy mode: watch a frames directory instead of the feed')
+    args = ap.parse_args()
+
+    if args.frames_dir:
+        watch_directory(args.frames_dir)
+        return
+
+    query = []
+    if args.overlay:
+        query.append('overlay=1')
+    if args.fps:
+        query.append(f'fps={args.fps:g}')
+    url = args.url + ('?' + '&'.join(query) if query else '')
+
+    print("=== Frame Stream Viewer ===")
+    print(f"Streaming: {url}")
+    print("Press Ctrl+C (or q in the window) to stop")
+    print("")
+
+    viewer = FeedViewer(url)
+    try:
+        viewer.run()
+    except KeyboardInterrupt:
+        print("\n\nStopping...")
+    try:
+        cv2.destroyAllWindows()
+    except:
+        pass
+    print(f"✓ Stopped. Total frames received: {viewer.frame_count}")
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,281 @@
+"""
+Gemini access for /analyze: pooled clients, response cache and request coalescing.
+
+``Analyzer.analyze(text)`` normalises the letter string, answers from a
+bounded TTL/LRU cache when it can, joins an identical in-flight call when
+one exists, and otherwise runs one remote call on a bounded executor with
+a timeout. ``GEMINI_BACKEND=stub`` swaps the remote API for a local,
+deterministic backend so the whole path can be exercised offline.
+
+Configuration (environment):
+    GEMINI_API_KEY         API key for the real backend
+    GEMINI_MODEL           model name (default gemini-2.0-flash)
+    GEMINI_BACKEND         'gemini' (default) or 'stub'
+    GEMINI_POOL_SIZE       pooled SDK clients (default 4)
+    GEMINI_MAX_CONCURRENCY concurrent remote calls (default 4)
+    GEMINI_MAX_PENDING     calls allowed to wait for a slot before rejecting (default 32)
+    GEMINI_TIMEOUT         seconds to wait for a result (default 15)
+    GEMINI_CACHE_SIZE      cached responses (default 1024)
+    GEMINI_CACHE_TTL       seconds a cached response stays valid (default 3600)
+    GEMINI_STUB_DELAY      artificial latency of the stub backend in seconds (default 0)
+"""
+from __future__ import annotations
+
+import os
+import queue
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from threading import BoundedSemaphore, Lock
+
+import metrics
+
+GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-2.0-flash')
+
+ANALYZE_REQUESTS = metrics.counter(
+    'analyze_requests_total',
+    'Analyze requests by how they were answered (cache, coalesced, remote, local, error).',
+    ('source',),
+)
+ANALYZE_INFLIGHT = metrics.gauge('analyze_inflight', 'Remote analyze calls in flight.')
+
+
+class AnalyzeError(Exception):
+    """Base error; ``status`` is the HTTP status the endpoint should return."""
+    status = 500
+
+    def __init__(self, message: str, detail: str = ''):
+        super().__init__(message)
+        self.message = message
+        self.detail = detail
+
+
+class AnalyzeConfigError(AnalyzeError):
+    status = 500
+
+
+class AnalyzeBusy(AnalyzeError):
+    status = 503
+
+
+class AnalyzeTimeout(AnalyzeError):
+    status = 504
+
+
+def normalize_letters(text: str) -> str:
+    return ' '.join(str(text).split()).upper()
+
+
+def build_prompt(letters: str) -> str:
+    return (
+        'Guess the actual word or sentence from these letters. '
+        'Letters may be missing or noisy. Return only the best guess.\n'
+        f'Letters: {letters}'
+    )
+
+
+class GeminiBackend:
+    """Calls the Gemini API through a pool of reusable SDK clients."""
+
+    name = 'gemini'
+
+    def __init__(self, api_key: str | None = None, pool_size: int = 4, acquire_timeout: float = 15.0):
+        self.api_key = api_key if api_key is not None else os.environ.get('GEMINI_API_KEY', '')
+        self.pool_size = max(1, pool_size)
+        self.acquire_timeout = acquire_timeout
+        self._pool: queue.Queue = queue.Queue()
+        self._created = 0
+        self._lock = Lock()
+        self._genai = None
+
+    def _sdk(self):
+        if self._genai is None:
+            try:
+                from google import genai
+            except Exception as exc:
+                raise AnalyzeConfigError('Gemini SDK not installed', str(exc))
+            self._genai = genai
+        return self._genai
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.pool_size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                return self._sdk().Client(api_key=self.api_key)
+            except Exception as exc:
+                # Give the slot back, or a failed construction would shrink the pool for good
+                with self._lock:
+                    self._created -= 1
+                if isinstance(exc, AnalyzeError):
+                    raise
+                raise AnalyzeConfigError('Failed to create Gemini client', str(exc))
+        try:
+            return self._pool.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            raise AnalyzeBusy(f'No Gemini client free within {self.acquire_timeout:g}s')
+
+    def generate(self, prompt: str, model: str) -> str:
+        if not self.api_key:
+            raise AnalyzeConfigError('GEMINI_API_KEY not set')
+        self._sdk()
+        client = self._acquire()
+        try:
+            response = client.models.generate_content(model=model, contents=prompt)
+            return (getattr(response, 'text', '') or '').strip()
+        finally:
+            self._pool.put(client)
+
+
+class StubBackend:
+    """Offline backend: returns the letters as a lower-case word after an optional delay."""
+
+    name = 'stub'
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = 0
+        self._lock = Lock()
+
+    def generate(self, prompt: str, model: str) -> str:
+        with self._lock:
+            self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        letters = prompt.rsplit('Letters:', 1)[-1]
+        return ''.join(letters.split()).lower()
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class Analyzer:
+    def __init__(
+        self,
+        backend,
+        model: str = GEMINI_MODEL,
+        max_concurrency: int = 4,
+        max_pending: int = 32,
+        timeout: float = 15.0,
+        cache_size: int = 1024,
+        cache_ttl: float = 3600.0,
+    ):
+        self.backend = backend
+        self.model = model
+        self.timeout = timeout
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix='gemini')
+        self._slots = BoundedSemaphore(max(1, max_concurrency) + max(0, max_pending))
+        self._inflight: dict[tuple, Future] = {}
+        self._lock = Lock()
+
+    def _call(self, key: tuple, letters: str, model: str) -> str:
+        ANALYZE_INFLIGHT.inc()
+        try:
+            result = self.backend.generate(build_prompt(letters), model)
+            self.cache.put(key, result)
+            return result
+        finally:
+            ANALYZE_INFLIGHT.dec()
+            self._slots.release()
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def analyze(self, text: str, model: str | None = None) -> tuple[str, str]:
+        """Return ``(result, source)`` where source is cache, coalesced or remote."""
+        model = model or self.model
+        letters = normalize_letters(text)
+        key = (letters, model)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            ANALYZE_REQUESTS.inc(source='cache')
+            return cached, 'cache'
+
+        with self._lock:
+            future = self._inflight.get(key)
+            source = 'coalesced'
+            if future is None:
+                if not self._slots.acquire(blocking=False):
+                    ANALYZE_REQUESTS.inc(source='rejected')
+                    raise AnalyzeBusy('Too many analyze requests in flight')
+                future = self._executor.submit(self._call, key, letters, model)
+                self._inflight[key] = future
+                source = 'remote'
+
+        try:
+            result = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            ANALYZE_REQUESTS.inc(source='timeout')
+            raise AnalyzeTimeout(f'Gemini did not answer within {self.timeout:g}s')
+        except AnalyzeError:
+            ANALYZE_REQUESTS.inc(source='error')
+            raise
+        except Exception as exc:
+            ANALYZE_REQUESTS.inc(source='error')
+            raise AnalyzeError('Gemini request failed', str(exc))
+        ANALYZE_REQUESTS.inc(source=source)
+        return result, source
+
+
+def backend_from_env():
+    if os.environ.get('GEMINI_BACKEND', 'gemini').lower() == 'stub':
+        return StubBackend(delay=float(os.environ.get('GEMINI_STUB_DELAY', '0')))
+    return GeminiBackend(
+        pool_size=int(os.environ.get('GEMINI_POOL_SIZE', '4')),
+        acquire_timeout=float(os.environ.get('GEMINI_TIMEOUT', '15')),
+    )
+
+
+def analyzer_from_env() -> Analyzer:
+    return Analyzer(
+        backend_from_env(),
+        model=GEMINI_MODEL,
+        max_concurrency=int(os.environ.get('GEMINI_MAX_CONCURRENCY', '4')),
+        max_pending=int(os.environ.get('GEMINI_MAX_PENDING', '32')),
+        timeout=float(os.environ.get('GEMINI_TIMEOUT', '15')),
+        cache_size=int(os.environ.get('GEMINI_CACHE_SIZE', '1024')),
+        cache_ttl=float(os.environ.get('GEMINI_CACHE_TTL', '3600')),
+    )
@@ -0,0 +1,87 @@
+"""
+Gunicorn settings for production serving.
+
+    gunicorn -c python/gunicorn.conf.py wsgi:app
+
+Environment:
+    BACKEND_PORT       listen port (default 5000)
+    SERVER_WORKERS     worker processes (default: cores // TORCH_NUM_THREADS, at least 1)
+    SERVER_THREADS     request threads per worker (default 4)
+    TORCH_NUM_THREADS  intra-op threads per worker for torch/OpenCV (default 1)
+    GRACEFUL_TIMEOUT   seconds to drain in-flight requests on shutdown (default 30)
+"""
+import gc
+import os
+import sys
+
+_python_dir = os.path.dirname(os.path.abspath(__file__))
+if _python_dir not in sys.path:
+    sys.path.insert(0, _python_dir)
+
+TORCH_NUM_THREADS = int(os.environ.get('TORCH_NUM_THREADS', '1'))
+# Must be set before torch is imported by the preloaded app
+os.environ.setdefault('OMP_NUM_THREADS', str(TORCH_NUM_THREADS))
+os.environ.setdefault('MKL_NUM_THREADS', str(TORCH_NUM_THREADS))
+
+pythonpath = _python_dir
+bind = f"0.0.0.0:{os.environ.get('BACKEND_PORT', '5000')}"
+workers = int(os.environ.get('SERVER_WORKERS', str(max(1, (os.cpu_count() or 1) // TORCH_NUM_THREADS))))
+threads = int(os.environ.get('SERVER_THREADS', '4'))
+worker_class = 'gthread'
+# Load the app (and YOLO weights) once in the master; workers inherit them copy-on-write
+preload_app = True
+# The preloaded app must not start threads in the master (a thread holding a lock at fork
+# leaves that lock held forever in the worker); post_fork starts them per worker instead
+os.environ['SERVER_PRELOADED'] = '1'
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', '30'))
+timeout = int(os.environ.get('WORKER_TIMEOUT', '120'))
+keepalive = 5
+max_requests = int(os.environ.get('SERVER_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+accesslog = None
+errorlog = '-'
+
+
+def _server_module():
+    import wsgi
+    return wsgi.load_server_module()
+
+
+def when_ready(server):
+    server.log.info(f'Serving {workers} worker(s) x {threads} thread(s), torch threads per worker: {TORCH_NUM_THREADS}')
+
+
+def pre_fork(server, worker):
+    # Move everything allocated so far (model included) out of the collector's reach so
+    # GC passes in workers do not touch, and therefore copy, the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Only configure libraries the app actually loaded; importing them here would undo
+    # the lazy imports of ingest-only/log-only workers
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        torch.set_num_threads(TORCH_NUM_THREADS)
+    cv2 = sys.modules.get('cv2')
+    if cv2 is not None:
+        cv2.setNumThreads(TORCH_NUM_THREADS)
+    module = _server_module()
+    if hasattr(module, 'configure_worker'):
+        # Workers keep separate buffers: per-worker files, frame names and log sequence
+        # space (worker.age is unique among live workers; 2**40 rows apart stays JS-safe)
+        module.configure_worker(worker.pid, workers, seq_base=(worker.age % 4096) << 40)
+    # Background threads do not survive fork; restart them in each worker
+    if hasattr(module, 'start_background_tasks'):
+        module.start_background_tasks()
+    worker.log.info(f'Worker {worker.pid} ready (model loaded: {getattr(module, "model", None) is not None})')
+
+
+def worker_exit(server, worker):
+    # Runs after in-flight requests drained: persist whatever is still buffered
+    module = _server_module()
+    if hasattr(module, 'flush_state'):
+        try:
+            module.flush_state()
+        except Exception as e:
+            worker.log.warning(f'Failed to flush state on exit: {e}')
@@ -0,0 +1,273 @@
+"""
+Durable, indexed detection history backed by SQLite in WAL mode.
+
+The detection path only appends to an in-memory queue; a background
+writer drains it and inserts in batches (one transaction per batch), so
+request latency never includes an fsync. Queries by session + frame
+range, time window or label hit B-tree indexes, so they stay O(log n)
+regardless of how many millions of rows the database holds. Frame ranges
+need a session: frame numbers restart in every session.
+
+Configuration (environment):
+    HISTORY_ENABLE          1 (default) to record history
+    HISTORY_DB              database path (default detections.sqlite3 next to the server)
+    HISTORY_BATCH_SIZE      rows per insert transaction (default 256)
+    HISTORY_FLUSH_INTERVAL  max seconds a row waits before being written (default 0.5)
+"""
+from __future__ import annotations
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import metrics
+
+MAX_QUERY_ROWS = 10000
+
+HISTORY_ROWS = metrics.counter('history_rows_written_total', 'Detection rows persisted to the history store.')
+HISTORY_BATCH_SECONDS = metrics.histogram('history_batch_write_seconds', 'Time to write one batch to SQLite.')
+HISTORY_QUEUE = metrics.gauge('history_queue_depth', 'Detection rows waiting to be written.')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL,
+    frame INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    label TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    frame_path TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_detections_session_frame ON detections (session, frame);
+CREATE INDEX IF NOT EXISTS idx_detections_session_ts ON detections (session, ts);
+CREATE INDEX IF NOT EXISTS idx_detections_label_ts ON detections (label, ts);
+CREATE INDEX IF NOT EXISTS idx_detections_ts ON detections (ts);
+"""
+
+COLUMNS = ('session', 'frame', 'ts', 'label', 'confidence', 'frame_path')
+
+
+def to_epoch(value) -> float | None:
+    """Accept epoch seconds or an ISO-8601 string."""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return None
+
+
+class HistoryStore:
+    def __init__(self, path: str, batch_size: int = 256, flush_interval: float = 0.5):
+        self.path = str(path)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue()
+        self._local = threading.local()
+        self._writer = None
+        self._writer_pid = None
+        self._start_lock = threading.Lock()
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or getattr(self._local, 'pid', None) != os.getpid():
+            conn = self._connect()
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _ensure_writer(self):
+        # Also restarts the writer in a forked worker, where the parent's thread does not exist
+        if self._writer is not None and self._writer.is_alive() and self._writer_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._writer is not None and self._writer.is_alive() and self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+            self._writer = threading.Thread(target=self._write_loop, name='history-writer', daemon=True)
+            self._writer.start()
+
+    def add(self, entry: dict, session: str = 'default'):
+        ts = to_epoch(entry.get('timestamp'))
+        row = (
+            session,
+            int(entry.get('frame_count') or entry.get('frame') or 0),
+            ts if ts is not None else time.time(),
+            str(entry.get('label', 'none')),
+            float(entry.get('confidence') or 0.0),
+            entry.get('frame_path'),
+        )
+        self._ensure_writer()
+        self._queue.put(row)
+        HISTORY_QUEUE.inc()
+
+    def _insert(self, conn: sqlite3.Connection, rows: list):
+        with HISTORY_BATCH_SECONDS.time():
+            with conn:
+                conn.executemany(
+                    'INSERT INTO detections (session, frame, ts, label, confidence, frame_path) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    rows,
+                )
+        HISTORY_ROWS.inc(len(rows))
+        HISTORY_QUEUE.dec(len(rows))
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            rows = [r for r in batch if r is not None]
+            try:
+                if rows:
+                    self._insert(conn, rows)
+            except Exception as e:
+                print(f"WARNING: Failed to write detection history: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self, timeout: float = 10.0):
+        """Block until queued rows are written (used on shutdown)."""
+        if self._writer is None or not self._writer.is_alive():
+            return
+        self._queue.put(None)
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def query(
+        self,
+        session: str | None = None,
+        frame_from: int | None = None,
+        frame_to: int | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        labels: list[str] | None = None,
+        limit: int = 1000,
+        newest_first: bool = False,
+    ) -> list[dict]:
+        sql, params = _select(session, frame_from, frame_to, since, until, labels, limit, newest_first)
+        rows = self._reader().execute(sql, params).fetchall()
+        return [
+            {
+                'session': r['session'],
+                'frame_count': r['frame'],
+                'timestamp': datetime.fromtimestamp(r['ts']).isoformat(),
+                'label': r['label'],
+                'confidence': r['confidence'],
+                'frame_path': r['frame_path'],
+            }
+            for r in rows
+        ]
+
+    def sessions(self) -> list[dict]:
+        rows = self._reader().execute(
+            'SELECT session, COUNT(*) AS n, MIN(frame) AS first, MAX(frame) AS last, '
+            'MIN(ts) AS started, MAX(ts) AS ended FROM detections GROUP BY session'
+        ).fetchall()
+        return [
+            {
+                'session': r['session'],
+                'rows': r['n'],
+                'frame_range': f"{r['first']}-{r['last']}",
+                'started': datetime.fromtimestamp(r['started']).isoformat(),
+                'ended': datetime.fromtimestamp(r['ended']).isoformat(),
+            }
+            for r in rows
+        ]
+
+
+
+def _select(session, frame_from, frame_to, since, until, labels, limit, newest_first) -> tuple[str, list]:
+    """SQL and parameters for ``HistoryStore.query``; every filter combination is served by an index."""
+    if (frame_from is not None or frame_to is not None) and session is None:
+        # Frame numbers restart in every session, so a range only means something within one
+        raise ValueError('frame_from/frame_to require a session')
+    where, params = [], []
+    if session is not None:
+        where.append('session = ?')
+        params.append(session)
+    if frame_from is not None:
+        where.append('frame >= ?')
+        params.append(int(frame_from))
+    if frame_to is not None:
+        where.append('frame <= ?')
+        params.append(int(frame_to))
+    if since is not None:
+        where.append('ts >= ?')
+        params.append(float(since))
+    if until is not None:
+        where.append('ts <= ?')
+        params.append(float(until))
+    if labels:
+        where.append(f"label IN ({','.join('?' * len(labels))})")
+        params.extend(labels)
+    # Order by the column the predicate narrows on so SQLite can walk the same index
+    order_col = 'frame' if (frame_from is not None or frame_to is not None) else 'ts'
+    sql = 'SELECT session, frame, ts, label, confidence, frame_path FROM detections'
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += f" ORDER BY {order_col} {'DESC' if newest_first else 'ASC'}, id LIMIT ?"
+    params.append(max(1, min(int(limit), MAX_QUERY_ROWS)))
+    return sql, params
+
+def store_from_env(default_path) -> HistoryStore | None:
+    if os.environ.get('HISTORY_ENABLE', '1') != '1':
+        return None
+    try:
+        return HistoryStore(
+            os.environ.get('HISTORY_DB', str(default_path)),
+            batch_size=int(os.environ.get('HISTORY_BATCH_SIZE', '256')),
+            flush_interval=float(os.environ.get('HISTORY_FLUSH_INTERVAL', '0.5')),
+        )
+    except Exception as e:
+        print(f"WARNING: detection history disabled: {e}")
+        return None
+
+
+def query_args(args) -> dict:
+    """Translate request query parameters into ``HistoryStore.query`` keyword arguments."""
+    def _int(name):
+        value = args.get(name)
+        return int(value) if value not in (None, '') else None
+
+    labels = [label for label in (args.get('label') or '').split(',') if label]
+    params = {
+        'session': args.get('session') or None,
+        'frame_from': _int('frame_from'),
+        'frame_to': _int('frame_to'),
+        'since': to_epoch(args.get('since')),
+        'until': to_epoch(args.get('until')),
+        'labels': labels or None,
+        'limit': _int('limit') or 1000,
+        'newest_first': args.get('order') == 'desc',
+    }
+    _select(**params)   # rejects combinations the store refuses (ValueError -> 400)
+    return params
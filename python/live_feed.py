@@ -0,0 +1,160 @@
+"""
+In-memory latest-frame feed for live previews.
+
+The server keeps only the newest received JPEG (exactly the bytes the
+browser sent, so publishing costs no encode) together with the detection
+for that frame. Viewers stream it as MJPEG (``multipart/x-mixed-replace``)
+and block on a condition variable between frames, so a preview involves
+no disk writes, no directory watching and no re-decoding. The overlay
+variant (label and confidence drawn on the frame) is encoded lazily, at
+most once per frame, and only while someone is watching it.
+
+Each viewer holds a request thread for as long as it streams, so
+``max_viewers`` caps concurrent streams (callers answer 503 past it) and
+``max_seconds`` ends a stream after that long; viewers reconnect.
+"""
+from __future__ import annotations
+
+import threading
+import time
+
+import numpy as np
+
+import metrics
+import stages
+
+BOUNDARY = 'frame'
+MJPEG_CONTENT_TYPE = f'multipart/x-mixed-replace; boundary={BOUNDARY}'
+
+FEED_VIEWERS = metrics.gauge('live_feed_viewers', 'Clients currently streaming the live feed.')
+FEED_FRAMES_SENT = metrics.counter('live_feed_frames_sent_total', 'Frames sent to live feed viewers.', ('overlay',))
+
+
+class LiveFeed:
+    def __init__(self, jpeg_quality: int = 80, max_viewers: int = 0):
+        self.jpeg_quality = jpeg_quality
+        self.max_viewers = max_viewers
+        self.viewers = 0
+        self.seq = 0
+        self._jpeg: bytes | None = None
+        self._image: np.ndarray | None = None
+        self._detection: dict | None = None
+        self._overlay: tuple[int, bytes] | None = None
+        self._cond = threading.Condition()
+
+    def publish(self, jpeg: bytes, image: np.ndarray | None = None, detection: dict | None = None) -> int:
+        """Replace the latest frame; ``image`` (BGR) is only needed for overlays."""
+        with self._cond:
+            self.seq += 1
+            self._jpeg = jpeg
+            self._image = image
+            self._detection = detection
+            self._overlay = None
+            self._cond.notify_all()
+            return self.seq
+
+    def latest(self, overlay: bool = False) -> tuple[int, bytes | None, dict | None]:
+        with self._cond:
+            seq, jpeg, image, detection = self.seq, self._jpeg, self._image, self._detection
+            if not overlay or jpeg is None or image is None:
+                return seq, jpeg, detection
+            if self._overlay is not None and self._overlay[0] == seq:
+                return seq, self._overlay[1], detection
+        annotated = self._encode_overlay(image, detection)
+        with self._cond:
+            if self.seq == seq:
+                self._overlay = (seq, annotated)
+        return seq, annotated, detection
+
+    def _encode_overlay(self, image: np.ndarray, detection: dict | None) -> bytes:
+        text = ''
+        if detection:
+            text = f"{detection.get('label', 'none')} {float(detection.get('confidence') or 0.0):.2f}"
+        try:
+            return stages.encode_jpeg(stages.annotate(image, text), self.jpeg_quality)
+        except ValueError:
+            return b''
+
+    def acquire_viewer(self) -> bool:
+        """Reserve a viewer slot; False when ``max_viewers`` streams are already open."""
+        with self._cond:
+            if self.max_viewers > 0 and self.viewers >= self.max_viewers:
+                return False
+            self.viewers += 1
+        FEED_VIEWERS.inc()
+        return True
+
+    def release_viewer(self):
+        with self._cond:
+            self.viewers -= 1
+        FEED_VIEWERS.dec()
+
+    def wait(self, after_seq: int, timeout: float) -> int:
+        """Block until a frame newer than ``after_seq`` exists; returns the current seq."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq > after_seq, timeout)
+            return self.seq
+
+    def mjpeg(self, overlay: bool = False, max_fps: float = 0.0, idle_timeout: float = 30.0,
+              max_seconds: float = 0.0):
+        """Multipart generator for a Flask ``Response``.
+
+        Ends after ``idle_timeout`` seconds without frames, or ``max_seconds``
+        after it started. The caller holds the viewer slot (``acquire_viewer``).
+        """
+        min_gap = 1.0 / max_fps if max_fps > 0 else 0.0
+        label = 'yes' if overlay else 'no'
+        sent = 0
+        last_sent = 0.0
+        deadline = time.monotonic() + max_seconds if max_seconds > 0 else None
+        while True:
+            timeout = idle_timeout
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                timeout = min(timeout, remaining)
+            if self.wait(sent, timeout) <= sent:
+                return
+            if min_gap:
+                delay = last_sent + min_gap - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            seq, jpeg, _ = self.latest(overlay)
+            if not jpeg:
+                sent = seq
+                continue
+            sent = seq
+            last_sent = time.monotonic()
+            FEED_FRAMES_SENT.inc(overlay=label)
+            yield (
+                f'--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n'
+                f'Content-Length: {len(jpeg)}\r\nX-Frame-Seq: {seq}\r\n\r\n'
+            ).encode() + jpeg + b'\r\n'
+
+
+def read_mjpeg(stream):
+    """Yield ``(headers, jpeg_bytes)`` parts from a file-like MJPEG stream (used by viewers)."""
+    while True:
+        line = stream.readline()
+        if not line:
+            return
+        if not line.strip().startswith(b'--'):
+            continue
+        headers = {}
+        while True:
+            line = stream.readline()
+            if not line:
+                return
+            line = line.strip()
+            if not line:
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', '0'))
+        if length <= 0:
+            continue
+        data = stream.read(length)
+        if len(data) < length:
+            return
+        yield headers, data
@@ -0,0 +1,231 @@
+"""
+Versioned, delta-capable log views over the detection buffer.
+
+Every row appended to a ``columnar.DetectionColumns`` gets the next
+sequence number, so ``(first_seq, seq)`` (oldest retained row, next row)
+is a version for everything derived from the buffer. Log endpoints use it
+three ways:
+
+    ETag / If-None-Match   unchanged views answer 304 without building a body;
+                           full bodies are built (and gzipped) once per version
+    ?since=<seq>&first=<first_seq>
+                           only what changed since the client's X-Log-Seq and
+                           X-Log-First-Seq: raw rows appended since then, or the
+                           ranges / words from the last one the new rows may
+                           have extended; 304 when nothing changed
+    gzip                   bodies over LOG_GZIP_MIN_BYTES when the client accepts it
+
+Views:
+    raw         the buffered detection rows
+    compacted   ``stages.compact_ranges`` (same rows as compactedLog.json)
+    corrected   ``stages.correct_words`` (same rows as CorrectedLog.json)
+    runs        ``stages.compact_runs``: ranges with frame count and mean confidence
+    words       ``stages.decode_words``: confidence-aware decoding, with raw letters
+
+Response headers:
+    X-Log-Seq             pass back as ``since`` on the next poll
+    X-Log-First-Seq       oldest row still held by the server; pass back as ``first``
+    X-Log-Delta-Drop      delta responses only: drop this many leading entries
+                          (raw rows evicted from the buffer since the last poll)
+    X-Log-Delta-Replace   delta responses only: then drop this many trailing
+                          entries (0 or 1) from the previous result, and
+                          append the body.
+
+Full responses (no X-Log-Delta-* headers) are sent instead of a delta
+when ``since`` is older than the retained rows or newer than the
+server's sequence (restart), and, for every view but raw, when rows were
+evicted since the client's ``first`` (or ``first`` is missing and any
+row has been evicted).
+
+A body and its ETag / X-Log-Seq are read from the buffer under one lock.
+Delta responses are tagged ``<view>-since<N>[-from<F>]-<first>-<seq>`` so a
+cache never confuses them with the full view.
+
+Configuration (environment):
+    LOG_GZIP_MIN_BYTES   smallest body that is gzipped (default 1024)
+"""
+from __future__ import annotations
+
+import gzip
+import os
+import threading
+from contextlib import nullcontext
+
+import numpy as np
+from flask import Response, current_app, request
+
+import metrics
+import stages
+
+GZIP_MIN_BYTES = int(os.environ.get('LOG_GZIP_MIN_BYTES', '1024'))
+VIEWS = ('raw', 'compacted', 'corrected', 'runs', 'words')
+# Views whose entries are label runs; the others are words split at separators
+RUN_VIEWS = ('compacted', 'runs')
+
+LOG_RESPONSES = metrics.counter(
+    'log_responses_total', 'Log endpoint responses, by view and kind (full, delta, not_modified).', ('view', 'kind'),
+)
+LOG_BYTES = metrics.counter('log_response_bytes_total', 'Log endpoint body bytes sent, by view.', ('view',))
+
+
+class LogViews:
+    def __init__(self, buffer, lock=None):
+        self.buffer = buffer
+        self.lock = lock or nullcontext()
+        # view -> (version, raw json bytes, gzipped bytes or None)
+        self._full: dict[str, tuple] = {}
+        self._cache_lock = threading.Lock()
+
+    # ----- versions -----
+
+    def version(self) -> tuple[int, int]:
+        with self.lock:
+            return self.buffer.first_seq, self.buffer.seq
+
+    @staticmethod
+    def etag(view: str, version: tuple[int, int]) -> str:
+        return f'{view}-{version[0]}-{version[1]}'
+
+    # ----- payloads -----
+
+    @staticmethod
+    def derive(view: str, rows: list) -> list:
+        if view == 'raw':
+            return rows
+        if view == 'compacted':
+            return stages.compact_ranges(rows)
+        if view == 'corrected':
+            return stages.correct_words(stages.compact_ranges(rows))
+        if view == 'runs':
+            return stages.compact_runs(rows)
+        return stages.decode_words(stages.compact_runs(rows))
+
+    def full(self, view: str) -> list:
+        with self.lock:
+            rows = list(self.buffer)
+        return self.derive(view, rows)
+
+    def delta(self, view: str, since: int, client_first: int | None = None):
+        """
+        ``(entries, drop, replace, version)`` for rows from ``since`` on, or None when
+        a full response is needed. Rows and version are read under one lock.
+        """
+        with self.lock:
+            first, seq = self.buffer.first_seq, self.buffer.seq
+            # Rows the client saw are gone (or the server restarted): it needs everything again
+            if since < first or since > seq:
+                return None
+            if client_first is None:
+                # Without the client's first row an eviction cannot be told apart from none
+                if first > 0:
+                    return None
+                client_first = 0
+            drop = first - client_first
+            if drop < 0 or (drop and view != 'raw'):
+                # Ranges and words at the head change when rows are evicted
+                return None
+            if since == seq:
+                return [], drop, 0, (first, seq)
+            if view == 'raw':
+                return self.buffer.since(since), drop, 0, (first, seq)
+            if since == first:
+                start, replace = 0, 0
+            else:
+                last_seen = since - 1 - first
+                labels = self.buffer.columns()['label_id']
+                if view in RUN_VIEWS:
+                    # The run holding the client's last row may have grown
+                    boundaries = np.flatnonzero(labels[1:last_seen + 1] != labels[:last_seen]) + 1
+                    start = int(boundaries[-1]) if len(boundaries) else 0
+                    replace = 1
+                else:
+                    # The word holding the client's last row may have grown (or been re-decoded)
+                    separators = [
+                        i for i, name in enumerate(self.buffer.labels)
+                        if str(name).lower() in stages.SEPARATOR_LABELS
+                    ]
+                    is_sep = np.isin(labels[:last_seen + 1], separators)
+                    seps = np.flatnonzero(is_sep)
+                    start = int(seps[-1]) + 1 if len(seps) else 0
+                    replace = 0 if is_sep[last_seen] else 1
+            rows = self.buffer.since(first + start)
+        return self.derive(view, rows), 0, replace, (first, seq)
+
+    # ----- HTTP -----
+
+    def _encode(self, payload) -> bytes:
+        return current_app.json.dumps(payload).encode('utf-8')
+
+    def _respond(self, view: str, tag: str, kind: str, version, body: bytes, gz: bytes | None, extra=None) -> Response:
+        use_gzip = gz is not None and 'gzip' in request.accept_encodings
+        data = gz if use_gzip else body
+        response = Response(data, mimetype='application/json')
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.set_etag(self.etag(tag, version))
+        response.headers['X-Log-Seq'] = str(version[1])
+        response.headers['X-Log-First-Seq'] = str(version[0])
+        for key, value in (extra or {}).items():
+            response.headers[key] = value
+        LOG_RESPONSES.inc(view=view, kind=kind)
+        LOG_BYTES.inc(len(data), view=view)
+        return response
+
+    def _not_modified(self, view: str, tag: str, version) -> Response:
+        response = Response(status=304)
+        response.set_etag(self.etag(tag, version))
+        response.headers['X-Log-Seq'] = str(version[1])
+        response.headers['X-Log-First-Seq'] = str(version[0])
+        LOG_RESPONSES.inc(view=view, kind='not_modified')
+        return response
+
+    def response(self, view: str, limit: int = 0) -> Response:
+        """
+        Flask response for ``view`` honouring ``since``, If-None-Match and Accept-Encoding.
+
+        ``limit`` > 0 keeps only the newest ``limit`` entries of full and delta
+        payloads (``/detections?limit=``); such responses are not cached and get
+        their own ETags.
+        """
+        tag = f'{view}:limit{limit}' if limit > 0 else view
+        since = request.args.get('since')
+        if since not in (None, ''):
+            try:
+                since = int(since)
+                client_first = int(request.args['first']) if request.args.get('first') else None
+            except ValueError:
+                since = None
+            delta = self.delta(view, since, client_first) if since is not None else None
+            if delta is not None:
+                entries, drop, replace, version = delta
+                delta_tag = f'{tag}-since{since}' + (f'-from{client_first}' if client_first is not None else '')
+                if version[1] == since and not drop:
+                    return self._not_modified(view, delta_tag, version)
+                if limit > 0:
+                    entries = entries[-limit:]
+                body = self._encode(entries)
+                gz = gzip.compress(body, 5) if len(body) >= GZIP_MIN_BYTES else None
+                return self._respond(view, delta_tag, 'delta', version, body, gz,
+                                     {'X-Log-Delta-Drop': str(drop), 'X-Log-Delta-Replace': str(replace)})
+
+        # Version and rows come from one lock acquisition, so the body matches its ETag
+        rows = None
+        with self.lock:
+            version = self.buffer.first_seq, self.buffer.seq
+            if request.if_none_match.contains(self.etag(tag, version)):
+                return self._not_modified(view, tag, version)
+            with self._cache_lock:
+                cached = self._full.get(view) if limit <= 0 else None
+            if cached is None or cached[0] != version:
+                rows = list(self.buffer)
+        if rows is None:
+            return self._respond(view, tag, 'full', version, cached[1], cached[2])
+
+        payload = self.derive(view, rows)
+        body = self._encode(payload[-limit:] if limit > 0 else payload)
+        gz = gzip.compress(body, 5) if len(body) >= GZIP_MIN_BYTES else None
+        if limit <= 0:
+            with self._cache_lock:
+                self._full[view] = (version, body, gz)
+        return self._respond(view, tag, 'full', version, body, gz)
@@ -0,0 +1,258 @@
+"""
+Memory accounting, leak detection and budgets for long-running servers.
+
+Subsystems register a size function (bytes) and optionally an evict
+callback. A daemon monitor thread periodically samples process RSS and
+every subsystem, publishes them as metrics, takes ``tracemalloc``
+snapshots (when enabled) and enforces budgets: a subsystem over its own
+budget is asked to evict, and when process RSS stays above the hard
+budget ``should_shed()`` turns true so request handlers can return 503
+instead of growing until the OOM killer steps in.
+
+Configuration (environment):
+    MEMDIAG_INTERVAL           monitor period in seconds (default 10)
+    MEMDIAG_TRACEMALLOC        1 to enable tracemalloc snapshots
+    MEMDIAG_TRACEMALLOC_FRAMES traceback depth per allocation (default 5)
+    MEMORY_BUDGET_MB           hard RSS budget for the process (0 = off)
+    MEMORY_BUDGET_<NAME>_MB    per-subsystem budget, e.g. MEMORY_BUDGET_BUFFERS_MB
+"""
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from threading import Lock
+
+import metrics
+
+INTERVAL = float(os.environ.get('MEMDIAG_INTERVAL', '10'))
+TRACEMALLOC_ENABLED = os.environ.get('MEMDIAG_TRACEMALLOC', '0') == '1'
+TRACEMALLOC_FRAMES = int(os.environ.get('MEMDIAG_TRACEMALLOC_FRAMES', '5'))
+RSS_BUDGET = int(float(os.environ.get('MEMORY_BUDGET_MB', '0')) * 1024 * 1024)
+TOP_N = 15
+
+RSS_BYTES = metrics.gauge('process_rss_bytes', 'Resident set size of the server process.')
+SUBSYSTEM_BYTES = metrics.gauge(
+    'memory_subsystem_bytes', 'Estimated bytes held per subsystem.', ('subsystem',)
+)
+EVICTIONS_TOTAL = metrics.counter(
+    'memory_evictions_total', 'Budget-triggered evictions.', ('subsystem',)
+)
+SHED_TOTAL = metrics.counter('memory_shed_total', 'Requests rejected because of the memory budget.')
+
+_subsystems: dict[str, dict] = {}
+_lock = Lock()
+_state = {
+    'shedding': False,
+    'last_sample': None,
+    'snapshot': None,
+    'snapshot_at': None,
+    'top_diffs': [],
+}
+_monitor_thread = None
+
+
+def rss_bytes() -> int:
+    """Current resident set size; falls back to peak RSS where /proc is unavailable."""
+    try:
+        import psutil
+        return int(psutil.Process().memory_info().rss)
+    except Exception:
+        pass
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        return int(peak if sys.platform == 'darwin' else peak * 1024)
+    except Exception:
+        return 0
+
+
+def deep_sizeof(obj, _depth: int = 0) -> int:
+    """Approximate size of plain containers (dicts/lists/tuples/deques of scalars)."""
+    size = sys.getsizeof(obj)
+    if _depth > 3:
+        return size
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += deep_sizeof(k, _depth + 1) + deep_sizeof(v, _depth + 1)
+    elif isinstance(obj, (list, tuple, set, frozenset)) or type(obj).__name__ == 'deque':
+        for item in obj:
+            size += deep_sizeof(item, _depth + 1)
+    return size
+
+
+def register(name: str, size_fn, evict_fn=None, budget_bytes: int | None = None):
+    """
+    Register a subsystem for accounting.
+
+    ``size_fn()`` returns bytes held; ``evict_fn()`` frees some of it and
+    returns a short description (or None). The budget defaults to
+    MEMORY_BUDGET_<NAME>_MB.
+    """
+    if budget_bytes is None:
+        env = os.environ.get(f'MEMORY_BUDGET_{name.upper()}_MB', '0')
+        budget_bytes = int(float(env) * 1024 * 1024)
+    with _lock:
+        _subsystems[name] = {'size_fn': size_fn, 'evict_fn': evict_fn, 'budget': budget_bytes}
+
+
+class InflightBytes:
+    """Thread-safe gauge for transient allocations such as decoded frames."""
+
+    def __init__(self):
+        self._bytes = 0
+        self._lock = Lock()
+
+    def add(self, n: int):
+        with self._lock:
+            self._bytes += n
+
+    def sub(self, n: int):
+        with self._lock:
+            self._bytes -= n
+
+    def __call__(self) -> int:
+        return self._bytes
+
+
+def _evict(name: str, entry: dict) -> str | None:
+    if entry['evict_fn'] is None:
+        return None
+    try:
+        note = entry['evict_fn']()
+    except Exception as e:
+        print(f"WARNING: memory eviction for {name} failed: {e}")
+        return None
+    EVICTIONS_TOTAL.inc(subsystem=name)
+    print(f"[memdiag] evicted from {name}: {note}")
+    return note
+
+
+def sample() -> dict:
+    """Measure RSS and subsystems, enforce budgets and return the readings."""
+    with _lock:
+        items = list(_subsystems.items())
+    sizes = {}
+    for name, entry in items:
+        try:
+            size = int(entry['size_fn']())
+        except Exception:
+            size = -1
+        sizes[name] = size
+        SUBSYSTEM_BYTES.set(size, subsystem=name)
+        if entry['budget'] and size > entry['budget']:
+            _evict(name, entry)
+
+    rss = rss_bytes()
+    RSS_BYTES.set(rss)
+    shedding = False
+    if RSS_BUDGET and rss > RSS_BUDGET:
+        # Over the hard budget: evict everything that can be evicted, then shed if still over
+        for name, entry in items:
+            _evict(name, entry)
+        rss = rss_bytes()
+        shedding = rss > RSS_BUDGET
+    if shedding != _state['shedding']:
+        print(f"[memdiag] load shedding {'ON' if shedding else 'OFF'} (rss={rss / 1048576:.1f}MB)")
+    reading = {
+        'timestamp': time.time(),
+        'rss_bytes': rss,
+        'rss_budget_bytes': RSS_BUDGET,
+        'subsystems': {
+            name: {'bytes': sizes[name], 'budget_bytes': entry['budget']}
+            for name, entry in items
+        },
+        'shedding': shedding,
+    }
+    with _lock:
+        _state['shedding'] = shedding
+        _state['last_sample'] = reading
+    return reading
+
+
+def should_shed() -> bool:
+    if _state['shedding']:
+        SHED_TOTAL.inc()
+        return True
+    return False
+
+
+def take_snapshot(limit: int = TOP_N) -> list[dict]:
+    """Take a tracemalloc snapshot and diff it against the previous one."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    with _lock:
+        previous = _state['snapshot']
+    if previous is None:
+        stats = snapshot.statistics('lineno')[:limit]
+        diffs = [
+            {'location': str(s.traceback), 'size_bytes': s.size, 'size_diff_bytes': s.size, 'count': s.count}
+            for s in stats
+        ]
+    else:
+        stats = snapshot.compare_to(previous, 'lineno')[:limit]
+        diffs = [
+            {
+                'location': str(s.traceback),
+                'size_bytes': s.size,
+                'size_diff_bytes': s.size_diff,
+                'count': s.count,
+                'count_diff': s.count_diff,
+            }
+            for s in stats
+        ]
+    with _lock:
+        _state['snapshot'] = snapshot
+        _state['snapshot_at'] = time.time()
+        _state['top_diffs'] = diffs
+    return diffs
+
+
+def report() -> dict:
+    with _lock:
+        last = _state['last_sample']
+        diffs = list(_state['top_diffs'])
+        snapshot_at = _state['snapshot_at']
+    return {
+        'memory': last or sample(),
+        'tracemalloc': {
+            'enabled': tracemalloc.is_tracing(),
+            'snapshot_at': snapshot_at,
+            'top_diffs': diffs,
+        },
+    }
+
+
+def _monitor_loop():
+    while True:
+        try:
+            sample()
+            if TRACEMALLOC_ENABLED:
+                take_snapshot()
+        except Exception as e:
+            print(f"WARNING: memory monitor failed: {e}")
+        time.sleep(INTERVAL)
+
+
+def start_monitor():
+    """Start the background monitor once per process."""
+    global _monitor_thread
+    if _monitor_thread is not None and _monitor_thread.is_alive():
+        return
+    if TRACEMALLOC_ENABLED and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    _monitor_thread = threading.Thread(target=_monitor_loop, name='memdiag-monitor', daemon=True)
+    _monitor_thread.start()
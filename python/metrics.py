@@ -0,0 +1,327 @@
+"""
+Lightweight in-process metrics exposed in Prometheus text format.
+
+Counters, gauges and histograms are plain Python objects guarded by a lock,
+so recording a sample costs a dict lookup and a few additions. Both Flask
+servers import this module and serve ``render()`` from ``/metrics``.
+
+Session ids come from clients, so a ``session`` label is bounded: the
+``METRICS_MAX_SESSIONS`` most recently seen sessions get their own series,
+and any further session is counted under ``other``. A session idle for
+``METRICS_SESSION_IDLE_S`` gives its place to a new one, and its series
+are dropped.
+
+Configuration (environment):
+    METRICS_MAX_SESSIONS     sessions with their own label value (default 50)
+    METRICS_SESSION_IDLE_S   idle time after which a session's series can be replaced (default 600)
+"""
+from __future__ import annotations
+
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from threading import Lock
+
+NAMESPACE = 'sparthack'
+MAX_SESSIONS = int(os.environ.get('METRICS_MAX_SESSIONS', '50'))
+SESSION_IDLE_S = float(os.environ.get('METRICS_SESSION_IDLE_S', '600'))
+OTHER_SESSION = 'other'
+
+# Seconds; tuned for per-frame stages (sub-millisecond decode up to multi-second Gemini calls)
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+_registry: list = []
+_registry_lock = Lock()
+# session -> last seen (monotonic), least recently seen first
+_sessions: OrderedDict = OrderedDict()
+_sessions_lock = Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(val)}"' for name, val in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = f'{NAMESPACE}_{name}'
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = Lock()
+        self._values: dict = {}
+
+    def _key(self, labels: dict, record: bool = True) -> tuple:
+        if 'session' in labels:
+            labels = dict(labels, session=session_label(str(labels['session']), record))
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def forget(self, name: str, value: str):
+        """Drop every series whose label ``name`` equals ``value``."""
+        if name not in self.labelnames:
+            return
+        index = self.labelnames.index(name)
+        with self._lock:
+            for key in [k for k in self._values if k[index] == value]:
+                del self._values[key]
+
+    def header(self) -> list[str]:
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+
+    def collect(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        lines = self.header()
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels, record=False), 0.0)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels, record=False), 0.0)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [per-bucket counts..., sum, count]
+                state = [0] * len(self.buckets) + [0.0, 0]
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self, **labels) -> dict:
+        """Return ``{'count', 'sum', 'buckets'}`` for one label set (cumulative buckets)."""
+        with self._lock:
+            state = list(self._values.get(self._key(labels, record=False)) or [0] * len(self.buckets) + [0.0, 0])
+        cumulative = []
+        running = 0
+        for bound, n in zip(self.buckets, state[:-2]):
+            running += n
+            cumulative.append((bound, running))
+        return {'count': state[-1], 'sum': state[-2], 'buckets': cumulative}
+
+    def collect(self) -> list[str]:
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = self.header()
+        for key, state in items:
+            running = 0
+            for bound, n in zip(self.buckets, state[:-2]):
+                running += n
+                le = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f'{self.name}_bucket{le} {running}')
+            le = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{le} {state[-1]}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(state[-2])}')
+            lines.append(f'{self.name}_count{labels} {state[-1]}')
+        return lines
+
+
+def _register(metric):
+    with _registry_lock:
+        for existing in _registry:
+            if existing.name == metric.name:
+                return existing
+        _registry.append(metric)
+    return metric
+
+
+def counter(name: str, help_text: str, labelnames: tuple = ()) -> Counter:
+    return _register(Counter(name, help_text, labelnames))
+
+
+def gauge(name: str, help_text: str, labelnames: tuple = ()) -> Gauge:
+    return _register(Gauge(name, help_text, labelnames))
+
+
+def histogram(name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help_text, labelnames, buckets))
+
+
+def render() -> str:
+    """Render every registered metric in Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def session_label(session: str, record: bool = True) -> str:
+    """The ``session`` label value for ``session``: itself while it has a place, else ``other``."""
+    evicted = None
+    with _sessions_lock:
+        now = time.monotonic()
+        if session in _sessions:
+            if record:
+                _sessions[session] = now
+                _sessions.move_to_end(session)
+            return session
+        if not record:
+            return OTHER_SESSION
+        if len(_sessions) >= MAX_SESSIONS:
+            oldest, seen = next(iter(_sessions.items()), (None, now))
+            if oldest is None or now - seen < SESSION_IDLE_S:
+                return OTHER_SESSION
+            del _sessions[oldest]
+            evicted = oldest
+        _sessions[session] = now
+    if evicted is not None:
+        with _registry_lock:
+            registered = list(_registry)
+        for metric in registered:
+            metric.forget('session', evicted)
+    return session
+
+
+# ----- Shared metrics used by both servers -----
+
+REQUEST_SECONDS = histogram(
+    'http_request_duration_seconds',
+    'End-to-end request latency.',
+    ('endpoint', 'method', 'status'),
+)
+REQUESTS_TOTAL = counter(
+    'http_requests_total',
+    'Requests handled.',
+    ('endpoint', 'method', 'status'),
+)
+STAGE_SECONDS = histogram(
+    'frame_stage_duration_seconds',
+    'Time spent in each stage of a frame\'s life.',
+    ('endpoint', 'session', 'stage'),
+)
+FRAMES_TOTAL = counter(
+    'frames_received_total',
+    'Frames accepted for processing.',
+    ('endpoint', 'session'),
+)
+ANALYZE_SECONDS = histogram(
+    'analyze_duration_seconds',
+    'Round-trip latency of /analyze calls.',
+    ('outcome',),
+)
+
+
+@contextmanager
+def stage(name: str, endpoint: str, session: str = 'default'):
+    """Time a block as one stage of frame processing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, session=session, stage=name)
+
+
+def session_from_request(req) -> str:
+    """
+    Resolve the capture session a request belongs to.
+
+    Clients may send ``X-Session-Id`` or a ``session`` form/query field.
+    Requests without one are keyed per client (``client-<addr>``, taken
+    from the first ``X-Forwarded-For`` hop or the peer address) so that
+    admission shares, autotune strides and router placement never pool
+    unrelated clients; only a request with no address at all falls back
+    to ``default``.
+    """
+    try:
+        value = (
+            req.headers.get('X-Session-Id')
+            or req.args.get('session')
+            or (req.form.get('session') if req.method == 'POST' else None)
+        )
+    except Exception:
+        value = None
+    value = (value or '').strip()[:64]
+    if value:
+        return value
+    return _client_key(req)
+
+
+def _client_key(req) -> str:
+    try:
+        forwarded = req.headers.get('X-Forwarded-For', '')
+        addr = forwarded.split(',')[0].strip() or req.remote_addr
+    except Exception:
+        addr = None
+    return f'client-{addr}'[:64] if addr else 'default'
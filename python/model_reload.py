@@ -0,0 +1,267 @@
+"""
+Hot reload of YOLO weights without dropping frames.
+
+A server keeps its model in a ``ModelSlot`` instead of a module global.
+Inference borrows the current model for exactly one predict call
+(``with slot.acquire() as handle``). ``reload()`` does the slow work on a
+background thread while the old model keeps serving:
+
+    load      YOLO(weights)                       timed
+    warm-up   one predict on a blank frame        timed (the first inference is the slow one)
+    swap      replaces the current model under a lock, so every frame
+              runs entirely on the old or entirely on the new weights
+    free      the old model is released once its last borrowed predict returns
+              (``ModelHandle.release``, so handles callers still hold do not pin it)
+
+A failed load or warm-up leaves the old model serving. Durations and
+outcomes go to ``model_reload_seconds{phase}`` / ``model_reloads_total{outcome}``,
+are printed, and are kept in ``stats()['last_reload']``.
+
+A reload is triggered by ``POST /admin/model/reload`` or by a
+``WeightsWatcher`` that polls the weights file. The watcher reloads only
+after the file has stopped changing for one interval, so a half-copied
+file is never loaded. Each process owns its own slot; under gunicorn the
+watcher runs in every worker, while the admin endpoint reloads only the
+worker that handled the request.
+
+Configuration (environment):
+    MODEL_WATCH_INTERVAL_S   poll YOLO_WEIGHTS for changes this often; 0 disables (default 0)
+"""
+from __future__ import annotations
+
+import gc
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+import cascade
+import metrics
+import stages
+
+RELOAD_SECONDS = metrics.histogram(
+    'model_reload_seconds', 'Time spent per model reload phase (load, warmup).', ('phase',),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+RELOADS = metrics.counter('model_reloads_total', 'Model reloads, by outcome (swapped, failed).', ('outcome',))
+MODEL_GENERATION = metrics.gauge('model_generation', 'Generation of the model currently serving (0 = startup).')
+
+
+class ReloadInProgress(Exception):
+    pass
+
+
+class ModelSlot:
+    def __init__(self, handle, loader=None, on_swap=None):
+        """
+        ``handle`` is the startup ``stages.ModelHandle`` (or ``cascade.Cascade``, or None);
+        ``loader(path)`` returns a loaded model; ``on_swap(handle)`` runs after each swap.
+        """
+        self.loader = loader
+        self.on_swap = on_swap
+        self._handle = handle
+        self._generation = 0
+        self._loaded_at = datetime.now().isoformat() if handle is not None else None
+        self._inflight: dict[int, int] = {}
+        self._retired: dict[int, object] = {}
+        self._lock = threading.Lock()
+        self._reloading: str | None = None
+        self._last_reload: dict | None = None
+        MODEL_GENERATION.set(0)
+
+    @property
+    def current(self):
+        return self._handle
+
+    # ----- borrowing -----
+
+    def acquire(self):
+        return _Borrow(self)
+
+    def _borrow(self):
+        with self._lock:
+            generation = self._generation
+            self._inflight[generation] = self._inflight.get(generation, 0) + 1
+            return generation, self._handle
+
+    def _return(self, generation: int):
+        freed = None
+        with self._lock:
+            self._inflight[generation] -= 1
+            if self._inflight[generation] == 0:
+                del self._inflight[generation]
+                freed = self._retired.pop(generation, None)
+        if freed is not None:
+            self._free(generation, freed)
+
+    def _free(self, generation: int, handle):
+        # Borrowers' locals (``with slot.acquire() as handle``) outlive the borrow, so
+        # release the model from the handle itself rather than relying on refcounts
+        if isinstance(handle, cascade.Cascade):
+            handle.full.release()   # the fast model is shared with the new cascade
+        else:
+            handle.release()
+        del handle
+        gc.collect()
+        torch = sys.modules.get('torch')
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        print(f"Model generation {generation} freed")
+
+    # ----- reloading -----
+
+    def reload(self, weights=None, wait: bool = False) -> threading.Thread | None:
+        """Load ``weights`` (default: the current weights again) in the background and swap it in."""
+        if self.loader is None:
+            raise RuntimeError('model loading unavailable')
+        current = self._handle
+        if weights is None:
+            if current is None:
+                raise ValueError('no weights given and no model loaded')
+            weights = current.weights
+        with self._lock:
+            if self._reloading is not None:
+                raise ReloadInProgress(self._reloading)
+            self._reloading = str(weights)
+        thread = threading.Thread(target=self._reload, args=(str(weights),), name='model-reload', daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return thread
+
+    def _reload(self, weights: str):
+        record = {'weights': weights, 'started': datetime.now().isoformat()}
+        try:
+            if not Path(weights).exists():
+                raise FileNotFoundError(f'weights not found: {weights}')
+            started = time.perf_counter()
+            full = stages.ModelHandle(weights, self.loader(weights))
+            record['load_seconds'] = round(time.perf_counter() - started, 3)
+            RELOAD_SECONDS.observe(record['load_seconds'], phase='load')
+
+            started = time.perf_counter()
+            size = full.input_size
+            stages.predict(full, np.zeros((size, size, 3), dtype=np.uint8), 0.5, 0.5, 1)
+            record['warmup_seconds'] = round(time.perf_counter() - started, 3)
+            RELOAD_SECONDS.observe(record['warmup_seconds'], phase='warmup')
+
+            current = self._handle
+            if isinstance(current, cascade.Cascade):
+                # Keep the (unchanged) fast model and thresholds in front of the new weights
+                handle = cascade.Cascade(current.fast, full, current.accept_conf, current.empty_conf)
+            else:
+                handle = full
+            del current
+            freed = None
+            with self._lock:
+                old_generation, old = self._generation, self._handle
+                self._handle = handle
+                self._generation += 1
+                self._loaded_at = datetime.now().isoformat()
+                if old is not None and self._inflight.get(old_generation):
+                    self._retired[old_generation] = old
+                else:
+                    freed = old
+                del old
+                record['generation'] = self._generation
+            MODEL_GENERATION.set(record['generation'])
+            if self.on_swap is not None:
+                self.on_swap(handle)
+            record['status'] = 'swapped'
+            RELOADS.inc(outcome='swapped')
+            print(f"Model reloaded: {weights} (load {record['load_seconds']}s, warm-up {record['warmup_seconds']}s, "
+                  f"generation {record['generation']})")
+            if freed is not None:
+                self._free(old_generation, freed)
+        except Exception as e:
+            record['status'] = 'failed'
+            record['error'] = str(e)
+            RELOADS.inc(outcome='failed')
+            print(f"WARNING: Model reload from {weights} failed, keeping the current model: {e}")
+        finally:
+            with self._lock:
+                self._reloading = None
+                self._last_reload = record
+
+    def stats(self) -> dict:
+        with self._lock:
+            handle = self._handle
+            return {
+                'weights': handle.weights if handle is not None else None,
+                'generation': self._generation,
+                'loaded_at': self._loaded_at,
+                'in_flight': {str(g): n for g, n in self._inflight.items()},
+                'retired': sorted(self._retired),
+                'reloading': self._reloading,
+                'last_reload': self._last_reload,
+            }
+
+
+class _Borrow:
+    def __init__(self, slot: ModelSlot):
+        self._slot = slot
+
+    def __enter__(self):
+        self._generation, handle = self._slot._borrow()
+        return handle
+
+    def __exit__(self, *exc):
+        self._slot._return(self._generation)
+        return False
+
+
+class WeightsWatcher:
+    """Reload a slot when the weights file changes (polling mtime and size)."""
+
+    def __init__(self, slot: ModelSlot, path, interval: float):
+        self.slot = slot
+        self.path = Path(path)
+        self.interval = interval
+        self._started_pid = None
+
+    def _signature(self):
+        try:
+            st = self.path.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def start(self):
+        # Threads do not survive fork; called again in each worker
+        if self.interval <= 0 or self._started_pid == os.getpid():
+            return
+        self._started_pid = os.getpid()
+        threading.Thread(target=self._run, name='weights-watcher', daemon=True).start()
+
+    def _run(self):
+        seen = self._signature()
+        pending = None
+        while True:
+            time.sleep(self.interval)
+            signature = self._signature()
+            if signature is None or signature == seen:
+                pending = None
+                continue
+            if signature != pending:
+                # Changed since the last poll: wait until it stops changing
+                pending = signature
+                continue
+            seen, pending = signature, None
+            print(f"Weights changed on disk: {self.path}")
+            try:
+                self.slot.reload(self.path)
+            except ReloadInProgress:
+                seen = None     # retry on the next poll
+            except Exception as e:
+                print(f"WARNING: Could not start model reload: {e}")
+
+
+def watcher_from_env(slot: ModelSlot, path) -> WeightsWatcher | None:
+    interval = float(os.environ.get('MODEL_WATCH_INTERVAL_S', '0'))
+    if interval <= 0 or slot.loader is None:
+        return None
+    return WeightsWatcher(slot, path, interval)
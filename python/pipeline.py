@@ -0,0 +1,338 @@
+"""
+Small stage-graph pipeline engine shared by both servers and offline tools.
+
+A pipeline is an ordered list of ``Stage``s. Each stage declares the
+context keys it reads (``inputs``) and the keys it produces
+(``outputs``); ``Pipeline`` checks that every input is produced upstream
+or supplied by the caller. Items are plain dicts flowing through the
+stages.
+
+Each stage runs on one of three executors:
+
+    inline    in whichever thread delivered the item (no hand-off cost)
+    thread    ``workers`` threads consuming the stage's bounded queue
+    process   as ``thread``, but the stage function runs in a shared
+              process pool (function and inputs must be picklable). Only
+              stages declared ``process_safe`` may: their function must
+              not read or change module state, since a pool process has
+              its own copy of it
+
+Between a non-inline stage and its producer sits a bounded queue
+(``queue_size``), so a slow stage applies backpressure instead of
+buffering without limit. Non-inline stages can batch: a worker collects
+up to ``batch_size`` items (waiting at most ``batch_wait`` seconds) and
+hands them to ``batch_fn`` in one call, e.g. one batched YOLO predict.
+
+A stage function takes the input values as keyword arguments and returns a
+dict of outputs, or ``STOP`` to end processing of that item. Every stage
+is timed into ``metrics.STAGE_SECONDS`` (endpoint = pipeline name).
+
+Executors are tuned in one place, the environment, per pipeline and stage:
+
+    PIPELINE_DETECT_FRAME="predict=thread:2:batch=4,log_write=inline"
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+
+import metrics
+
+EXECUTORS = ('inline', 'thread', 'process')
+
+PIPELINE_QUEUE = metrics.gauge('pipeline_queue_depth', 'Items waiting in front of a pipeline stage.', ('pipeline', 'stage'))
+PIPELINE_ITEMS = metrics.counter('pipeline_items_total', 'Items finished by a pipeline, by outcome.', ('pipeline', 'outcome'))
+PIPELINE_BATCH = metrics.histogram(
+    'pipeline_batch_size', 'Items per batched stage call.', ('pipeline', 'stage'),
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+
+
+class _Stop:
+    def __repr__(self):
+        return 'STOP'
+
+
+STOP = _Stop()
+
+
+class PipelineBusy(Exception):
+    """A bounded stage queue stayed full for longer than the submit timeout."""
+
+
+class PipelineError(Exception):
+    """Invalid pipeline definition."""
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable | None
+    inputs: tuple = ()
+    outputs: tuple = ()
+    executor: str = 'inline'
+    workers: int = 1
+    queue_size: int = 32
+    batch_size: int = 1
+    batch_wait: float = 0.005
+    batch_fn: Callable | None = None    # list of input dicts -> list of output dicts
+    process_safe: bool = False          # pure function of its inputs: may run in a process pool
+    _queue: queue.Queue | None = field(default=None, repr=False)
+
+    def __post_init__(self):
+        self.inputs = tuple(self.inputs)
+        self.outputs = tuple(self.outputs)
+        self._check_executor(self.name)
+
+    def _check_executor(self, where: str):
+        if self.executor not in EXECUTORS:
+            raise PipelineError(f'{where}: unknown executor {self.executor!r}')
+        if self.executor == 'process' and not self.process_safe:
+            raise PipelineError(f'{where}: stage is not process_safe (it uses module state) and cannot run in a process pool')
+
+
+def _call(fn, kwargs: dict):
+    # Module-level so it can be shipped to a process pool
+    return fn(**kwargs)
+
+
+def _call_batch(fn, batch: list[dict]):
+    return fn(batch)
+
+
+def parse_executor_spec(spec: str) -> dict[str, dict]:
+    """``"predict=thread:2:batch=4,log=inline"`` -> ``{'predict': {'executor': 'thread', 'workers': 2, 'batch_size': 4}, ...}``"""
+    settings: dict[str, dict] = {}
+    for part in (p.strip() for p in spec.split(',')):
+        if not part:
+            continue
+        name, _, value = part.partition('=')
+        fields = value.split(':')
+        conf: dict = {'executor': fields[0]}
+        for extra in fields[1:]:
+            if extra.isdigit():
+                conf['workers'] = int(extra)
+            elif extra.startswith('batch='):
+                conf['batch_size'] = int(extra[len('batch='):])
+            elif extra.startswith('queue='):
+                conf['queue_size'] = int(extra[len('queue='):])
+            elif extra.startswith('wait='):
+                conf['batch_wait'] = float(extra[len('wait='):]) / 1000.0
+        settings[name.strip()] = conf
+    return settings
+
+
+class Pipeline:
+    def __init__(self, name: str, stages: list[Stage], provided: tuple = (), submit_timeout: float = 5.0):
+        self.name = name
+        self.stages = list(stages)
+        self.provided = tuple(provided)
+        self.submit_timeout = submit_timeout
+        self._process_pool: ProcessPoolExecutor | None = None
+        self._started_pid = None
+        self._start_lock = threading.Lock()
+        self.configure(parse_executor_spec(os.environ.get(f"PIPELINE_{name.upper().replace('-', '_')}", '')))
+        self._validate()
+
+    # ----- definition -----
+
+    def _validate(self):
+        available = set(self.provided)
+        seen = set()
+        for st in self.stages:
+            if st.name in seen:
+                raise PipelineError(f'{self.name}: duplicate stage {st.name!r}')
+            seen.add(st.name)
+            missing = [key for key in st.inputs if key not in available]
+            if missing:
+                raise PipelineError(f'{self.name}.{st.name}: inputs {missing} are not produced upstream')
+            available.update(st.outputs)
+
+    def configure(self, settings: dict[str, dict]):
+        """Override executor/workers/batching per stage (before the first item is submitted)."""
+        by_name = {st.name: st for st in self.stages}
+        for name, conf in settings.items():
+            st = by_name.get(name)
+            if st is None:
+                print(f"WARNING: pipeline {self.name}: no stage named {name!r} to configure")
+                continue
+            for key, value in conf.items():
+                setattr(st, key, value)
+            st._check_executor(f'{self.name}.{name}')
+        return self
+
+    def describe(self) -> list[dict]:
+        return [
+            {
+                'stage': st.name,
+                'inputs': list(st.inputs),
+                'outputs': list(st.outputs),
+                'executor': st.executor,
+                'process_safe': st.process_safe,
+                'workers': st.workers if st.executor != 'inline' else None,
+                'batch_size': st.batch_size if st.executor != 'inline' else None,
+                'queued': st._queue.qsize() if st._queue is not None else 0,
+            }
+            for st in self.stages
+        ]
+
+    @property
+    def all_inline(self) -> bool:
+        return all(st.executor == 'inline' for st in self.stages)
+
+    # ----- workers -----
+
+    def _ensure_started(self):
+        # Threads do not survive fork; a forked worker starts its own
+        if self.all_inline or self._started_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            if any(st.executor == 'process' for st in self.stages):
+                procs = max(st.workers for st in self.stages if st.executor == 'process')
+                self._process_pool = ProcessPoolExecutor(max_workers=procs)
+            for index, st in enumerate(self.stages):
+                if st.executor == 'inline':
+                    continue
+                st._queue = queue.Queue(maxsize=max(1, st.queue_size))
+                for n in range(max(1, st.workers)):
+                    threading.Thread(
+                        target=self._worker, args=(index,), name=f'{self.name}-{st.name}-{n}', daemon=True,
+                    ).start()
+            self._started_pid = os.getpid()
+
+    def _worker(self, index: int):
+        st = self.stages[index]
+        while True:
+            batch = [st._queue.get()]
+            if st.batch_size > 1:
+                deadline = time.monotonic() + st.batch_wait
+                while len(batch) < st.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(st._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+            PIPELINE_QUEUE.dec(len(batch), pipeline=self.name, stage=st.name)
+            if len(batch) == 1:
+                ctx, future = batch[0]
+                self._continue(ctx, future, index, claimed=True)
+                continue
+            PIPELINE_BATCH.observe(len(batch), pipeline=self.name, stage=st.name)
+            try:
+                outs = self._execute_batch(st, [ctx for ctx, _ in batch])
+            except Exception as exc:
+                for ctx, future in batch:
+                    self._fail(future, exc)
+                continue
+            for (ctx, future), out in zip(batch, outs):
+                try:
+                    proceed = self._apply(ctx, out, future)
+                except Exception as exc:
+                    self._fail(future, exc)
+                    continue
+                if proceed:
+                    self._continue(ctx, future, index + 1)
+
+    # ----- execution -----
+
+    def _execute(self, st: Stage, ctx: dict):
+        kwargs = {key: ctx[key] for key in st.inputs}
+        with metrics.stage(st.name, self.name, ctx.get('session', 'default')):
+            if st.fn is None:
+                # Batch-only stage handling a single item
+                if st.executor == 'process':
+                    return self._process_pool.submit(_call_batch, st.batch_fn, [kwargs]).result()[0]
+                return st.batch_fn([kwargs])[0]
+            if st.executor == 'process':
+                return self._process_pool.submit(_call, st.fn, kwargs).result()
+            return st.fn(**kwargs)
+
+    def _execute_batch(self, st: Stage, ctxs: list[dict]) -> list:
+        batch = [{key: ctx[key] for key in st.inputs} for ctx in ctxs]
+        started = time.perf_counter()
+        if st.batch_fn is not None:
+            if st.executor == 'process':
+                outs = self._process_pool.submit(_call_batch, st.batch_fn, batch).result()
+            else:
+                outs = st.batch_fn(batch)
+        else:
+            outs = [self._execute(st, ctx) for ctx in ctxs]
+            return outs
+        # Attribute the batch time evenly so per-frame stage histograms stay comparable
+        share = (time.perf_counter() - started) / len(ctxs)
+        for ctx in ctxs:
+            metrics.STAGE_SECONDS.observe(share, endpoint=self.name, session=ctx.get('session', 'default'), stage=st.name)
+        return outs
+
+    def _apply(self, ctx: dict, out, future: Future | None) -> bool:
+        """Merge a stage result into the context; False when the item is finished."""
+        if out is STOP:
+            ctx['stopped'] = True
+            PIPELINE_ITEMS.inc(pipeline=self.name, outcome='stopped')
+            if future is not None:
+                future.set_result(ctx)
+            return False
+        if out is not None and not isinstance(out, dict):
+            raise PipelineError(f'{self.name}: stage returned {type(out).__name__}, expected a dict or STOP')
+        if out:
+            ctx.update(out)
+        return True
+
+    def _fail(self, future: Future | None, exc: Exception):
+        PIPELINE_ITEMS.inc(pipeline=self.name, outcome='error')
+        if future is None:
+            raise exc
+        future.set_exception(exc)
+
+    def _continue(self, ctx: dict, future: Future | None, index: int, claimed: bool = False):
+        """
+        Run stages from ``index`` in this thread until one needs a hand-off.
+
+        ``claimed`` means the caller is a worker of stage ``index`` and runs it itself.
+        """
+        while index < len(self.stages):
+            st = self.stages[index]
+            if st.executor != 'inline' and not claimed:
+                try:
+                    st._queue.put((ctx, future), timeout=self.submit_timeout)
+                except queue.Full:
+                    self._fail(future, PipelineBusy(f'{self.name}.{st.name} queue full'))
+                    return
+                PIPELINE_QUEUE.inc(pipeline=self.name, stage=st.name)
+                return
+            try:
+                out = self._execute(st, ctx)
+                if not self._apply(ctx, out, future):
+                    return
+            except Exception as exc:
+                self._fail(future, exc)
+                return
+            index += 1
+            claimed = False
+        PIPELINE_ITEMS.inc(pipeline=self.name, outcome='done')
+        if future is not None:
+            future.set_result(ctx)
+
+    def submit(self, ctx: dict) -> Future:
+        """Start an item; leading inline stages run in the caller's thread."""
+        self._ensure_started()
+        future: Future = Future()
+        self._continue(dict(ctx), future, 0)
+        return future
+
+    def run(self, ctx: dict, timeout: float | None = None) -> dict:
+        """Process one item and return its final context (raises the first stage error)."""
+        if self.all_inline:
+            ctx = dict(ctx)
+            self._continue(ctx, None, 0)
+            return ctx
+        return self.submit(ctx).result(timeout)
@@ -0,0 +1,149 @@
+"""
+On-demand profiling for the running server.
+
+``sample_stacks`` walks every thread's Python stack with
+``sys._current_frames()`` at a fixed interval and returns collapsed stacks
+(``frame;frame;frame count`` per line) that flamegraph.pl or speedscope
+read directly. ``RequestProfiler`` wraps a single request in ``cProfile``
+and keeps the last few reports in memory.
+"""
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from itertools import count
+from threading import Lock
+
+MAX_PROFILE_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', '60'))
+MIN_INTERVAL_SECONDS = 0.001
+MAX_STACK_DEPTH = 128
+
+_sampling_lock = Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _collapse(frame, thread_name: str) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.append(thread_name)
+    # Collapsed format is root-first and uses ';' as the separator
+    return ';'.join(name.replace(';', ':') for name in reversed(names))
+
+
+def sample_stacks(seconds: float, interval: float = 0.01) -> tuple[str, dict]:
+    """
+    Sample all thread stacks for ``seconds`` and return collapsed stacks.
+
+    Returns ``(collapsed_text, summary)``. Raises ProfilerBusy if another
+    sampling run is already in progress.
+    """
+    seconds = max(0.0, min(float(seconds), MAX_PROFILE_SECONDS))
+    interval = max(MIN_INTERVAL_SECONDS, float(interval))
+    if not _sampling_lock.acquire(blocking=False):
+        raise ProfilerBusy('a sampling profile is already running')
+    try:
+        me = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        deadline = time.perf_counter() + seconds
+        started = time.perf_counter()
+        while time.perf_counter() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stacks[_collapse(frame, names.get(ident, f'thread-{ident}'))] += 1
+            samples += 1
+            time.sleep(interval)
+        elapsed = time.perf_counter() - started
+    finally:
+        _sampling_lock.release()
+
+    lines = [f'{stack} {n}' for stack, n in stacks.most_common()]
+    summary = {
+        'seconds': round(elapsed, 3),
+        'interval': interval,
+        'samples': samples,
+        'unique_stacks': len(stacks),
+    }
+    return '\n'.join(lines) + ('\n' if lines else ''), summary
+
+
+class RequestProfiler:
+    """Per-request cProfile capture with a bounded store of recent reports."""
+
+    def __init__(self, keep: int = 20):
+        self.keep = keep
+        self._ids = count(1)
+        self._reports: OrderedDict[int, dict] = OrderedDict()
+        self._lock = Lock()
+
+    def start(self) -> cProfile.Profile | None:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (e.g. one on a concurrent request) is active
+            return None
+        return profile
+
+    def reserve(self) -> int:
+        """Hand out a report id now for a profile that finishes later (e.g. in a worker thread)."""
+        return next(self._ids)
+
+    def finish(
+        self,
+        profile: cProfile.Profile,
+        path: str,
+        sort_by: str = 'cumulative',
+        limit: int = 60,
+        report_id: int | None = None,
+    ) -> int:
+        profile.disable()
+        out = io.StringIO()
+        stats = pstats.Stats(profile, stream=out)
+        try:
+            stats.sort_stats(sort_by)
+        except KeyError:
+            stats.sort_stats('cumulative')
+        stats.print_stats(limit)
+        if report_id is None:
+            report_id = next(self._ids)
+        with self._lock:
+            self._reports[report_id] = {
+                'id': report_id,
+                'path': path,
+                'captured_at': time.time(),
+                'total_seconds': round(stats.total_tt, 6),
+                'report': out.getvalue(),
+            }
+            while len(self._reports) > self.keep:
+                self._reports.popitem(last=False)
+        return report_id
+
+    def get(self, report_id: int) -> dict | None:
+        with self._lock:
+            return self._reports.get(report_id)
+
+    def list(self) -> list[dict]:
+        with self._lock:
+            return [
+                {k: v for k, v in r.items() if k != 'report'}
+                for r in self._reports.values()
+            ]
@@ -0,0 +1,301 @@
+"""
+Replay a recorded session and diff the results against a baseline.
+
+Pushes the frames of a session archive (see ``session_record.py``) either
+to a running server's ``/send-frame`` or straight into the ``send-frame``
+pipeline of an in-process ``python/server.py`` (no HTTP, isolated temp
+directory), honouring the recorded arrival times at 1x, at a multiple of
+it, at a fixed frame rate or as fast as possible. Writes, per run:
+
+    detections.json      detections in the server's format (frame_count = frame index in the archive)
+    compactedLog.json    ``stages.compact_ranges`` of the detections
+    CorrectedLog.json    ``stages.correct_words`` of the compacted log
+    latency.json         scheduled-arrival-to-result latency percentiles and throughput
+                         (send-to-result at ``--speed max``, where every frame is due at once)
+
+With ``--baseline DIR`` the run is compared to a previous run's output
+and the exit status is non-zero on label changes, a different corrected
+text or a latency regression beyond the tolerance:
+
+    python python/replay.py recordings/alice-20260101_120000.sprc --out baselines/alice
+    python python/replay.py recordings/alice-20260101_120000.sprc --speed max --baseline baselines/alice
+    python python/replay.py recordings/alice-20260101_120000.sprc --target http://localhost:5000 --speed 2
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from urllib import error as urlerror
+from urllib import request as urlrequest
+
+PYTHON_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(PYTHON_DIR))
+
+import session_record  # noqa: E402
+import stages  # noqa: E402
+from capture import LatencyStats  # noqa: E402
+from formdata import multipart_body  # noqa: E402
+
+
+# ----- targets -----
+
+class HttpTarget:
+    def __init__(self, base_url: str, session: str):
+        self.url = base_url.rstrip('/') + '/send-frame'
+        self.session = session
+
+    def send(self, data: bytes) -> dict | None:
+        body, content_type = multipart_body('frame', 'frame.jpg', data)
+        req = urlrequest.Request(
+            self.url, data=body, method='POST',
+            headers={'Content-Type': content_type, 'X-Session-Id': self.session},
+        )
+        try:
+            with urlrequest.urlopen(req, timeout=30) as resp:
+                reply = json.loads(resp.read())
+        except urlerror.HTTPError as e:
+            return {'error': e.code}
+        if 'label' not in reply:
+            return None
+        return {'label': reply['label'], 'confidence': reply['confidence']}
+
+    def close(self):
+        pass
+
+
+class PipelineTarget:
+    """The server's send-frame pipeline, imported in-process with throwaway storage."""
+
+    def __init__(self, session: str):
+        self.session = session
+        self._workdir = tempfile.TemporaryDirectory(prefix='replay-')
+        os.environ.update({
+            'DETECTIONS_LOG': os.path.join(self._workdir.name, 'detections.json'),
+            'HISTORY_ENABLE': '0',
+            'SERVER_MODE': 'full',
+        })
+        os.environ.pop('RECORD_DIR', None)
+        # Every frame gets a row so per-frame diffs see dropped detections too
+        os.environ.setdefault('YOLO_LOG_EMPTY', '1')
+        self._cwd = os.getcwd()
+        os.chdir(self._workdir.name)
+        import server
+        self.server = server
+        if server.model is None:
+            print('WARNING: no YOLO model loaded in-process; replay measures ingest only')
+
+    def send(self, data: bytes) -> dict | None:
+        try:
+            ctx = self.server._frame_pipeline.run({
+                'frame_data': data, 'session': self.session, 'inflight': {'bytes': 0}, 'infer': True,
+            })
+        except stages.InvalidImage:
+            return {'error': 'invalid image'}
+        detection = ctx.get('detection')
+        if detection is None:
+            return None
+        return {'label': detection['label'], 'confidence': detection['confidence']}
+
+    def close(self):
+        self.server.flush_state()
+        os.chdir(self._cwd)
+        self._workdir.cleanup()
+
+
+# ----- replay -----
+
+def schedule(offsets: list[float], speed: float | None, fps: float | None) -> list[float]:
+    """Seconds after start at which each frame is sent (all zero = as fast as possible)."""
+    if fps:
+        return [i / fps for i in range(len(offsets))]
+    if speed is None:
+        return [0.0] * len(offsets)
+    base = offsets[0] if offsets else 0.0
+    return [(offset - base) / speed for offset in offsets]
+
+
+def replay(frames: list[tuple[float, bytes]], target, due: list[float], concurrency: int, header: dict, pace: str):
+    results: list[dict | None] = [None] * len(frames)
+    latency = LatencyStats(window=max(1, len(frames)))
+    errors = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+    # Paced runs measure from the scheduled arrival, so queueing behind slow frames counts as it
+    # would live. Unpaced, every frame is due at the start and that would just measure the wall time
+    paced = any(due)
+
+    def run(index: int, data: bytes, scheduled: float):
+        sent = time.perf_counter()
+        out = target.send(data)
+        elapsed = time.perf_counter() - (scheduled if paced else sent)
+        with lock:
+            latency.add(elapsed)
+            if out is not None and 'error' in out:
+                errors.append((index, out['error']))
+            elif out is not None:
+                results[index] = out
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for index, ((_, data), at) in enumerate(zip(frames, due)):
+            scheduled = started + at
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(run, index, data, scheduled)
+    wall = time.perf_counter() - started
+
+    started_ns = header.get('started_ns', 0)
+    detections = [
+        {
+            'frame_count': index + 1,
+            'timestamp': datetime.fromtimestamp((started_ns / 1e9) + frames[index][0]).isoformat(),
+            'label': out['label'],
+            'confidence': out['confidence'],
+        }
+        for index, out in enumerate(results) if out is not None
+    ]
+    summary = latency.summary()
+    summary.update({
+        'target': 'http' if isinstance(target, HttpTarget) else 'pipeline',
+        'pace': pace,
+        'latency_from': 'scheduled' if paced else 'send',
+        'frames': len(frames),
+        'errors': len(errors),
+        'wall_seconds': round(wall, 3),
+        'fps': round(len(frames) / wall, 2) if wall > 0 else None,
+        'recorded_seconds': round(frames[-1][0] - frames[0][0], 3) if frames else 0.0,
+    })
+    return detections, summary
+
+
+def write_outputs(out_dir: Path, detections: list[dict], latency: dict) -> dict:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    compacted = stages.compact_ranges(detections)
+    corrected = stages.correct_words(compacted)
+    outputs = {
+        'detections.json': detections,
+        'compactedLog.json': compacted,
+        'CorrectedLog.json': corrected,
+        'latency.json': latency,
+    }
+    for name, value in outputs.items():
+        with open(out_dir / name, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+    return outputs
+
+
+# ----- baseline diff -----
+
+def _load(path: Path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def diff_against(baseline_dir: Path, outputs: dict, latency_tolerance: float, max_label_diffs: int) -> list[str]:
+    """Print a comparison with the baseline run; returns the failures."""
+    failures = []
+    base = {name: _load(baseline_dir / name) for name in outputs if (baseline_dir / name).exists()}
+
+    if 'detections.json' in base:
+        old = {row['frame_count']: row for row in base['detections.json']}
+        new = {row['frame_count']: row for row in outputs['detections.json']}
+        changed = [
+            (frame, (old.get(frame) or {}).get('label'), (new.get(frame) or {}).get('label'))
+            for frame in sorted(set(old) | set(new))
+            if (old.get(frame) or {}).get('label') != (new.get(frame) or {}).get('label')
+        ]
+        shared = [frame for frame in set(old) & set(new) if old[frame]['label'] == new[frame]['label']]
+        drift = (
+            sum(abs(float(new[f]['confidence']) - float(old[f]['confidence'])) for f in shared) / len(shared)
+            if shared else 0.0
+        )
+        print(f"detections: {len(changed)} frames changed label, mean confidence drift {drift:.4f}")
+        for frame, before, after in changed[:20]:
+            print(f"  frame {frame}: {before} -> {after}")
+        if len(changed) > max_label_diffs:
+            failures.append(f'{len(changed)} frames changed label (allowed {max_label_diffs})')
+
+    if 'compactedLog.json' in base:
+        before = [(c['frameRange'], c['label']) for c in base['compactedLog.json']]
+        after = [(c['frameRange'], c['label']) for c in outputs['compactedLog.json']]
+        print(f"compacted: {len(before)} -> {len(after)} ranges{'' if before == after else ' (differs)'}")
+
+    if 'CorrectedLog.json' in base:
+        before = ' '.join(w['string'] for w in base['CorrectedLog.json'])
+        after = ' '.join(w['string'] for w in outputs['CorrectedLog.json'])
+        print(f"corrected: {before!r} -> {after!r}")
+        if before != after:
+            failures.append('corrected text differs')
+
+    if 'latency.json' in base:
+        old, new = base['latency.json'], outputs['latency.json']
+        if (old.get('target'), old.get('pace')) != (new.get('target'), new.get('pace')):
+            print(f"NOTE: baseline ran {old.get('target')} at {old.get('pace')}, this run {new.get('target')} at {new.get('pace')}")
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'fps'):
+            if old.get(key) is not None and new.get(key) is not None:
+                print(f"latency {key}: {old[key]} -> {new[key]}")
+        if old.get('latency_from', 'scheduled') != new.get('latency_from'):
+            print(f"NOTE: latency measured from {old.get('latency_from', 'scheduled')} in the baseline and "
+                  f"from {new.get('latency_from')} now; not comparing p95")
+        elif old.get('p95_ms') and new.get('p95_ms') and new['p95_ms'] > old['p95_ms'] * (1 + latency_tolerance):
+            failures.append(f"p95 latency {new['p95_ms']}ms > baseline {old['p95_ms']}ms +{latency_tolerance:.0%}")
+    return failures
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Replay a recorded session and diff against a baseline')
+    ap.add_argument('archive', help='session archive (.sprc) written with RECORD_DIR')
+    ap.add_argument('--target', default=None, help='server base URL; default replays into an in-process pipeline')
+    ap.add_argument('--speed', default='1', help="multiple of recorded speed, or 'max' (default 1)")
+    ap.add_argument('--fps', type=float, default=None, help='send at a fixed rate instead of the recorded timing')
+    ap.add_argument('--concurrency', type=int, default=4, help='frames in flight at once')
+    ap.add_argument('--session', default=None, help='session id to replay as (default replay-<archive name>)')
+    ap.add_argument('--limit', type=int, default=None, help='replay only the first N frames')
+    ap.add_argument('--out', default=None, help='output directory (default replay-out/<archive name>)')
+    ap.add_argument('--baseline', default=None, help='directory of a previous run to diff against')
+    ap.add_argument('--latency-tolerance', type=float, default=0.25, help='allowed p95 regression (fraction)')
+    ap.add_argument('--max-label-diffs', type=int, default=0, help='allowed frames with a changed label')
+    args = ap.parse_args()
+
+    archive = Path(args.archive)
+    header = session_record.read_header(archive)
+    frames = list(session_record.read_archive(archive))
+    if args.limit:
+        frames = frames[:args.limit]
+    if not frames:
+        print(f'ERROR: {archive} contains no frames')
+        sys.exit(2)
+    speed = None if args.speed == 'max' else float(args.speed)
+    due = schedule([offset for offset, _ in frames], speed, args.fps)
+    session = args.session or f'replay-{archive.stem}'
+    out_dir = Path(args.out or Path('replay-out') / archive.stem).resolve()
+
+    pace = f'{args.fps} fps' if args.fps else ('max speed' if speed is None else f'{speed}x')
+    print(f"Replaying {len(frames)} frames of session {header.get('session')!r} "
+          f"({frames[-1][0] - frames[0][0]:.1f}s recorded) at {pace}")
+    target = HttpTarget(args.target, session) if args.target else PipelineTarget(session)
+    try:
+        detections, latency = replay(frames, target, due, args.concurrency, header, pace)
+    finally:
+        target.close()
+    outputs = write_outputs(out_dir, detections, latency)
+    print(f"{len(detections)} detections, {latency['fps']} frames/s, p95 {latency.get('p95_ms')} ms -> {out_dir}")
+
+    if args.baseline:
+        failures = diff_against(Path(args.baseline), outputs, args.latency_tolerance, args.max_label_diffs)
+        for failure in failures:
+            print(f'FAIL {failure}')
+        sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,607 @@
+"""
+Session-affine router in front of several python/server.py instances.
+
+One server process handles a few streams. To scale out, run N instances
+(on one machine or several) and put this router in front of them:
+
+    ROUTER_BACKENDS=http://127.0.0.1:5001,http://127.0.0.1:5002 python python/router.py
+
+Each request is forwarded to the backend that owns its session, which is
+resolved like the servers do it (``X-Session-Id``, then a ``session``
+query or form field). Browsers send a per-tab ``X-Session-Id``; a client
+that sends none is keyed by its address (``client-<addr>``, from the first
+``X-Forwarded-For`` hop or the peer address), so sessionless clients still
+spread over the backends instead of all sharing one ring point. The
+resolved id is forwarded as ``X-Session-Id``, so the backend books the
+request under the same session. Session ids are placed on a
+consistent-hash ring with ``ROUTER_VNODES`` points per backend, so all
+frames of a session reach one backend, in order, and land in one
+detection log. Adding or removing a backend moves only about 1/N of the
+sessions.
+
+Membership and rebalancing:
+    health    every ``ROUTER_HEALTH_INTERVAL_S`` each backend's ``/health`` is
+              polled. After ``ROUTER_HEALTH_FAILS`` failed checks or connects
+              in a row (or at once on a refused connection while forwarding)
+              the backend leaves the ring. It rejoins on the next successful
+              check. A forwarded request that times out or fails after it was
+              sent fails alone and does not count against the backend.
+    pinning   a session that sent a request in the last ``ROUTER_STICKY_S``
+              stays on its backend while that backend is healthy. A backend
+              that joins therefore takes only new or idle sessions, and a
+              running session is never split across two logs. Sessions of a
+              backend that leaves move to their next backend on the ring.
+    admin     ``GET/POST/DELETE /admin/backends?url=`` lists, adds or removes
+              backends at runtime (ADMIN_TOKEN).
+
+Log queries fan out to every backend:
+    /logs/<raw|compacted|corrected|runs|words>
+                                      the view of every shard. The router keeps a
+                                      mirror per shard and refreshes it with the
+                                      shards' ``?since=`` deltas. The response
+                                      carries an ETag over all shard sequences,
+                                      so unchanged polls get a 304.
+    /history, /history/sessions       merged rows, tagged with their backend.
+
+``python/bench_router.py`` starts 1, 2, 4... local backends behind a
+router and measures how throughput scales.
+
+Configuration (environment):
+    ROUTER_BACKENDS            comma-separated backend base URLs
+    ROUTER_PORT                listen port (default 8080)
+    ROUTER_VNODES              ring points per backend (default 64)
+    ROUTER_HEALTH_INTERVAL_S   health check period (default 2)
+    ROUTER_HEALTH_FAILS        failed checks before a backend leaves the ring (default 2)
+    ROUTER_STICKY_S            keep an active session on its backend this long after its last request (default 30)
+    ROUTER_TIMEOUT_S           backend request timeout (default 30)
+    ADMIN_TOKEN                enables /admin/backends
+"""
+from __future__ import annotations
+
+import bisect
+import hashlib
+import hmac
+import http.client
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from flask import Flask, Response, jsonify, request
+from flask_cors import CORS
+
+import history
+import metrics
+
+ROUTER_PORT = int(os.environ.get('ROUTER_PORT', '8080'))
+VNODES = int(os.environ.get('ROUTER_VNODES', '64'))
+HEALTH_INTERVAL = float(os.environ.get('ROUTER_HEALTH_INTERVAL_S', '2'))
+HEALTH_TIMEOUT = max(1.0, HEALTH_INTERVAL)
+HEALTH_FAILS = int(os.environ.get('ROUTER_HEALTH_FAILS', '2'))
+STICKY_S = float(os.environ.get('ROUTER_STICKY_S', '30'))
+TIMEOUT_S = float(os.environ.get('ROUTER_TIMEOUT_S', '30'))
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+
+LOG_VIEWS = ('raw', 'compacted', 'corrected', 'runs', 'words')
+# Not forwarded in either direction (RFC 7230 hop-by-hop, plus what http.client/Werkzeug set themselves)
+HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers',
+    'transfer-encoding', 'upgrade', 'host', 'content-length', 'server', 'date',
+}
+
+ROUTED = metrics.counter(
+    'router_requests_total', 'Requests forwarded by the router, by backend and outcome (ok, error, failover).',
+    ('backend', 'outcome'),
+)
+ROUTE_SECONDS = metrics.histogram('router_forward_seconds', 'Backend round trip of forwarded requests.', ('backend',))
+BACKEND_UP = metrics.gauge('router_backend_up', 'Whether a backend is on the ring (1) or not (0).', ('backend',))
+REBALANCES = metrics.counter('router_rebalances_total', 'Ring rebuilds, by reason (join, leave, removed).', ('reason',))
+SESSION_MOVES = metrics.counter('router_session_moves_total', 'Pinned sessions moved to another backend.')
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """Consistent hashing of session ids onto backends, ``vnodes`` points per backend."""
+
+    def __init__(self, nodes=(), vnodes: int = VNODES):
+        self.vnodes = vnodes
+        self.nodes = sorted(set(nodes))
+        points = sorted((_hash(f'{node}#{i}'), node) for node in self.nodes for i in range(vnodes))
+        self._keys = [p[0] for p in points]
+        self._nodes = [p[1] for p in points]
+
+    def lookup(self, key: str) -> str | None:
+        if not self._keys:
+            return None
+        i = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[i]
+
+
+class BackendUnavailable(Exception):
+    connect = False     # failed before the request was sent (nothing reached the backend)
+    refused = False     # ... because the connection was refused
+
+
+class Backend:
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        parts = urlsplit(self.url)
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.https = parts.scheme == 'https'
+        self.healthy = False
+        self.failures = 0
+        self.checked_at: float | None = None
+        self.health: dict | None = None
+        self.error: str | None = None
+        self._idle: list = []
+        self._idle_lock = threading.Lock()
+
+    # ----- keep-alive connections -----
+
+    def _connection(self):
+        with self._idle_lock:
+            if self._idle:
+                return self._idle.pop()
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=TIMEOUT_S)
+
+    def _release(self, conn):
+        with self._idle_lock:
+            if len(self._idle) < 32:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._idle_lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def request(self, method: str, path: str, body: bytes | None = None, headers: dict | None = None,
+                stream: bool = False, timeout: float | None = None):
+        """
+        ``(status, headers, body)``; with ``stream`` the body is an iterator of chunks.
+
+        Raises ``BackendUnavailable``. ``connect`` is set when the connection
+        could not be opened (``refused`` when it was refused), so the caller
+        can tell a down backend from a slow or failed response. A ``timeout``
+        uses a fresh connection that is closed afterwards.
+        """
+        for attempt in range(2):
+            if timeout is not None:
+                cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+                conn = cls(self.host, self.port, timeout=timeout)
+            else:
+                conn = self._connection()
+            reused = conn.sock is not None
+            if not reused:
+                try:
+                    conn.connect()
+                except (OSError, http.client.HTTPException) as e:
+                    conn.close()
+                    error = BackendUnavailable(f'{self.url}: {e}')
+                    error.connect = True
+                    error.refused = isinstance(e, ConnectionRefusedError)
+                    raise error from e
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                # An idle keep-alive connection may have been closed by the backend: retry on a fresh one
+                if reused and attempt == 0:
+                    continue
+                raise BackendUnavailable(f'{self.url}: {e}') from e
+            out_headers = [(k, v) for k, v in resp.getheaders() if k.lower() not in HOP_HEADERS]
+            if stream:
+                return resp.status, out_headers, self._stream(conn, resp)
+            try:
+                data = resp.read()
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                raise BackendUnavailable(f'{self.url}: {e}') from e
+            if resp.will_close or timeout is not None:
+                conn.close()
+            else:
+                self._release(conn)
+            return resp.status, out_headers, data
+
+    def _stream(self, conn, resp):
+        done = False
+        try:
+            while True:
+                chunk = resp.read1(65536)
+                if not chunk:
+                    done = True
+                    return
+                yield chunk
+        finally:
+            if done and not resp.will_close:
+                self._release(conn)
+            else:
+                conn.close()
+
+    def describe(self) -> dict:
+        return {
+            'url': self.url,
+            'healthy': self.healthy,
+            'failures': self.failures,
+            'checked_at': self.checked_at,
+            'error': self.error,
+            'health': self.health,
+        }
+
+
+class _ShardLog:
+    """Mirror of one backend's log view, kept current with ``?since=`` deltas."""
+
+    def __init__(self):
+        self.seq: int | None = None
+        self.first: int | None = None
+        self.entries: list = []
+        self.lock = threading.Lock()
+
+    def refresh(self, backend: Backend, view: str):
+        with self.lock:
+            path = f'/logs/{view}'
+            if self.seq is not None:
+                path += f'?since={self.seq}&first={self.first}'
+            status, headers, body = backend.request('GET', path)
+            headers = {k.lower(): v for k, v in headers}
+            if status == 304:
+                return
+            if status != 200:
+                raise BackendUnavailable(f'{backend.url}/logs/{view}: HTTP {status}')
+            entries = json.loads(body)
+            replace = headers.get('x-log-delta-replace')
+            if replace is None:
+                self.entries = entries
+            else:
+                del self.entries[:int(headers.get('x-log-delta-drop', 0))]
+                if int(replace):
+                    del self.entries[-int(replace):]
+                self.entries += entries
+            self.seq = int(headers.get('x-log-seq', 0))
+            self.first = int(headers.get('x-log-first-seq', 0))
+
+
+class Router:
+    def __init__(self, urls=(), vnodes: int = VNODES, sticky: float = STICKY_S):
+        self.vnodes = vnodes
+        self.sticky = sticky
+        self.backends: dict[str, Backend] = {}
+        self.ring = HashRing((), vnodes)
+        self._pins: dict[str, tuple[str, float]] = {}   # session -> (backend url, last request)
+        self._logs: dict[tuple[str, str], _ShardLog] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix='router-fanout')
+        self._started_pid = None
+        for url in urls:
+            self.add(url, check=False)
+
+    # ----- membership -----
+
+    def _rebuild(self, reason: str):
+        self.ring = HashRing([url for url, b in self.backends.items() if b.healthy], self.vnodes)
+        REBALANCES.inc(reason=reason)
+        print(f"ROUTER ring {reason}: {len(self.ring.nodes)}/{len(self.backends)} backends up")
+
+    def add(self, url: str, check: bool = True) -> Backend:
+        backend = Backend(url)
+        with self._lock:
+            if backend.url in self.backends:
+                return self.backends[backend.url]
+            self.backends[backend.url] = backend
+            BACKEND_UP.set(0, backend=backend.url)
+        if check:
+            self.check(backend)
+        return backend
+
+    def remove(self, url: str) -> bool:
+        with self._lock:
+            backend = self.backends.pop(url.rstrip('/'), None)
+            if backend is None:
+                return False
+            for view in LOG_VIEWS:
+                self._logs.pop((backend.url, view), None)
+            self._rebuild('removed')
+        BACKEND_UP.set(0, backend=backend.url)
+        backend.close()
+        return True
+
+    def _mark(self, backend: Backend, ok: bool, error: str | None = None, health: dict | None = None,
+              down: bool = False):
+        with self._lock:
+            backend.checked_at = time.time()
+            if ok:
+                backend.failures = 0
+                backend.error = None
+                backend.health = health
+            else:
+                backend.failures += 1
+                backend.error = error
+            was = backend.healthy
+            backend.healthy = ok or (was and not down and backend.failures < HEALTH_FAILS)
+            if backend.healthy != was and backend.url in self.backends:
+                self._rebuild('join' if backend.healthy else 'leave')
+        BACKEND_UP.set(1 if backend.healthy else 0, backend=backend.url)
+
+    def check(self, backend: Backend):
+        try:
+            status, _, body = backend.request('GET', '/health', timeout=HEALTH_TIMEOUT)
+            if status != 200:
+                raise BackendUnavailable(f'HTTP {status}')
+            self._mark(backend, True, health=json.loads(body))
+        except (BackendUnavailable, ValueError) as e:
+            self._mark(backend, False, error=str(e))
+
+    def check_all(self):
+        with self._lock:
+            backends = list(self.backends.values())
+        list(self._pool.map(self.check, backends))
+
+    def start(self):
+        # Threads do not survive fork; called again in each worker
+        if self._started_pid == os.getpid():
+            return
+        self._started_pid = os.getpid()
+        self.check_all()
+        threading.Thread(target=self._run_checks, name='router-health', daemon=True).start()
+
+    def _run_checks(self):
+        while True:
+            time.sleep(HEALTH_INTERVAL)
+            self.check_all()
+            self._expire_pins()
+
+    # ----- routing -----
+
+    def _expire_pins(self):
+        cutoff = time.monotonic() - self.sticky
+        with self._lock:
+            for session in [s for s, (_, seen) in self._pins.items() if seen < cutoff]:
+                del self._pins[session]
+
+    def owner(self, session: str) -> Backend | None:
+        now = time.monotonic()
+        with self._lock:
+            pinned = self._pins.get(session)
+            if pinned is not None and now - pinned[1] <= self.sticky:
+                backend = self.backends.get(pinned[0])
+                if backend is not None and backend.healthy:
+                    self._pins[session] = (backend.url, now)
+                    return backend
+            url = self.ring.lookup(session)
+            if url is None:
+                self._pins.pop(session, None)
+                return None
+            if pinned is not None and pinned[0] != url:
+                SESSION_MOVES.inc()
+                print(f"ROUTER session {session!r} moved {pinned[0]} -> {url}")
+            self._pins[session] = (url, now)
+            return self.backends[url]
+
+    def forward(self, session: str, method: str, path: str, body: bytes, headers: dict, stream: bool = False):
+        backend = self.owner(session)
+        for attempt in range(2):
+            if backend is None:
+                raise BackendUnavailable('no healthy backends')
+            started = time.perf_counter()
+            try:
+                result = backend.request(method, path, body, headers, stream)
+            except BackendUnavailable as e:
+                ROUTED.inc(backend=backend.url, outcome='error')
+                # Only a failed connect says the backend is down (a refused one takes it out of the
+                # ring now); a read timeout or reset fails this request but not the backend
+                if e.connect:
+                    self._mark(backend, False, error=str(e), down=e.refused)
+                if not e.refused or attempt:
+                    raise
+                # Nothing reached the backend: retry once on the session's new owner
+                ROUTED.inc(backend=backend.url, outcome='failover')
+                backend = self.owner(session)
+                continue
+            ROUTE_SECONDS.observe(time.perf_counter() - started, backend=backend.url)
+            ROUTED.inc(backend=backend.url, outcome='ok')
+            return backend, result
+
+    # ----- fan-out queries -----
+
+    def _up(self) -> list[Backend]:
+        with self._lock:
+            return [b for b in self.backends.values() if b.healthy]
+
+    def shard_logs(self, view: str) -> list[dict]:
+        with self._lock:
+            backends = list(self.backends.values())
+            mirrors = [self._logs.setdefault((b.url, view), _ShardLog()) for b in backends]
+
+        def refresh(pair):
+            backend, mirror = pair
+            stale = not backend.healthy
+            if not stale:
+                try:
+                    mirror.refresh(backend, view)
+                except (BackendUnavailable, ValueError):
+                    stale = True
+            with mirror.lock:
+                return {'backend': backend.url, 'seq': mirror.seq, 'stale': stale, 'entries': list(mirror.entries)}
+
+        return list(self._pool.map(refresh, zip(backends, mirrors)))
+
+    def fan_out(self, path: str) -> tuple[list[tuple[Backend, object]], list[dict]]:
+        """GET ``path`` on every healthy backend: ``([(backend, json)], [errors])``."""
+        def get(backend):
+            try:
+                status, _, body = backend.request('GET', path)
+                if status != 200:
+                    return backend, None, f'HTTP {status}'
+                return backend, json.loads(body), None
+            except (BackendUnavailable, ValueError) as e:
+                return backend, None, str(e)
+
+        results, errors = [], []
+        for backend, payload, error in self._pool.map(get, self._up()):
+            if error is None:
+                results.append((backend, payload))
+            else:
+                errors.append({'backend': backend.url, 'error': error})
+        return results, errors
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts: dict[str, int] = {}
+            for url, _ in self._pins.values():
+                counts[url] = counts.get(url, 0) + 1
+            return {
+                'backends': [b.describe() for b in self.backends.values()],
+                'ring': self.ring.nodes,
+                'vnodes': self.vnodes,
+                'pinned_sessions': counts,
+                'session_moves': int(SESSION_MOVES.value()),
+            }
+
+
+def router_from_env() -> Router:
+    urls = [u.strip() for u in os.environ.get('ROUTER_BACKENDS', '').split(',') if u.strip()]
+    if not urls:
+        print("WARNING: ROUTER_BACKENDS is empty; add backends with POST /admin/backends?url=")
+    return Router(urls)
+
+
+app = Flask(__name__)
+CORS(app, supports_credentials=True, expose_headers=['Retry-After', 'X-Backend'])
+router = router_from_env()
+
+
+def start_background_tasks():
+    router.start()
+
+
+def _require_admin():
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'admin endpoints disabled (set ADMIN_TOKEN)'}), 403
+    supplied = request.headers.get('X-Admin-Token', '')
+    auth = request.headers.get('Authorization', '')
+    if not supplied and auth.startswith('Bearer '):
+        supplied = auth[len('Bearer '):]
+    if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+        return jsonify({'error': 'unauthorized'}), 401
+    return None
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Router health: ok while at least one backend is on the ring"""
+    body = router.stats()
+    body['status'] = 'ok' if body['ring'] else 'no_backends'
+    return jsonify(body), 200 if body['ring'] else 503
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint (the router's own metrics)"""
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
+
+@app.route('/logs/<view>', methods=['GET'])
+def logs(view: str):
+    """Every shard's log view, refreshed from the shards' deltas; ETag over the shard sequences"""
+    if view not in LOG_VIEWS:
+        return jsonify({'error': f'unknown log view {view!r}'}), 404
+    shards = router.shard_logs(view)
+    tag = hashlib.blake2b(
+        json.dumps([(s['backend'], s['seq'], s['stale']) for s in shards]).encode(), digest_size=8,
+    ).hexdigest()
+    if request.if_none_match.contains(f'{view}-{tag}'):
+        response = Response(status=304)
+    else:
+        response = jsonify({'view': view, 'shards': shards})
+    response.set_etag(f'{view}-{tag}')
+    return response
+
+
+@app.route('/history', methods=['GET'])
+def history_query():
+    """/history on every backend, merged by timestamp (?limit= and ?order= apply to the merged rows)"""
+    try:
+        # Validate once here rather than collect the same 400 from every backend
+        limit = history.query_args(request.args)['limit']
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+    qs = request.query_string.decode()
+    results, errors = router.fan_out('/history' + (f'?{qs}' if qs else ''))
+    rows = [dict(row, backend=backend.url) for backend, payload in results for row in payload]
+    rows.sort(key=lambda r: r.get('ts') or r.get('timestamp') or '', reverse=request.args.get('order') == 'desc')
+    return jsonify({'rows': rows[:limit], 'errors': errors}), 200
+
+
+@app.route('/history/sessions', methods=['GET'])
+def history_sessions():
+    """Sessions stored on every backend, tagged with the backend holding them"""
+    results, errors = router.fan_out('/history/sessions')
+    sessions = [dict(s, backend=backend.url) for backend, payload in results for s in payload]
+    return jsonify({'sessions': sessions, 'errors': errors}), 200
+
+
+@app.route('/admin/backends', methods=['GET', 'POST', 'DELETE'])
+def admin_backends():
+    """List backends; POST ?url= adds one (joins after a health check), DELETE ?url= removes one"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    if request.method != 'GET':
+        url = request.args.get('url') or (request.get_json(silent=True) or {}).get('url')
+        if not url or not url.startswith(('http://', 'https://')):
+            return jsonify({'error': 'url must be an http(s) base URL'}), 400
+        if request.method == 'POST':
+            router.add(url)
+        elif not router.remove(url):
+            return jsonify({'error': f'unknown backend {url}'}), 404
+    return jsonify(router.stats()), 200
+
+
+@app.route('/', defaults={'path': ''}, methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'])
+@app.route('/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'])
+def proxy(path: str):
+    """Everything else goes to the backend owning the request's session"""
+    # Cache the body first so reading a form ``session`` field leaves it intact for forwarding
+    body = request.get_data(cache=True)
+    session = metrics.session_from_request(request)
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_HEADERS}
+    headers['X-Session-Id'] = session
+    forwarded = request.headers.get('X-Forwarded-For')
+    headers['X-Forwarded-For'] = ', '.join(filter(None, (forwarded, request.remote_addr)))
+    target = request.full_path if request.query_string else request.path
+    stream = path.endswith('.mjpg')
+    try:
+        backend, (status, out_headers, data) = router.forward(session, request.method, target, body, headers, stream)
+    except BackendUnavailable as e:
+        response = jsonify({'status': 'error', 'message': f'No backend available ({e})'})
+        response.headers['Retry-After'] = str(max(1, int(HEALTH_INTERVAL)))
+        return response, 502 if router.ring.nodes else 503
+    response = Response(data, status=status)
+    response.headers.clear()
+    for key, value in out_headers:
+        response.headers.add(key, value)
+    response.headers['X-Backend'] = backend.url
+    return response
+
+
+start_background_tasks()
+
+
+if __name__ == '__main__':
+    print('=' * 50)
+    print(f'Starting router on http://localhost:{ROUTER_PORT}')
+    for backend in router.backends.values():
+        print(f"  backend {backend.url} ({'up' if backend.healthy else 'down'})")
+    print('=' * 50)
+    app.run(host='0.0.0.0', port=ROUTER_PORT, debug=False, use_reloader=False, threaded=True)
@@ -0,0 +1,194 @@
+"""
+Priority scheduling of model inference between live frames and bulk jobs.
+
+Live ``/send-frame`` / ``/detect-frame`` requests and bulk work (uploaded
+videos on ``/video/process``) share one model and the same cores. Every
+predict call takes an inference slot from the process's
+``InferenceScheduler`` first:
+
+    with SCHEDULER.slot('live'):
+        prediction = stages.predict(...)
+
+When a slot frees, waiting live calls go first. Bulk work is submitted
+one batch per slot, so a live frame waits at most for the batch in
+progress: preemption happens at batch boundaries. To keep bulk jobs from
+starving under steady live load, bulk gets the next slot whenever its
+share of recent slot time (decayed over ``SCHED_WINDOW_S``) is below
+``SCHED_BULK_MIN_SHARE`` while it is waiting.
+
+Per class, queue wait and run time go to ``scheduler_wait_seconds{class}`` /
+``scheduler_run_seconds{class}``. ``stats()`` (``/health``) adds the
+waiting counts, the recent shares, and wait/total latency percentiles.
+
+Configuration (environment):
+    SCHED_SLOTS            inference calls running at once (default 1)
+    SCHED_BULK_MIN_SHARE   slot-time share guaranteed to waiting bulk work (default 0.1)
+    SCHED_WINDOW_S         decay time constant of the share accounting (default 10)
+"""
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import metrics
+
+CLASSES = ('live', 'bulk')
+
+SCHED_WAIT = metrics.histogram(
+    'scheduler_wait_seconds', 'Time inference calls waited for a slot, by priority class.', ('class',),
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+SCHED_RUN = metrics.histogram(
+    'scheduler_run_seconds', 'Time inference calls held a slot, by priority class.', ('class',),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+SCHED_WAITING = metrics.gauge('scheduler_waiting', 'Inference calls waiting for a slot.', ('class',))
+SCHED_GRANTS = metrics.counter(
+    'scheduler_grants_total', 'Slots granted, by class and reason (priority, share, idle).', ('class', 'reason'),
+)
+
+
+class _Latency:
+    def __init__(self, window: int = 500):
+        self.wait: deque = deque(maxlen=window)
+        self.total: deque = deque(maxlen=window)
+
+    @staticmethod
+    def _summary(values) -> dict:
+        if not values:
+            return {}
+        ms = np.asarray(values) * 1000.0
+        p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+        return {'p50_ms': round(float(p50), 1), 'p95_ms': round(float(p95), 1), 'p99_ms': round(float(p99), 1)}
+
+    def summary(self) -> dict:
+        return {'wait': self._summary(self.wait), 'total': self._summary(self.total)}
+
+
+class _Ticket:
+    __slots__ = ('cls', 'granted', 'queued_at')
+
+    def __init__(self, cls: str):
+        self.cls = cls
+        self.granted = False
+        self.queued_at = time.perf_counter()
+
+
+class InferenceScheduler:
+    def __init__(self, slots: int = 1, bulk_min_share: float = 0.1, window: float = 10.0):
+        self.slots = max(1, slots)
+        self.bulk_min_share = bulk_min_share
+        self.window = window
+        self._running = 0
+        self._waiting: dict[str, deque] = {cls: deque() for cls in CLASSES}
+        self._busy = {cls: 0.0 for cls in CLASSES}     # decayed slot-seconds
+        self._decayed_at = time.monotonic()
+        self._latency = {cls: _Latency() for cls in CLASSES}
+        self._cond = threading.Condition()
+
+    # ----- share accounting -----
+
+    def _decay(self):
+        now = time.monotonic()
+        factor = math.exp(-(now - self._decayed_at) / self.window)
+        self._decayed_at = now
+        for cls in CLASSES:
+            self._busy[cls] *= factor
+
+    def _bulk_share(self) -> float:
+        total = self._busy['live'] + self._busy['bulk']
+        return self._busy['bulk'] / total if total > 0 else 0.0
+
+    # ----- slots -----
+
+    def slot(self, cls: str = 'live'):
+        if cls not in CLASSES:
+            raise ValueError(f'unknown priority class {cls!r}')
+        return _Slot(self, cls)
+
+    def _acquire(self, cls: str) -> float:
+        ticket = _Ticket(cls)
+        with self._cond:
+            self._waiting[cls].append(ticket)
+            SCHED_WAITING.set(len(self._waiting[cls]), **{'class': cls})
+            self._dispatch()
+            while not ticket.granted:
+                self._cond.wait()
+        waited = time.perf_counter() - ticket.queued_at
+        SCHED_WAIT.observe(waited, **{'class': cls})
+        return waited
+
+    def _release(self, cls: str, ran: float):
+        with self._cond:
+            self._running -= 1
+            self._decay()
+            self._busy[cls] += ran
+            self._dispatch()
+
+    def _dispatch(self):
+        granted = False
+        while self._running < self.slots and (self._waiting['live'] or self._waiting['bulk']):
+            if not self._waiting['bulk']:
+                cls, reason = 'live', 'priority' if self._running else 'idle'
+            elif not self._waiting['live']:
+                cls, reason = 'bulk', 'idle'
+            else:
+                self._decay()
+                if self._bulk_share() < self.bulk_min_share:
+                    cls, reason = 'bulk', 'share'
+                else:
+                    cls, reason = 'live', 'priority'
+            ticket = self._waiting[cls].popleft()
+            ticket.granted = True
+            self._running += 1
+            SCHED_WAITING.set(len(self._waiting[cls]), **{'class': cls})
+            SCHED_GRANTS.inc(**{'class': cls, 'reason': reason})
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            self._decay()
+            return {
+                'slots': self.slots,
+                'running': self._running,
+                'waiting': {cls: len(q) for cls, q in self._waiting.items()},
+                'bulk_share': round(self._bulk_share(), 3),
+                'bulk_min_share': self.bulk_min_share,
+                'latency': {cls: lat.summary() for cls, lat in self._latency.items()},
+            }
+
+
+class _Slot:
+    def __init__(self, scheduler: InferenceScheduler, cls: str):
+        self._scheduler = scheduler
+        self._cls = cls
+
+    def __enter__(self):
+        self._waited = self._scheduler._acquire(self._cls)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        ran = time.perf_counter() - self._started
+        self._scheduler._release(self._cls, ran)
+        SCHED_RUN.observe(ran, **{'class': self._cls})
+        latency = self._scheduler._latency[self._cls]
+        with self._scheduler._cond:
+            latency.wait.append(self._waited)
+            latency.total.append(self._waited + ran)
+        return False
+
+
+def scheduler_from_env() -> InferenceScheduler:
+    return InferenceScheduler(
+        slots=int(os.environ.get('SCHED_SLOTS', '1')),
+        bulk_min_share=float(os.environ.get('SCHED_BULK_MIN_SHARE', '0.1')),
+        window=float(os.environ.get('SCHED_WINDOW_S', '10')),
+    )
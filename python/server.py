@@ -1,26 +1,39 @@
 from __future__ import annotations
 
-import io
+import hmac
 import json
 import os
-from collections import deque
+import threading
+import time
+import uuid
+from contextlib import nullcontext
 from datetime import datetime
 from pathlib import Path
 from threading import Lock
 
-import cv2
-import numpy as np
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
-from PIL import Image
 
-try:
-    from ultralytics import YOLO
-except Exception:
-    YOLO = None
+import admission
+import autotune
+import cascade
+import columnar
+import frame_store
+import history
+import live_feed
+import log_views
+import memdiag
+import metrics
+import model_reload
+import pipeline
+import profiler
+import scheduler
+import session_record
+import sidecar
+import stages
 
 app = Flask(__name__)
-CORS(app, supports_credentials=True)  # Enable CORS with credentials
+CORS(app, supports_credentials=True, expose_headers=['Retry-After'])  # Enable CORS with credentials
 
 # Create frames directory if it doesn't exist
 FRAMES_DIR = 'frames'
@@ -28,6 +41,9 @@ if not os.path.exists(FRAMES_DIR):
     os.makedirs(FRAMES_DIR)
 
 frame_count = 0
+_frame_count_lock = Lock()
+# Gunicorn workers each count frames from 0, so configure_worker gives each its own prefix
+FRAME_PREFIX = 'frame_'
 
 # ----- YOLO realtime detection (optional) -----
 ROOT_DIR = Path(__file__).resolve().parents[2]
@@ -40,12 +56,56 @@ MAX_DET = int(os.environ.get('YOLO_MAX_DET', '1'))
 LOG_EMPTY = os.environ.get('YOLO_LOG_EMPTY', '0') == '1'
 WRITE_EVERY = int(os.environ.get('YOLO_WRITE_EVERY', '1'))
 MAX_ENTRIES = int(os.environ.get('YOLO_MAX_ENTRIES', '2000'))
-DETECTION_ENABLED = os.environ.get('YOLO_ENABLE', '1') == '1'
+# full (default): ingest + detection; ingest: store/preview frames without loading YOLO;
+# logs: only serve logs, history and metrics
+SERVER_MODE = os.environ.get('SERVER_MODE', 'full').lower()
+INGEST_ENABLED = SERVER_MODE != 'logs'
+DETECTION_ENABLED = SERVER_MODE == 'full' and os.environ.get('YOLO_ENABLE', '1') == '1'
 MAX_FRAMES_ON_DISK = int(os.environ.get('MAX_FRAMES_ON_DISK', '300'))
-
-# Keep last N detections in memory
-_detections_buffer = deque(maxlen=MAX_ENTRIES)
+FRAME_WRITE_QUEUE = int(os.environ.get('FRAME_WRITE_QUEUE', '64'))
+FRAME_DELETE_BATCH = int(os.environ.get('FRAME_DELETE_BATCH', '32'))
+# Optional per-frame top-k class scores (float16 sidecar) for offline re-thresholding/decoding
+TOPK = int(os.environ.get('YOLO_TOPK', '0'))
+TOPK_FULL = os.environ.get('YOLO_TOPK_FULL', '0') == '1'
+TOPK_CONF = float(os.environ.get('YOLO_TOPK_CONF', '0.05'))
+TOPK_SIDECAR = Path(os.environ.get('YOLO_TOPK_SIDECAR', str(DETECTIONS_LOG.with_suffix('.topk.bin'))))
+# Advertised to capture clients via /capabilities; CAPTURE_SIZE defaults to the model input size
+CAPTURE_SIZE = int(os.environ.get('CAPTURE_SIZE', '0'))
+CAPTURE_JPEG_QUALITY = int(os.environ.get('CAPTURE_JPEG_QUALITY', '70'))
+CAPTURE_MAX_FPS = float(os.environ.get('CAPTURE_MAX_FPS', '30'))
+# Each /feed.mjpg viewer holds a request thread: cap concurrent streams per process (0 = no cap)
+# and end each stream after FEED_MAX_SECONDS (viewers reconnect)
+FEED_MAX_VIEWERS = int(os.environ.get('FEED_MAX_VIEWERS', '2'))
+FEED_MAX_SECONDS = float(os.environ.get('FEED_MAX_SECONDS', '300'))
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+# Uploaded videos are processed in the background at bulk priority; outputs go to <dir>/<job id>/
+VIDEO_JOBS_DIR = Path(os.environ.get('VIDEO_JOBS_DIR', 'video_jobs'))
+VIDEO_BATCH = int(os.environ.get('VIDEO_BATCH', '8'))
+# /video/process profiles its job thread instead of the request (see _run_video_job)
+PROFILABLE_PATHS = {'/send-frame'}
+
+_request_profiler = profiler.RequestProfiler()
+_live_feed = live_feed.LiveFeed(max_viewers=FEED_MAX_VIEWERS)
+_frame_writer = frame_store.FrameWriter(FRAMES_DIR, MAX_FRAMES_ON_DISK, FRAME_WRITE_QUEUE, FRAME_DELETE_BATCH)
+
+# Keep last N detections in memory (columnar: ~24 bytes per row, frame paths derived on read)
+_detections_buffer = columnar.DetectionColumns(MAX_ENTRIES, path_fn=lambda n, ts: _frame_path_for(n, ts))
 _buffer_lock = Lock()
+# Versioned raw/compacted/corrected views (ETag, ?since= deltas, gzip) for /logs/*
+_log_views = log_views.LogViews(_detections_buffer, _buffer_lock)
+# Durable, indexed history of every detection (older rows fall out of the buffer above)
+_history = history.store_from_env(Path(__file__).parent / 'detections.sqlite3')
+# Optional per-session archives of received frames for python/replay.py (RECORD_DIR)
+_recorder = session_record.recorder_from_env() if INGEST_ENABLED else None
+
+# ultralytics pulls in torch; only import it when detection is actually enabled
+YOLO = None
+if DETECTION_ENABLED:
+    try:
+        from ultralytics import YOLO
+    except Exception:
+        YOLO = None
 
 if DETECTION_ENABLED and YOLO is not None and WEIGHTS_PATH.exists():
     try:
@@ -62,19 +122,123 @@ else:
         print(f"WARNING: weights not found at {WEIGHTS_PATH}, realtime detection disabled.")
 
 
-def _prune_old_frames():
+def _on_model_swap(handle):
+    global model, _MODEL_BYTES, MODEL_INPUT_SIZE
+    model = handle.full.get() if isinstance(handle, cascade.Cascade) else handle.get()
+    _MODEL_BYTES = _model_bytes()
+    # Derived from the model at startup: follow the new weights
+    if not CAPTURE_SIZE:
+        MODEL_INPUT_SIZE = handle.input_size
+    if _sidecar is not None:
+        _sidecar.set_names(model.names)
+    autotune.follow_model(_autotune, handle.input_size)
+
+
+# Inference borrows the model from here, so new weights can be swapped in between frames.
+# With CASCADE_WEIGHTS, a small model answers confident frames and the YOLO model the rest.
+_models = model_reload.ModelSlot(
+    cascade.cascade_from_env(stages.ModelHandle(WEIGHTS_PATH, model)) if model is not None else None,
+    loader=(lambda path: YOLO(path)) if DETECTION_ENABLED and YOLO is not None else None,
+    on_swap=_on_model_swap,
+)
+_weights_watcher = model_reload.watcher_from_env(_models, WEIGHTS_PATH)
+# Live frames take inference slots before bulk video jobs (SCHED_*)
+_scheduler = scheduler.scheduler_from_env()
+# Long side frames are decoded at for detection; 0 = no limit (ingest-only keeps full resolution)
+MODEL_INPUT_SIZE = CAPTURE_SIZE or (_models.current.input_size if _models.current is not None else 0)
+
+_sidecar = None
+
+
+def _open_sidecar():
+    """Open the top-k sidecar in the process that appends to it (after fork under gunicorn)"""
+    global _sidecar
+    if model is None or not (TOPK > 0 or TOPK_FULL):
+        return
     try:
-        frames = sorted(Path(FRAMES_DIR).glob('*.jpg'), key=lambda p: p.stat().st_mtime)
-        if len(frames) <= MAX_FRAMES_ON_DISK:
-            return
-        to_delete = len(frames) - MAX_FRAMES_ON_DISK
-        for p in frames[:to_delete]:
-            try:
-                p.unlink(missing_ok=True)
-            except Exception:
-                pass
+        _sidecar = sidecar.SidecarWriter(TOPK_SIDECAR, model.names, TOPK, TOPK_FULL)
+        print(f"Top-{_sidecar.k} class scores -> {TOPK_SIDECAR}")
     except Exception as e:
-        print(f"WARNING: Failed to prune frames: {e}")
+        print(f"WARNING: Failed to open top-k sidecar: {e}")
+
+
+def _model_bytes() -> int:
+    try:
+        return sum(p.numel() * p.element_size() for p in model.model.parameters())
+    except Exception:
+        return 0
+
+
+def _buffer_bytes() -> int:
+    with _buffer_lock:
+        return _detections_buffer.nbytes
+
+
+def _evict_buffer() -> str:
+    with _buffer_lock:
+        drop = _detections_buffer.drop_oldest(len(_detections_buffer) // 2)
+    return f'dropped {drop} oldest detections'
+
+
+_inflight_frames = memdiag.InflightBytes()
+_MODEL_BYTES = _model_bytes() if model is not None else 0
+memdiag.register('buffers', _buffer_bytes, _evict_buffer)
+memdiag.register('frame_store', _inflight_frames)
+memdiag.register('frame_write_queue', _frame_writer.queued_bytes)
+memdiag.register('model', lambda: _MODEL_BYTES)
+
+
+
+def start_background_tasks():
+    """Start per-process background threads (called again in each forked worker)"""
+    memdiag.start_monitor()
+    if _weights_watcher is not None:
+        _weights_watcher.start()
+
+
+def _per_worker(path: Path, worker_id: int) -> Path:
+    return path.with_name(f'{path.stem}.{worker_id}{path.suffix}')
+
+
+def configure_worker(worker_id: int, workers: int, seq_base: int = 0):
+    """
+    Per-process setup in a forked gunicorn worker, before its background tasks start.
+    Workers share no state after fork, so with several of them each one writes its own
+    detection log and sidecar, prefixes its frame files with ``worker_id``, keeps its
+    share of MAX_FRAMES_ON_DISK, and numbers its log rows from ``seq_base`` so a
+    ``/logs?since=`` taken from another worker gets a full answer, not a wrong delta.
+    """
+    global DETECTIONS_LOG, TOPK_SIDECAR, FRAME_PREFIX
+    if workers > 1:
+        DETECTIONS_LOG = _per_worker(DETECTIONS_LOG, worker_id)
+        TOPK_SIDECAR = _per_worker(TOPK_SIDECAR, worker_id)
+        with _buffer_lock:
+            # Rows inherited from the master keep the frame paths they were saved under
+            _detections_buffer.pin_paths()
+            _detections_buffer.rebase(seq_base)
+            FRAME_PREFIX = f'frame_{worker_id}_'
+        _frame_writer.max_frames = max(1, MAX_FRAMES_ON_DISK // workers)
+    _open_sidecar()
+
+
+def flush_state():
+    """Persist buffered detections; used on graceful shutdown"""
+    with _buffer_lock:
+        _write_detections()
+    if _history is not None:
+        _history.flush()
+    if _sidecar is not None:
+        _sidecar.flush()
+    _frame_writer.flush()
+    if _recorder is not None:
+        _recorder.close()
+
+
+# Under gunicorn's preload_app the master imports this module; gunicorn.conf.py starts the
+# threads from post_fork instead, so no thread is running (or holding a lock) at fork
+if os.environ.get('SERVER_PRELOADED') != '1':
+    _open_sidecar()
+    start_background_tasks()
 
 
 def _write_detections():
@@ -90,64 +254,187 @@ def _write_detections():
         f.write(']\n')
 
 
-def _log_detection(entry: dict):
+def _log_detection(entry: dict, session: str = 'default'):
+    if _history is not None:
+        _history.add(entry, session)
     with _buffer_lock:
         _detections_buffer.append(entry)
         if entry['frame_count'] % WRITE_EVERY == 0:
-            _write_detections()
+            with metrics.stage('log_write', 'send-frame', session):
+                _write_detections()
 
 
-def _run_detection(frame_bgr: np.ndarray, frame_path: str):
-    if model is None:
-        return
+def _frame_path_for(frame_no: int, ts_us: int) -> str | None:
+    """Rebuild the on-disk path of a received frame from its number and capture time"""
+    if ts_us == columnar.NO_TS:
+        return None
+    stamp = columnar.us_to_datetime(ts_us).strftime("%Y%m%d_%H%M%S_%f")[:-3]
+    return os.path.join(FRAMES_DIR, f'{FRAME_PREFIX}{frame_no - 1:05d}_{stamp}.jpg')
+
+
+# ----- /send-frame pipeline (executors tunable via PIPELINE_SEND_FRAME) -----
+
+def _record_stage(frame_data: bytes, session: str):
+    _recorder.record(session, frame_data)
+
+
+def _decode_stage(frame_data: bytes, inflight: dict, infer: bool):
+    # Without a model (or on frames the auto-tuner skips), JPEGs are stored and previewed undecoded
+    is_jpeg = stages.is_jpeg(frame_data)
+    frame = None
+    inflight['bytes'] += len(frame_data)
+    _inflight_frames.add(len(frame_data))
+    if (model is not None and infer) or not is_jpeg:
+        frame = stages.decode_image(frame_data, MODEL_INPUT_SIZE)
+        inflight['bytes'] += frame.nbytes
+        _inflight_frames.add(frame.nbytes)
+    # Browsers already send JPEG, so the received bytes are stored and previewed as-is
+    return {'frame': frame, 'jpeg': frame_data if is_jpeg else stages.encode_jpeg(frame)}
+
+
+def _store_stage(jpeg: bytes, session: str):
+    global frame_count
+    captured = columnar.us_to_datetime(time.time_ns() // 1000)
+    with _frame_count_lock:
+        frame_index = frame_count
+        frame_count += 1
+    timestamp = captured.strftime("%Y%m%d_%H%M%S_%f")[:-3]
+    frame_path = os.path.join(FRAMES_DIR, f'{FRAME_PREFIX}{frame_index:05d}_{timestamp}.jpg')
+    # Queue the frame for the background writer; retention is handled there too
+    _frame_writer.submit(frame_path, jpeg)
+    metrics.FRAMES_TOTAL.inc(endpoint='send-frame', session=session)
+    return {'frame_no': frame_index + 1, 'frame_path': frame_path, 'captured': captured}
+
+
+def _predict_kwargs() -> dict:
+    return {
+        # With a sidecar, keep low-scoring alternatives too; the label still uses CONF_THRESH
+        'conf': min(CONF_THRESH, TOPK_CONF) if _sidecar else CONF_THRESH,
+        'iou': IOU_THRESH,
+        'max_det': max(MAX_DET, _sidecar.k) if _sidecar else MAX_DET,
+        'imgsz': _autotune.imgsz if _autotune is not None else None,
+    }
+
+
+def _predict_stage(frame, infer: bool):
+    if frame is None or not infer:
+        return {'prediction': None}
     try:
-        results = model.predict(
-            source=frame_bgr,
-            conf=CONF_THRESH,
-            iou=IOU_THRESH,
-            max_det=MAX_DET,
-            verbose=False,
-        )
-        if not results:
-            if LOG_EMPTY:
-                _log_detection({
-                    'frame_count': frame_count,
-                    'timestamp': datetime.now().isoformat(),
-                    'label': 'none',
-                    'confidence': 0.0,
-                    'frame_path': frame_path,
-                })
-            return
-
-        result = results[0]
-        if result.boxes is not None and len(result.boxes) > 0:
-            confs = result.boxes.conf
-            best_idx = int(confs.argmax().item())
-            best_conf = float(confs[best_idx].item())
-            best_cls = int(result.boxes.cls[best_idx].item())
-            label = result.names.get(best_cls, str(best_cls))
-            _log_detection({
-                'frame_count': frame_count,
-                'timestamp': datetime.now().isoformat(),
-                'label': label,
-                'confidence': best_conf,
-                'frame_path': frame_path,
-            })
-        elif LOG_EMPTY:
-            _log_detection({
-                'frame_count': frame_count,
-                'timestamp': datetime.now().isoformat(),
-                'label': 'none',
-                'confidence': 0.0,
-                'frame_path': frame_path,
-            })
+        with _scheduler.slot('live'), _models.acquire() as handle:
+            if handle is None:
+                return {'prediction': None}
+            started = time.perf_counter()
+            prediction = stages.predict(handle, frame, **_predict_kwargs())
     except Exception as e:
         print(f"WARNING: YOLO detection failed: {e}")
+        return {'prediction': None}
+    if _autotune is not None:
+        _autotune.observe(time.perf_counter() - started)
+    return {'prediction': prediction}
+
+
+def _predict_batch_stage(items: list[dict]) -> list[dict]:
+    todo = [i for i, item in enumerate(items) if item['frame'] is not None and item['infer']]
+    outs = [{'prediction': None} for _ in items]
+    if not todo:
+        return outs
+    try:
+        with _scheduler.slot('live'), _models.acquire() as handle:
+            if handle is None:
+                return outs
+            started = time.perf_counter()
+            preds = stages.predict_batch(handle, [items[i]['frame'] for i in todo], **_predict_kwargs())
+    except Exception as e:
+        print(f"WARNING: YOLO detection failed: {e}")
+        return outs
+    if _autotune is not None:
+        # Every frame in the batch waited for the whole forward pass
+        _autotune.observe(time.perf_counter() - started, frames=len(todo))
+    for i, pred in zip(todo, preds):
+        outs[i] = {'prediction': pred}
+    return outs
+
+
+def _label_stage(prediction, frame_no: int, frame_path: str, captured: datetime):
+    if prediction is None:
+        return {'detection': None}
+    if _sidecar is not None:
+        _sidecar.add_result(frame_no, columnar.datetime_to_us(captured), prediction)
+    label, best_conf, _ = prediction.best()
+    if label is None or best_conf < CONF_THRESH:
+        if not LOG_EMPTY:
+            return {'detection': None}
+        label, best_conf = 'none', 0.0
+    return {'detection': {
+        'frame_count': frame_no,
+        'timestamp': captured.isoformat(),
+        'label': label,
+        'confidence': best_conf,
+        'frame_path': frame_path,
+    }}
+
+
+def _log_stage(detection, session: str):
+    if detection is not None:
+        _log_detection(detection, session)
+
+
+def _preview_stage(jpeg: bytes, frame, detection):
+    _live_feed.publish(jpeg, frame, detection)
+
+
+_frame_pipeline = pipeline.Pipeline('send-frame', [
+    *([pipeline.Stage('record', _record_stage, ('frame_data', 'session'))] if _recorder is not None else []),
+    # Every stage here touches module state (buffers, counters, model, sidecar, live feed),
+    # so none is process_safe; use thread executors to spread them out
+    pipeline.Stage('decode', _decode_stage, ('frame_data', 'inflight', 'infer'), ('frame', 'jpeg')),
+    pipeline.Stage('disk_enqueue', _store_stage, ('jpeg', 'session'), ('frame_no', 'frame_path', 'captured')),
+    pipeline.Stage('predict', _predict_stage, ('frame', 'infer'), ('prediction',), batch_fn=_predict_batch_stage),
+    pipeline.Stage('label', _label_stage, ('prediction', 'frame_no', 'frame_path', 'captured'), ('detection',)),
+    pipeline.Stage('log', _log_stage, ('detection', 'session')),
+    pipeline.Stage('preview', _preview_stage, ('jpeg', 'frame', 'detection')),
+], provided=('frame_data', 'session', 'inflight', 'infer'))
+# Per-endpoint and per-session limits in front of the pipeline (ADMIT_* / ADMIT_SEND_FRAME_*)
+_admission = admission.controller_from_env('send-frame')
+# Trades inference size, then frame stride, for latency (AUTOTUNE_*)
+_autotune = autotune.tuner_from_env(
+    'send-frame', _models.current.input_size if _models.current is not None else 0,
+    backlog_fn=lambda: _admission.waiting if _admission is not None else 0,
+)
+
+
+def _admin_authorized() -> bool:
+    if not ADMIN_TOKEN:
+        return False
+    supplied = request.headers.get('X-Admin-Token', '')
+    auth = request.headers.get('Authorization', '')
+    if not supplied and auth.startswith('Bearer '):
+        supplied = auth[len('Bearer '):]
+    return hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode())
+
+
+def _require_admin():
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'admin endpoints disabled (set ADMIN_TOKEN)'}), 403
+    if not _admin_authorized():
+        return jsonify({'error': 'unauthorized'}), 401
+    return None
+
+
+def _profile_requested() -> bool:
+    return (
+        request.method == 'POST'
+        and (request.args.get('profile') == '1' or request.headers.get('X-Profile') == '1')
+        and _admin_authorized()
+    )
 
 
 @app.before_request
 def log_request():
     """Log all incoming requests"""
+    g.request_started = time.perf_counter()
+    if request.path in PROFILABLE_PATHS and _profile_requested():
+        g.request_profile = _request_profiler.start()
     try:
         if request.method == 'POST':
             print(f"[{datetime.now().strftime('%H:%M:%S')}] {request.method} {request.path} - Files: {list(request.files.keys())}")
@@ -155,15 +442,44 @@ def log_request():
         print(f"Error logging request: {e}")
 
 
+@app.after_request
+def record_request_metrics(response):
+    """Record request latency and status per endpoint"""
+    profile = g.pop('request_profile', None)
+    if profile is not None:
+        report_id = _request_profiler.finish(profile, request.path)
+        response.headers['X-Profile-Id'] = str(report_id)
+    started = g.get('request_started')
+    if started is not None:
+        labels = {
+            'endpoint': request.url_rule.rule if request.url_rule else 'unmatched',
+            'method': request.method,
+            'status': response.status_code,
+        }
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, **labels)
+        metrics.REQUESTS_TOTAL.inc(**labels)
+    return response
+
+
 @app.route('/send-frame', methods=['POST', 'OPTIONS'])
 def receive_frame():
-    global frame_count
-
     # Handle CORS preflight
     if request.method == 'OPTIONS':
         return '', 204
 
+    if not INGEST_ENABLED:
+        return jsonify({'status': 'error', 'message': f'Frame ingest disabled (SERVER_MODE={SERVER_MODE})'}), 503
+
+    if memdiag.should_shed():
+        response = jsonify({'status': 'error', 'message': 'Server over memory budget, retry later'})
+        response.headers['Retry-After'] = '2'
+        return response, 503
+
+    inflight = {'bytes': 0}
     try:
+        session = metrics.session_from_request(request)
+        parse_started = time.perf_counter()
+
         # Check if frame file exists
         if 'frame' not in request.files:
             error_msg = 'No frame in request'
@@ -174,50 +490,469 @@ def receive_frame():
 
         # Read frame data (don't check for empty filename - blobs may not have one)
         frame_data = frame_file.read()
+        metrics.STAGE_SECONDS.observe(
+            time.perf_counter() - parse_started, endpoint='send-frame', session=session, stage='parse'
+        )
 
         if not frame_data or len(frame_data) == 0:
             error_msg = 'Empty frame data'
             print(f"ERROR: {error_msg}")
             return jsonify({'status': 'error', 'message': error_msg}), 400
 
-        # Convert bytes to image
         try:
-            image = Image.open(io.BytesIO(frame_data))
-            frame = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-        except Exception as e:
+            slot = _admission.admit(session) if _admission is not None else nullcontext()
+        except admission.Rejected as e:
+            response = jsonify({'status': 'error', 'message': f'Server busy, retry later ({e})'})
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, e.status
+
+        try:
+            with slot:
+                ctx = _frame_pipeline.run({
+                    'frame_data': frame_data,
+                    'session': session,
+                    'inflight': inflight,
+                    'infer': _autotune.should_infer(session) if _autotune is not None else True,
+                })
+        except stages.InvalidImage as e:
             error_msg = f"Invalid image data: {str(e)}"
             print(f"ERROR: {error_msg}")
             return jsonify({'status': 'error', 'message': error_msg}), 400
-
-        # Save frame to disk
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
-        frame_path = os.path.join(FRAMES_DIR, f'frame_{frame_count:05d}_{timestamp}.jpg')
-        cv2.imwrite(frame_path, frame)
-        frame_count += 1
-        _prune_old_frames()
-
-        # Realtime detection (if enabled)
-        _run_detection(frame, frame_path)
-
-        if frame_count % 30 == 0:  # Log every 30 frames
-            print(f"Received {frame_count} frames...")
-
-        return jsonify({'status': 'success', 'frame_count': frame_count}), 200
+        except pipeline.PipelineBusy as e:
+            response = jsonify({'status': 'error', 'message': f'Server busy, retry later ({e})'})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+
+        if ctx['frame_no'] % 30 == 0:  # Log every 30 frames
+            print(f"Received {ctx['frame_no']} frames...")
+
+        body = {'status': 'success', 'frame_count': ctx['frame_no']}
+        if ctx.get('detection') is not None:
+            body['label'] = ctx['detection']['label']
+            body['confidence'] = ctx['detection']['confidence']
+        return jsonify(body), 200
     except Exception as e:
         error_msg = f"Server error: {str(e)}"
         print(f"ERROR: {error_msg}")
         return jsonify({'status': 'error', 'message': error_msg}), 400
+    finally:
+        _inflight_frames.sub(inflight['bytes'])
 
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
-    return jsonify({'status': 'ok', 'frames': frame_count}), 200
+    body = {'status': 'ok', 'frames': frame_count, 'frame_writer': _frame_writer.stats()}
+    if _recorder is not None:
+        body['recording'] = _recorder.stats()
+    if _admission is not None:
+        body['admission'] = _admission.stats()
+    if _autotune is not None:
+        body['autotune'] = _autotune.stats()
+    if isinstance(_models.current, cascade.Cascade):
+        body['cascade'] = _models.current.stats()
+    if _models.current is not None:
+        body['model'] = {'weights': _models.current.weights, 'generation': _models.stats()['generation']}
+        body['scheduler'] = _scheduler.stats()
+    return jsonify(body), 200
+
+
+@app.route('/feed.mjpg', methods=['GET'])
+def feed_mjpeg():
+    """MJPEG stream of the newest received frame (?overlay=1 draws the detection, ?fps=N caps the rate)"""
+    overlay = request.args.get('overlay') == '1'
+    try:
+        max_fps = float(request.args.get('fps', '0'))
+    except ValueError:
+        max_fps = 0.0
+    if not _live_feed.acquire_viewer():
+        response = jsonify({'error': f'too many feed viewers (FEED_MAX_VIEWERS={FEED_MAX_VIEWERS})'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    response = Response(_live_feed.mjpeg(overlay, max_fps, max_seconds=FEED_MAX_SECONDS),
+                        mimetype=live_feed.MJPEG_CONTENT_TYPE)
+    response.headers['Cache-Control'] = 'no-store'
+    response.call_on_close(_live_feed.release_viewer)
+    return response
+
+
+@app.route('/feed/latest.jpg', methods=['GET'])
+def feed_latest():
+    """The newest received frame as a single JPEG"""
+    seq, jpeg, detection = _live_feed.latest(request.args.get('overlay') == '1')
+    if not jpeg:
+        return jsonify({'error': 'no frame received yet'}), 404
+    response = Response(jpeg, mimetype='image/jpeg')
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Frame-Seq'] = str(seq)
+    if detection:
+        response.headers['X-Detection'] = f"{detection['label']} {detection['confidence']:.4f}"
+    return response
+
+
+@app.route('/capabilities', methods=['GET'])
+def capabilities():
+    """Capture settings for clients: scale the long side to input_size, encode at jpeg_quality"""
+    return jsonify({
+        'input_size': MODEL_INPUT_SIZE,
+        'jpeg_quality': CAPTURE_JPEG_QUALITY,
+        'max_fps': CAPTURE_MAX_FPS,
+        # Frames at or below input_size (including letterboxed squares) are used as sent
+        'accepts_letterboxed': True,
+        'detection': model is not None,
+        'mode': SERVER_MODE,
+    }), 200
+
+
+@app.route('/logs/raw', methods=['GET'])
+def logs_raw():
+    """Buffered detections (?since=<X-Log-Seq> for only the new rows)"""
+    return _log_views.response('raw')
+
+
+@app.route('/logs/compacted', methods=['GET'])
+def logs_compacted():
+    """Consecutive same-label detections from the buffer as frame ranges"""
+    return _log_views.response('compacted')
+
+
+@app.route('/logs/corrected', methods=['GET'])
+def logs_corrected():
+    """Words from the compacted ranges, corrected to the nearest dictionary word"""
+    return _log_views.response('corrected')
+
+
+@app.route('/logs/runs', methods=['GET'])
+def logs_runs():
+    """Frame ranges with each range's frame count and mean confidence"""
+    return _log_views.response('runs')
+
+
+@app.route('/logs/words', methods=['GET'])
+def logs_words():
+    """Words from the confidence-aware decoder, with their raw letters and confidence"""
+    return _log_views.response('words')
+
+
+@app.route('/pipeline', methods=['GET'])
+def pipeline_config():
+    """Stages, executors and queue depths of the server's pipelines"""
+    return jsonify({_frame_pipeline.name: _frame_pipeline.describe()}), 200
+
+
+@app.route('/detections/stats', methods=['GET'])
+def detections_stats():
+    """Label histogram, confidence stats and label runs over the in-memory buffer"""
+    label = request.args.get('label') or None
+    with _buffer_lock:
+        stats = {
+            'rows': len(_detections_buffer),
+            'labels': _detections_buffer.label_histogram(),
+            'confidence': _detections_buffer.confidence_stats(label),
+            'runs': _detections_buffer.runs() if request.args.get('runs') == '1' else None,
+            'bytes': _detections_buffer.nbytes,
+        }
+    return jsonify(stats), 200
+
+
+@app.route('/history', methods=['GET'])
+def history_query():
+    """Query stored detections by session, frame range, time window and labels"""
+    if _history is None:
+        return jsonify({'error': 'history store disabled'}), 404
+    try:
+        params = history.query_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+    return jsonify(_history.query(**params)), 200
+
+
+@app.route('/history/sessions', methods=['GET'])
+def history_sessions():
+    """Sessions present in the history store with row counts and frame ranges"""
+    if _history is None:
+        return jsonify({'error': 'history store disabled'}), 404
+    return jsonify(_history.sessions()), 200
+
+
+# ----- /video/process: bulk detection over uploaded videos -----
+
+_video_jobs: dict[str, dict] = {}
+_video_jobs_lock = Lock()
+
+
+def _video_rows(start: int, preds: list) -> list[dict]:
+    rows = []
+    for offset, prediction in enumerate(preds):
+        frame_idx = start + offset
+        label, conf, _ = prediction.best()
+        if label is None or conf < CONF_THRESH:
+            if not LOG_EMPTY:
+                continue
+            label, conf = 'none', 0.0
+        rows.append({
+            'frame_count': frame_idx,
+            'timestamp': None,
+            'label': label,
+            'confidence': conf,
+            'frame_path': f'video_frame_{frame_idx:05d}',
+        })
+    return rows
+
+
+def _run_video_job(job: dict, video_path: Path):
+    import cv2
+    # cProfile only sees the thread that enabled it, so a profiled job is captured here
+    profile = _request_profiler.start() if job.get('profile_id') is not None else None
+    if job.get('profile_id') is not None and profile is None:
+        job['profile_id'] = None
+    job['status'] = 'running'
+    job['started'] = datetime.now().isoformat()
+    started = time.perf_counter()
+    rows = []
+    cap = cv2.VideoCapture(str(video_path))
+    try:
+        if not cap.isOpened():
+            raise ValueError('Failed to open video file')
+        job['frames_total'] = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        frame_idx = 0
+        done = False
+        while not done:
+            frames = []
+            while len(frames) < VIDEO_BATCH:
+                ok, frame = cap.read()
+                if not ok:
+                    done = True
+                    break
+                height, width = frame.shape[:2]
+                if MODEL_INPUT_SIZE and max(height, width) > MODEL_INPUT_SIZE:
+                    scale = MODEL_INPUT_SIZE / max(height, width)
+                    frame = cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+                frames.append(frame)
+            if not frames:
+                break
+            # One batch per bulk slot: live frames waiting get the model at every batch boundary
+            with _scheduler.slot('bulk'), _models.acquire() as handle:
+                preds = stages.predict_batch(handle, frames, CONF_THRESH, IOU_THRESH, MAX_DET)
+            rows += _video_rows(frame_idx + 1, preds)
+            frame_idx += len(frames)
+            job['frames_done'] = frame_idx
+            job['detections'] = len(rows)
+        outputs = {
+            'detections.json': rows,
+            'compactedLog.json': stages.compact_ranges(rows),
+        }
+        outputs['CorrectedLog.json'] = stages.correct_words(outputs['compactedLog.json'])
+        for name, value in outputs.items():
+            with open(video_path.parent / name, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False, indent=2)
+        job['status'] = 'done'
+    except Exception as e:
+        job['status'] = 'failed'
+        job['error'] = str(e)
+        print(f"ERROR: video job {job['id']} failed: {e}")
+    finally:
+        cap.release()
+        video_path.unlink(missing_ok=True)
+        elapsed = time.perf_counter() - started
+        job['finished'] = datetime.now().isoformat()
+        job['seconds'] = round(elapsed, 3)
+        job['fps'] = round(job['frames_done'] / elapsed, 2) if elapsed > 0 else None
+        if profile is not None:
+            _request_profiler.finish(profile, '/video/process', report_id=job['profile_id'])
+
+
+@app.route('/video/process', methods=['POST'])
+def video_process():
+    """
+    Run YOLO over an uploaded video in the background at bulk priority.
+    Writes detections.json, compactedLog.json and CorrectedLog.json to VIDEO_JOBS_DIR/<job>/;
+    ?wait=1 blocks until the job is finished. With ?profile=1 (admin) the job thread
+    runs under cProfile; the job's profile_id names the report once the job ends.
+    """
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file in request'}), 400
+
+    video_file = request.files['file']
+    if not video_file.filename:
+        return jsonify({'error': 'No file selected'}), 400
+
+    if _models.current is None:
+        return jsonify({'error': 'YOLO model not loaded. Check weights path.'}), 500
+
+    job_id = uuid.uuid4().hex[:12]
+    job_dir = VIDEO_JOBS_DIR / job_id
+    job_dir.mkdir(parents=True, exist_ok=True)
+    video_path = job_dir / ('input' + (Path(video_file.filename).suffix or '.mp4'))
+    video_file.save(str(video_path))
+    job = {
+        'id': job_id,
+        'filename': video_file.filename,
+        'status': 'queued',
+        'frames_total': 0,
+        'frames_done': 0,
+        'detections': 0,
+        'output_dir': str(job_dir),
+    }
+    if _profile_requested():
+        job['profile_id'] = _request_profiler.reserve()
+    with _video_jobs_lock:
+        _video_jobs[job_id] = job
+    worker = threading.Thread(target=_run_video_job, args=(job, video_path), name=f'video-{job_id}', daemon=True)
+    worker.start()
+    if request.args.get('wait') == '1':
+        worker.join()
+        return jsonify(job), 200 if job['status'] == 'done' else 500
+    return jsonify(job), 202
+
+
+@app.route('/video/jobs', methods=['GET'])
+def video_jobs():
+    with _video_jobs_lock:
+        return jsonify(list(_video_jobs.values())), 200
+
+
+@app.route('/video/jobs/<job_id>', methods=['GET'])
+def video_job(job_id: str):
+    with _video_jobs_lock:
+        job = _video_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'unknown job'}), 404
+    return jsonify(job), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
+
+@app.route('/admin/memory', methods=['GET'])
+def admin_memory():
+    """RSS, per-subsystem accounting, budgets and the latest tracemalloc diff"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    return jsonify(memdiag.report()), 200
+
+
+@app.route('/admin/memory/snapshot', methods=['POST'])
+def admin_memory_snapshot():
+    """Take a tracemalloc snapshot now and return the top allocation diffs"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    try:
+        limit = int(request.args.get('limit', str(memdiag.TOP_N)))
+    except ValueError:
+        limit = memdiag.TOP_N
+    return jsonify({'memory': memdiag.sample(), 'top_diffs': memdiag.take_snapshot(limit)}), 200
+
+
+@app.route('/admin/model', methods=['GET'])
+def admin_model():
+    """Serving weights, in-flight inferences per model generation and the last reload"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    return jsonify(_models.stats()), 200
+
+
+@app.route('/admin/model/reload', methods=['POST'])
+def admin_model_reload():
+    """Load and warm up weights (?weights=, default the current file) in the background, then swap"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    if _models.loader is None:
+        return jsonify({'error': f'detection disabled (SERVER_MODE={SERVER_MODE})'}), 503
+    weights = request.args.get('weights') or (request.get_json(silent=True) or {}).get('weights')
+    wait = request.args.get('wait') == '1'
+    try:
+        _models.reload(weights, wait=wait)
+    except model_reload.ReloadInProgress as e:
+        return jsonify({'error': f'reload already in progress ({e})'}), 409
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(_models.stats()), 200 if wait else 202
+
+
+@app.route('/admin/recordings', methods=['GET'])
+def admin_recordings():
+    """Open session archives (RECORD_DIR)"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    if _recorder is None:
+        return jsonify({'error': 'recording disabled (set RECORD_DIR)'}), 404
+    return jsonify(_recorder.stats()), 200
+
+
+@app.route('/admin/recordings/close', methods=['POST'])
+def admin_recordings_close():
+    """Finish a session's archive (?session=, default all) so it can be replayed"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    if _recorder is None:
+        return jsonify({'error': 'recording disabled (set RECORD_DIR)'}), 404
+    closed = _recorder.stats()
+    session = request.args.get('session') or None
+    _recorder.close(session)
+    if session is not None:
+        closed = {k: v for k, v in closed.items() if k == session}
+    return jsonify({'closed': closed}), 200
+
+
+@app.route('/admin/profile', methods=['POST'])
+def admin_profile():
+    """Sample every thread for N seconds and return collapsed (flamegraph-ready) stacks"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    try:
+        seconds = float(request.args.get('seconds', '10'))
+        interval = float(request.args.get('interval_ms', '10')) / 1000.0
+    except ValueError:
+        return jsonify({'error': 'seconds and interval_ms must be numbers'}), 400
+    try:
+        collapsed, summary = profiler.sample_stacks(seconds, interval)
+    except profiler.ProfilerBusy as e:
+        return jsonify({'error': str(e)}), 409
+    print(f"[profile] sampled {summary['samples']} times over {summary['seconds']}s")
+    response = Response(collapsed, mimetype='text/plain')
+    response.headers['X-Profile-Samples'] = str(summary['samples'])
+    response.headers['X-Profile-Seconds'] = str(summary['seconds'])
+    return response
+
+
+@app.route('/admin/profile/requests', methods=['GET'])
+def admin_profile_requests():
+    """List recent per-request cProfile captures"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    return jsonify(_request_profiler.list()), 200
+
+
+@app.route('/admin/profile/requests/<int:report_id>', methods=['GET'])
+def admin_profile_request(report_id: int):
+    """Return one cProfile report captured with ?profile=1"""
+    denied = _require_admin()
+    if denied:
+        return denied
+    report = _request_profiler.get(report_id)
+    if report is None:
+        return jsonify({'error': 'profile not found'}), 404
+    return Response(report['report'], mimetype='text/plain')
 
 
 if __name__ == '__main__':
+    backend_port = int(os.environ.get('BACKEND_PORT', os.environ.get('PORT', '5000')))
     print('=' * 50)
-    print('Starting Flask server on http://localhost:5000')
+    print(f'Starting Flask server on http://localhost:{backend_port}')
+    print('(development server; see run_production.sh for multi-worker serving)')
+    print(f'Mode: {SERVER_MODE}')
     print(f'Saving frames to: {os.path.abspath(FRAMES_DIR)}')
     if DETECTION_ENABLED:
         print(f'YOLO enabled: {model is not None}, weights: {WEIGHTS_PATH}')
@@ -227,12 +962,14 @@ if __name__ == '__main__':
     print('Press Ctrl+C to stop')
     print('=' * 50)
     try:
-        app.run(host='0.0.0.0', port=5000, debug=False, use_reloader=False, threaded=True)
+        app.run(host='0.0.0.0', port=backend_port, debug=False, use_reloader=False, threaded=True)
     except Exception as e:
         print(f'Server error: {e}')
         print('Server will continue running if possible...')
         import traceback
-        traceback.print_exc()from __future__ import annotations
+        traceback.print_exc()
+
+# from __future__ import annotations
 
 # import io
 # import re
@@ -0,0 +1,151 @@
+"""
+Session recording for deterministic replay.
+
+Frames on disk are pruned and carry no arrival timing, so a latency or
+accuracy complaint cannot be reproduced from them. ``SessionRecorder``
+appends every frame a session uploads, exactly as received, to one
+archive per session together with its arrival time. ``python/replay.py``
+pushes an archive back through the server or the pipeline.
+
+Archive layout (``<session>-<YYYYmmdd_HHMMSS>.sprc``):
+
+    b'SPRC1\\n'                      magic
+    <JSON header line>              {"session", "started_ns", "version"}
+    repeated records:
+        <q offset_ns><I length>     little-endian, offset from started_ns
+        <length bytes>              the uploaded image bytes
+
+Records are appended with one buffered write each, so recording costs
+one small memcpy per frame on the request thread.
+
+Configuration (environment):
+    RECORD_DIR          directory for archives; unset disables recording
+    RECORD_SESSIONS     comma-separated sessions to record (default: all)
+    RECORD_MAX_MB       stop appending to an archive beyond this size (default 512)
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import struct
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import metrics
+
+MAGIC = b'SPRC1\n'
+RECORD = struct.Struct('<qI')
+
+RECORDED_FRAMES = metrics.counter('session_recorded_frames_total', 'Frames appended to session archives.', ('session',))
+RECORDED_BYTES = metrics.counter('session_recorded_bytes_total', 'Bytes appended to session archives.')
+
+
+def _safe_name(session: str) -> str:
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', session)[:64] or 'default'
+
+
+class _Archive:
+    def __init__(self, path: Path, session: str):
+        self.path = path
+        self.started_ns = time.time_ns()
+        self.file = open(path, 'wb')
+        header = json.dumps({'session': session, 'started_ns': self.started_ns, 'version': 1})
+        self.file.write(MAGIC + header.encode() + b'\n')
+        self.size = self.file.tell()
+        self.frames = 0
+        self.full = False
+
+
+class SessionRecorder:
+    def __init__(self, directory, sessions=None, max_bytes: int = 512 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.sessions = set(sessions) if sessions else None
+        self.max_bytes = max_bytes
+        self._archives: dict[str, _Archive] = {}
+        self._lock = threading.Lock()
+
+    def wants(self, session: str) -> bool:
+        return self.sessions is None or session in self.sessions
+
+    def record(self, session: str, data: bytes, arrival_ns: int | None = None):
+        """Append one received frame; a no-op for sessions not being recorded."""
+        if not self.wants(session):
+            return
+        arrival_ns = arrival_ns or time.time_ns()
+        with self._lock:
+            archive = self._archives.get(session)
+            if archive is None:
+                stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                archive = _Archive(self.directory / f'{_safe_name(session)}-{stamp}.sprc', session)
+                self._archives[session] = archive
+                print(f"Recording session {session!r} -> {archive.path}")
+            if archive.full:
+                return
+            if archive.size + RECORD.size + len(data) > self.max_bytes:
+                archive.full = True
+                print(f"WARNING: session archive {archive.path} reached RECORD_MAX_MB, no longer recording")
+                return
+            archive.file.write(RECORD.pack(arrival_ns - archive.started_ns, len(data)))
+            archive.file.write(data)
+            archive.size += RECORD.size + len(data)
+            archive.frames += 1
+        RECORDED_FRAMES.inc(session=session)
+        RECORDED_BYTES.inc(RECORD.size + len(data))
+
+    def flush(self):
+        with self._lock:
+            for archive in self._archives.values():
+                archive.file.flush()
+
+    def close(self, session: str | None = None):
+        """Finish one session's archive (or all); the next frame starts a new archive."""
+        with self._lock:
+            names = [session] if session is not None else list(self._archives)
+            for name in names:
+                archive = self._archives.pop(name, None)
+                if archive is not None:
+                    archive.file.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                name: {'path': str(a.path), 'frames': a.frames, 'bytes': a.size, 'full': a.full}
+                for name, a in self._archives.items()
+            }
+
+
+def recorder_from_env() -> SessionRecorder | None:
+    directory = os.environ.get('RECORD_DIR', '')
+    if not directory:
+        return None
+    sessions = [s.strip() for s in os.environ.get('RECORD_SESSIONS', '').split(',') if s.strip()]
+    max_mb = float(os.environ.get('RECORD_MAX_MB', '512'))
+    return SessionRecorder(directory, sessions, int(max_mb * 1024 * 1024))
+
+
+def read_header(path) -> dict:
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path}: not a session archive')
+        return json.loads(f.readline())
+
+
+def read_archive(path):
+    """Yield ``(offset_seconds, data)`` for each recorded frame; a truncated tail is ignored."""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{path}: not a session archive')
+        f.readline()
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            offset_ns, length = RECORD.unpack(head)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            yield offset_ns / 1e9, data
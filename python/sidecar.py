@@ -0,0 +1,221 @@
+"""
+Top-k class score sidecar for detections.
+
+While detecting, each frame's top-k (class id, score) pairs, or the full
+class-score vector, are appended to a compact binary file of fixed-size
+records:
+
+    frame   int64
+    ts_us   int64             capture time, microseconds since the epoch
+    cls     int16[k]          class ids, best first (-1 = padding)
+    score   float16[k]
+
+A JSON header next to it (``<sidecar>.json``) records k and the class
+names. ``load()`` memory-maps the records, so re-thresholding or
+re-decoding a session runs over numpy arrays instead of re-running YOLO:
+
+    python python/sidecar.py rethreshold detections.topk.bin --conf 0.5 --out detections.json
+    python python/sidecar.py decode detections.topk.bin --conf 0.5
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from threading import Lock
+
+import numpy as np
+
+FLUSH_EVERY = 64
+
+
+def record_dtype(k: int) -> np.dtype:
+    return np.dtype([
+        ('frame', '<i8'),
+        ('ts_us', '<i8'),
+        ('cls', '<i2', (k,)),
+        ('score', '<f2', (k,)),
+    ])
+
+
+def _to_numpy(value) -> np.ndarray:
+    if hasattr(value, 'cpu'):
+        value = value.cpu()
+    if hasattr(value, 'numpy'):
+        value = value.numpy()
+    return np.asarray(value)
+
+
+def class_scores(result, num_classes: int) -> np.ndarray:
+    """
+    Per-class scores for one ultralytics result (or ``stages.Prediction``).
+
+    Classification models expose the full probability vector. Detection
+    models only keep boxes that survive NMS, so each class is scored by its
+    best surviving box (class-aware NMS keeps competing classes for the
+    same hand as separate boxes).
+    """
+    probs = getattr(result, 'probs', None)
+    if probs is not None:
+        if not isinstance(probs, np.ndarray):
+            probs = _to_numpy(probs.data)
+        return probs.astype(np.float32)[:num_classes]
+    scores = np.zeros(num_classes, dtype=np.float32)
+    # ultralytics results keep boxes under .boxes; stages.Prediction carries cls/conf directly
+    boxes = getattr(result, 'boxes', result)
+    if boxes is not None and getattr(boxes, 'conf', None) is not None and len(boxes.conf) > 0:
+        conf = _to_numpy(boxes.conf).astype(np.float32)
+        cls = _to_numpy(boxes.cls).astype(np.int64)
+        keep = (cls >= 0) & (cls < num_classes)
+        np.maximum.at(scores, cls[keep], conf[keep])
+    return scores
+
+
+def top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    k = min(k, len(scores))
+    idx = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    idx = idx[np.argsort(-scores[idx], kind='stable')]
+    return idx.astype(np.int16), scores[idx]
+
+
+class SidecarWriter:
+    """Appends fixed-size top-k records; thread-safe, flushed in small batches."""
+
+    def __init__(self, path, names: dict | list, k: int = 5, full: bool = False):
+        self.path = Path(path)
+        self.full = full
+        self.requested_k = k
+        self._pending: list = []
+        self._lock = Lock()
+        self._configure(names)
+
+    def _configure(self, names: dict | list):
+        self.names = [names[i] for i in sorted(names)] if isinstance(names, dict) else list(names)
+        self.num_classes = len(self.names)
+        self.k = self.num_classes if self.full else max(1, min(self.requested_k, self.num_classes))
+        self.dtype = record_dtype(self.k)
+        self._write_header()
+
+    def set_names(self, names: dict | list):
+        """Follow a model swap: flush, then start a new sidecar if the classes changed."""
+        with self._lock:
+            self._flush_locked()
+            if isinstance(names, dict):
+                names = [names[i] for i in sorted(names)]
+            if list(names) != self.names:
+                self._configure(names)
+
+    def _write_header(self):
+        header_path = Path(f'{self.path}.json')
+        header = {'k': self.k, 'full': self.full, 'names': self.names, 'dtype': 'frame:i8,ts_us:i8,cls:i2[k],score:f2[k]'}
+        if header_path.exists() and self.path.exists():
+            try:
+                existing = json.loads(header_path.read_text(encoding='utf-8'))
+            except Exception:
+                existing = None
+            if existing and (existing.get('k'), existing.get('names')) != (self.k, self.names):
+                # Incompatible layout: start a fresh sidecar rather than corrupting the old one
+                self.path.rename(self.path.with_suffix(self.path.suffix + '.old'))
+        header_path.write_text(json.dumps(header, ensure_ascii=False, indent=2) + '\n', encoding='utf-8')
+
+    def add(self, frame: int, ts_us: int, scores: np.ndarray):
+        record = np.zeros((), dtype=self.dtype)
+        record['frame'] = frame
+        record['ts_us'] = ts_us
+        cls, score = top_k(scores, self.k)
+        if not self.full:
+            # Classes no surviving box voted for are padding, not zero-probability evidence
+            keep = score > 0
+            cls, score = cls[keep], score[keep]
+        record['cls'][:] = -1
+        record['cls'][:len(cls)] = cls
+        record['score'][:len(score)] = score.astype(np.float16)
+        with self._lock:
+            self._pending.append(record)
+            if len(self._pending) >= FLUSH_EVERY:
+                self._flush_locked()
+
+    def add_result(self, frame: int, ts_us: int, result):
+        self.add(frame, ts_us, class_scores(result, self.num_classes))
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        with open(self.path, 'ab') as f:
+            np.array(self._pending, dtype=self.dtype).tofile(f)
+        self._pending = []
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+
+def load(path) -> tuple[np.ndarray, dict]:
+    """Memory-map a sidecar; returns ``(records, header)``."""
+    header = json.loads(Path(f'{path}.json').read_text(encoding='utf-8'))
+    dtype = record_dtype(int(header['k']))
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=dtype), header
+    return np.memmap(path, dtype=dtype, mode='r'), header
+
+
+def rethreshold(records: np.ndarray, names: list[str], conf: float, log_empty: bool = False) -> list[dict]:
+    """Rebuild detections.json rows at a new confidence threshold, vectorised."""
+    from columnar import NO_TS, us_to_datetime
+
+    best_cls = records['cls'][:, 0].astype(np.int64)
+    best_score = records['score'][:, 0].astype(np.float32)
+    hit = (best_cls >= 0) & (best_score >= conf)
+    keep = np.ones(len(records), dtype=bool) if log_empty else hit
+    rows = []
+    for i in np.flatnonzero(keep):
+        ts_us = int(records['ts_us'][i])
+        rows.append({
+            'frame_count': int(records['frame'][i]),
+            'timestamp': None if ts_us == NO_TS else us_to_datetime(ts_us).isoformat(),
+            'label': names[best_cls[i]] if hit[i] else 'none',
+            'confidence': round(float(best_score[i]), 4) if hit[i] else 0.0,
+        })
+    return rows
+
+
+def _write_rows(rows: list[dict], out_path: str):
+    with open(out_path, 'w', encoding='utf-8') as f:
+        f.write('[\n')
+        for i, row in enumerate(rows):
+            line = json.dumps(row, ensure_ascii=False)
+            f.write(f"  {line},\n" if i < len(rows) - 1 else f"  {line}\n")
+        f.write(']\n')
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Offline re-thresholding/decoding over a top-k sidecar')
+    sub = ap.add_subparsers(dest='cmd', required=True)
+    for name in ('rethreshold', 'decode'):
+        p = sub.add_parser(name)
+        p.add_argument('sidecar', help='path to the .topk.bin sidecar')
+        p.add_argument('--conf', type=float, default=0.4, help='confidence threshold')
+        p.add_argument('--log-empty', action='store_true', help="keep below-threshold frames as 'none'")
+        if name == 'rethreshold':
+            p.add_argument('--out', default=None, help='write rows to this JSON file instead of stdout')
+    args = ap.parse_args()
+
+    records, header = load(args.sidecar)
+    rows = rethreshold(records, header['names'], args.conf, args.log_empty)
+    if args.cmd == 'rethreshold':
+        if args.out:
+            _write_rows(rows, args.out)
+            print(f'{len(rows)} rows from {len(records)} frames written to {args.out}')
+        else:
+            json.dump(rows, sys.stdout, ensure_ascii=False, indent=2)
+            print()
+    else:
+        import decoder
+        decoded = decoder.decode_frames(rows)
+        print(json.dumps({'text': decoded.text, 'confidence': decoded.confidence, 'words': decoded.words}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+"""
+Frame-processing steps shared by every pipeline configuration.
+
+These are the single implementations of decode, detection, compaction,
+correction and annotation that both servers (and the offline tools) wire
+into ``pipeline.Pipeline`` stages. Heavy libraries are imported on first
+use, and everything that may run in a process pool (``ModelHandle``,
+``Prediction``) pickles cheaply.
+"""
+from __future__ import annotations
+
+import io
+import math
+import os
+from dataclasses import dataclass, field
+
+import numpy as np
+
+import decoder
+import metrics
+
+SEPARATOR_LABELS = decoder.SEPARATOR_LABELS
+
+DECODE_SCALE = metrics.counter(
+    'frame_decode_total', 'Frames decoded, by JPEG downscale factor (1 = full size).', ('scale',),
+)
+
+
+# ----- decode / encode -----
+
+class InvalidImage(ValueError):
+    """Uploaded bytes could not be decoded as an image."""
+
+
+def is_jpeg(data: bytes) -> bool:
+    return data[:2] == b'\xff\xd8' and data.rstrip(b'\x00')[-2:] == b'\xff\xd9'
+
+
+def decode_image(data: bytes, max_side: int = 0) -> np.ndarray:
+    """
+    Decode an uploaded image to BGR; raises ``InvalidImage`` for undecodable data.
+
+    With ``max_side``, an oversized JPEG is decoded directly at a reduced
+    scale (1/2, 1/4 or 1/8, in the DCT domain) as long as its long side
+    stays at or above ``max_side``. Frames already at model size, including
+    letterboxed ones, decode unchanged.
+    """
+    import cv2
+    from PIL import Image, UnidentifiedImageError
+    try:
+        image = Image.open(io.BytesIO(data))
+        scale = 1
+        width, height = image.size
+        if max_side and image.format == 'JPEG' and max(width, height) > max_side:
+            ratio = max_side / max(width, height)
+            image.draft('RGB', (math.ceil(width * ratio), math.ceil(height * ratio)))
+            scale = max(1, round(width / image.size[0]))
+        image.load()
+        DECODE_SCALE.inc(scale=str(scale))
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        raise InvalidImage(str(e)) from e
+    return cv2.cvtColor(np.array(image.convert('RGB')), cv2.COLOR_RGB2BGR)
+
+
+def encode_jpeg(image: np.ndarray, quality: int = 90) -> bytes:
+    import cv2
+    ok, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError('JPEG encoding failed')
+    return buf.tobytes()
+
+
+# ----- detection -----
+
+class ModelHandle:
+    """
+    A YOLO model that can cross process boundaries.
+
+    In the owning process it wraps the already loaded model; pickling keeps
+    only the weights path, and each pool process loads its own copy once.
+    """
+
+    def __init__(self, weights, model=None):
+        self.weights = str(weights)
+        self._model = model
+        self._pid = os.getpid() if model is not None else None
+
+    def __getstate__(self):
+        return {'weights': self.weights}
+
+    def __setstate__(self, state):
+        self.weights = state['weights']
+        self._model = None
+        self._pid = None
+
+    def get(self):
+        if self._model is None or self._pid != os.getpid():
+            from ultralytics import YOLO
+            self._model = YOLO(self.weights)
+            self._pid = os.getpid()
+        return self._model
+
+    def release(self):
+        """Drop the loaded model (a retired handle; a later ``get()`` would load it again)."""
+        self._model = None
+        self._pid = None
+
+    @property
+    def names(self) -> dict:
+        return self.get().names
+
+    @property
+    def input_size(self) -> int:
+        """Long side of the model's input (``imgsz``), 640 when the weights do not record it."""
+        model = self.get()
+        imgsz = (getattr(model, 'overrides', None) or {}).get('imgsz')
+        if imgsz is None:
+            imgsz = (getattr(getattr(model, 'model', None), 'args', None) or {}).get('imgsz')
+        if isinstance(imgsz, (list, tuple)):
+            imgsz = max(imgsz)
+        try:
+            return int(imgsz) if imgsz else 640
+        except (TypeError, ValueError):
+            return 640
+
+
+@dataclass
+class Prediction:
+    """The parts of an ultralytics result the pipelines use, as plain numpy arrays."""
+    names: dict
+    cls: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+    conf: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.float32))
+    xyxy: np.ndarray = field(default_factory=lambda: np.zeros((0, 4), dtype=np.float32))
+    probs: np.ndarray | None = None
+
+    @classmethod
+    def from_result(cls, result) -> 'Prediction':
+        def arr(value):
+            if hasattr(value, 'cpu'):
+                value = value.cpu()
+            if hasattr(value, 'numpy'):
+                value = value.numpy()
+            return np.asarray(value)
+
+        pred = cls(names=dict(result.names))
+        boxes = getattr(result, 'boxes', None)
+        if boxes is not None and len(boxes) > 0:
+            pred.cls = arr(boxes.cls).astype(np.int64)
+            pred.conf = arr(boxes.conf).astype(np.float32)
+            pred.xyxy = arr(boxes.xyxy).astype(np.float32)
+        probs = getattr(result, 'probs', None)
+        if probs is not None:
+            pred.probs = arr(probs.data).astype(np.float32)
+        return pred
+
+    def above(self, min_conf: float) -> 'Prediction':
+        """The boxes scoring at least ``min_conf``."""
+        keep = self.conf >= min_conf
+        return Prediction(self.names, self.cls[keep], self.conf[keep], self.xyxy[keep], self.probs)
+
+    def best(self) -> tuple[str | None, float, np.ndarray | None]:
+        """``(label, confidence, box)`` of the most confident box, or ``(None, 0.0, None)``."""
+        if not len(self.conf):
+            return None, 0.0, None
+        i = int(self.conf.argmax())
+        label = self.names.get(int(self.cls[i]), str(int(self.cls[i])))
+        return label, float(self.conf[i]), self.xyxy[i]
+
+
+def predict(model, frame: np.ndarray, conf: float, iou: float, max_det: int, imgsz: int | None = None) -> Prediction:
+    """``imgsz`` overrides the model's inference size (see ``autotune.py``)."""
+    if hasattr(model, 'predict_frames'):  # cascade.Cascade picks the model per frame
+        return model.predict_frames([frame], conf, iou, max_det, imgsz)[0]
+    model = model.get() if isinstance(model, ModelHandle) else model
+    extra = {'imgsz': imgsz} if imgsz else {}
+    results = model.predict(source=frame, conf=conf, iou=iou, max_det=max_det, verbose=False, **extra)
+    return Prediction.from_result(results[0]) if results else Prediction(names=dict(model.names))
+
+
+def predict_batch(model, frames: list, conf: float, iou: float, max_det: int, imgsz: int | None = None) -> list[Prediction]:
+    """One forward pass over several frames (ultralytics batches a list source)."""
+    if hasattr(model, 'predict_frames'):
+        return model.predict_frames(list(frames), conf, iou, max_det, imgsz)
+    model = model.get() if isinstance(model, ModelHandle) else model
+    extra = {'imgsz': imgsz} if imgsz else {}
+    results = model.predict(source=list(frames), conf=conf, iou=iou, max_det=max_det, verbose=False, **extra)
+    return [Prediction.from_result(r) for r in results]
+
+
+# ----- compaction / correction -----
+
+def _frame_label_conf(row):
+    if isinstance(row, dict):
+        return row.get('frame_count') or row.get('frame'), row.get('label'), row.get('confidence', 1.0)
+    if isinstance(row, (list, tuple)) and len(row) >= 3:
+        # realtime_detect.py rows: [frame, confidence, label]
+        return row[0], row[2], row[1]
+    return None, None, None
+
+
+def _runs(rows) -> list[dict]:
+    runs: list[dict] = []
+    current = None
+    for row in rows or []:
+        frame, label, conf = _frame_label_conf(row)
+        if frame is None or label is None:
+            continue
+        try:
+            frame = int(frame)
+            conf = float(conf or 0.0)
+        except (TypeError, ValueError):
+            continue
+        if current is not None and label == current['label']:
+            current['end'] = max(current['end'], frame)
+            current['frames'] += 1
+            current['conf_sum'] += conf
+            continue
+        current = {'label': label, 'start': frame, 'end': frame, 'frames': 1, 'conf_sum': conf}
+        runs.append(current)
+    return runs
+
+
+def compact_ranges(rows) -> list[dict]:
+    """Collapse consecutive same-label detections into ``{"frameRange": "a-b", "label"}`` (compactedLog.json)."""
+    return [{'frameRange': f"{r['start']}-{r['end']}", 'label': r['label']} for r in _runs(rows)]
+
+
+def compact_runs(rows) -> list[dict]:
+    """``compact_ranges`` plus each range's frame count and mean confidence (the decoder's input)."""
+    return [
+        {
+            'frameRange': f"{r['start']}-{r['end']}",
+            'label': r['label'],
+            'frames': r['frames'],
+            'confidence': round(r['conf_sum'] / r['frames'], 4),
+        }
+        for r in _runs(rows)
+    ]
+
+
+def _range(entry: dict) -> tuple[int, int] | None:
+    try:
+        start, end = str(entry.get('frameRange') or entry.get('frame') or '').split('-', 1)
+        return int(start), int(end)
+    except ValueError:
+        return None
+
+
+def _words(compacted: list[dict]):
+    """``(start, end, entries)`` per word: compacted ranges split at separator labels."""
+    words = []
+    entries: list[dict] = []
+    start = end = None
+    for entry in compacted or []:
+        label = entry.get('label')
+        span = _range(entry)
+        if not label or span is None:
+            continue
+        if str(label).lower() in SEPARATOR_LABELS:
+            if entries:
+                words.append((start, end, entries))
+            entries, start, end = [], None, None
+            continue
+        if start is None:
+            start = span[0]
+        end = span[1]
+        entries.append(entry)
+    if entries:
+        words.append((start, end, entries))
+    return words
+
+
+def correct_words(compacted: list[dict]) -> list[dict]:
+    """Split compacted ranges into words and correct each to the nearest dictionary word (CorrectedLog.json)."""
+    return [
+        {'frame': f'{start}-{end}', 'string': decoder.match_word(''.join(str(e['label']) for e in entries))}
+        for start, end, entries in _words(compacted)
+    ]
+
+
+def decode_words(runs: list[dict]) -> list[dict]:
+    """Split ``compact_runs`` output into words and decode each with the confidence-aware decoder."""
+    words = []
+    for start, end, entries in _words(runs):
+        decoded = decoder.decode_segment([
+            decoder.Run(
+                str(e['label']),
+                int(e.get('frames') or (_range(e)[1] - _range(e)[0] + 1)),
+                float(e.get('confidence', 1.0)),
+            )
+            for e in entries
+        ])
+        words.append({
+            'frame': f'{start}-{end}',
+            'string': decoded['string'],
+            'raw': decoded['raw'],
+            'confidence': decoded['confidence'],
+        })
+    return words
+
+
+# ----- annotation -----
+
+def annotate(image: np.ndarray, text: str, position: str = 'top', box=None) -> np.ndarray:
+    """Copy of ``image`` with ``text`` drawn on a dark band (and ``box`` outlined when given)."""
+    import cv2
+    canvas = image.copy()
+    if box is not None:
+        x1, y1, x2, y2 = (int(v) for v in box)
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), (0, 255, 0), 2)
+    if text:
+        h, w = canvas.shape[:2]
+        scale = max(0.6, min(1.2, w / 800))
+        (tw, th), base = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, 2)
+        y = th + 12 if position == 'top' else h - 12
+        cv2.rectangle(canvas, (0, y - th - 10), (tw + 16, y + base + 4), (0, 0, 0), -1)
+        cv2.putText(canvas, text, (8, y), cv2.FONT_HERSHEY_SIMPLEX, scale, (0, 255, 0), 2, cv2.LINE_AA)
+    return canvas
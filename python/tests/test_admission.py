@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+import admission
+
+
+def test_admits_up_to_max_concurrency_without_waiting():
+    ctl = admission.AdmissionController('t-free', max_concurrency=2)
+    with ctl.admit('a'), ctl.admit('b'):
+        assert ctl.stats()['running'] == 2
+    assert ctl.stats()['running'] == 0
+
+
+def test_session_over_its_limit_gets_429():
+    ctl = admission.AdmissionController('t-session', max_concurrency=4, session_limit=2)
+    with ctl.admit('a'), ctl.admit('a'):
+        with pytest.raises(admission.Rejected) as info:
+            ctl.admit('a')
+        assert info.value.status == 429
+        assert info.value.retry_after >= 1
+        # Other sessions are unaffected
+        with ctl.admit('b'):
+            pass
+
+
+def test_expected_wait_over_budget_is_shed_immediately():
+    ctl = admission.AdmissionController('t-latency', max_concurrency=1, latency_budget=0.05, service_time=1.0)
+    with ctl.admit('a'):
+        started = time.monotonic()
+        with pytest.raises(admission.Rejected) as info:
+            ctl.admit('b')
+        assert info.value.status == 503
+        assert time.monotonic() - started < 0.05
+
+
+def test_waiter_times_out_after_the_budget():
+    ctl = admission.AdmissionController('t-timeout', max_concurrency=1, latency_budget=0.1, service_time=0.01)
+    with ctl.admit('a'):
+        with pytest.raises(admission.Rejected) as info:
+            ctl.admit('b')
+        assert info.value.status == 503
+    assert ctl.stats()['waiting'] == 0
+
+
+def test_freed_slot_goes_to_the_session_with_fewest_running():
+    ctl = admission.AdmissionController('t-fair', max_concurrency=2, session_limit=8, latency_budget=5.0,
+                                        service_time=0.01)
+    order = []
+    busy = ctl.admit('heavy')
+    other = ctl.admit('heavy')
+
+    def request(session):
+        with ctl.admit(session):
+            order.append(session)
+            time.sleep(0.02)
+
+    threads = [threading.Thread(target=request, args=('heavy',))]
+    threads[0].start()
+    while ctl.waiting < 1:
+        time.sleep(0.005)
+    threads.append(threading.Thread(target=request, args=('light',)))
+    threads[1].start()
+    while ctl.waiting < 2:
+        time.sleep(0.005)
+    busy.__exit__(None, None, None)
+    time.sleep(0.05)
+    other.__exit__(None, None, None)
+    for t in threads:
+        t.join(5)
+    # 'light' queued second but has nothing running, so it gets the first free slot
+    assert order == ['light', 'heavy']
+
+
+def test_controller_from_env(monkeypatch):
+    monkeypatch.setenv('ADMIT_MAX_CONCURRENCY', '3')
+    monkeypatch.setenv('ADMIT_T_ENV_MAX_CONCURRENCY', '5')
+    assert admission.controller_from_env('t-env').max_concurrency == 5
+    assert admission.controller_from_env('other').max_concurrency == 3
+    monkeypatch.setenv('ADMIT_ENABLE', '0')
+    assert admission.controller_from_env('t-env') is None
+
+
+def test_two_sessions_share_a_saturated_controller_fairly():
+    ctl = admission.AdmissionController('t-share', max_concurrency=1, session_limit=8, latency_budget=10.0,
+                                        max_queue=64, service_time=0.001)
+    served = []
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def client(session):
+        while not stop.is_set():
+            with ctl.admit(session):
+                with lock:
+                    served.append(session)
+                    if len(served) >= 200:
+                        stop.set()
+                time.sleep(0.001)
+
+    # 'greedy' keeps six requests in flight, 'modest' only two
+    threads = [threading.Thread(target=client, args=('greedy',)) for _ in range(6)]
+    threads += [threading.Thread(target=client, args=('modest',)) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    # Skip the warm-up before both sessions were queued
+    share = served[20:200].count('modest') / len(served[20:200])
+    assert 0.4 <= share <= 0.6
@@ -0,0 +1,67 @@
+import json
+
+import autotune
+
+
+def _tuner(**kwargs):
+    kwargs.setdefault('interval', 0.0)
+    return autotune.AutoTuner('t-tune', target=0.1, imgsz_max=640, imgsz_min=448, imgsz_step=96, stride_max=3, **kwargs)
+
+
+def test_ladder_goes_from_largest_size_to_largest_stride():
+    assert autotune.ladder(640, 448, 96, 3) == [(640, 1), (544, 1), (448, 1), (448, 2), (448, 3)]
+    # Sizes are rounded to multiples of 32
+    assert autotune.ladder(650, 300, 70, 1) == [(640, 1), (576, 1), (512, 1), (448, 1), (384, 1), (320, 1), (288, 1)]
+
+
+def _feed(tuner, seconds):
+    for _ in range(autotune.MIN_SAMPLES):
+        tuner.observe(seconds)
+
+
+def test_steps_down_over_target_and_back_up_with_headroom(tmp_path):
+    log = tmp_path / 'autotune.jsonl'
+    tuner = _tuner(log_path=str(log))
+    _feed(tuner, 0.2)
+    assert (tuner.imgsz, tuner.stride) == (544, 1)
+    for _ in range(5):
+        _feed(tuner, 0.2)
+    # Bottom of the ladder: stays there
+    assert (tuner.imgsz, tuner.stride) == (448, 3)
+    _feed(tuner, 0.01)
+    assert (tuner.imgsz, tuner.stride) == (448, 2)
+    records = [json.loads(line) for line in log.read_text().splitlines()]
+    assert [r['direction'] for r in records] == ['down'] * 4 + ['up']
+    assert records[0]['from'] == {'imgsz': 640, 'stride': 1}
+
+
+def test_backlog_forces_a_step_down():
+    backlog = [5]
+    tuner = _tuner(backlog_fn=lambda: backlog[0])
+    _feed(tuner, 0.01)
+    assert tuner.level == 1
+    backlog[0] = 0
+    _feed(tuner, 0.01)
+    assert tuner.level == 0
+
+
+def test_stride_skips_frames_per_session():
+    tuner = _tuner()
+    tuner.level = len(tuner.ladder) - 1
+    assert [tuner.should_infer('a') for _ in range(6)] == [True, False, False, True, False, False]
+    assert tuner.should_infer('b')
+
+
+def test_session_counters_are_bounded():
+    tuner = _tuner()
+    for i in range(autotune.MAX_SESSIONS + 10):
+        tuner.should_infer(f's{i}')
+    assert len(tuner._counts) == autotune.MAX_SESSIONS
+    assert 's0' not in tuner._counts
+
+
+def test_disabled_without_a_target(monkeypatch):
+    monkeypatch.delenv('AUTOTUNE_TARGET_MS', raising=False)
+    assert autotune.tuner_from_env('t-env', 640) is None
+    monkeypatch.setenv('AUTOTUNE_TARGET_MS', '80')
+    assert autotune.tuner_from_env('t-env', 640).ladder[0] == (640, 1)
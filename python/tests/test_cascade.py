@@ -0,0 +1,34 @@
+import numpy as np
+
+import cascade
+import stages
+
+NAMES = {0: 'A', 1: 'B'}
+
+
+def _prediction(*scores):
+    n = len(scores)
+    return stages.Prediction(
+        NAMES, np.zeros(n, dtype=np.int64), np.array(scores, dtype=np.float32), np.zeros((n, 4), dtype=np.float32),
+    )
+
+
+def test_routes_and_empty_frames_stay_empty_at_a_low_conf(monkeypatch):
+    fast = {'confident': _prediction(0.9, 0.1), 'empty': _prediction(0.2, 0.1), 'unsure': _prediction(0.5)}
+    calls = []
+
+    def predict_batch(handle, frames, conf, iou, max_det, imgsz=None):
+        calls.append((handle, list(frames), conf))
+        if handle == 'fast':
+            return [fast[f] for f in frames]
+        return [_prediction(0.7) for _ in frames]
+
+    monkeypatch.setattr(stages, 'predict_batch', predict_batch)
+    c = cascade.Cascade('fast', 'full', accept_conf=0.8, empty_conf=0.25)
+    # 0.05 is what python/server.py passes with the top-k sidecar on
+    outs = c.predict_frames(['confident', 'empty', 'unsure'], 0.05, 0.5, 5)
+    assert outs[0].conf.tolist() == [np.float32(0.9), np.float32(0.1)]
+    assert len(outs[1].conf) == 0 and outs[1].best()[0] is None
+    assert outs[2].conf.tolist() == [np.float32(0.7)]
+    assert calls[1] == ('full', ['unsure'], 0.05)
+    assert c.counts == {'confident': 1, 'empty': 1, 'escalated': 1}
@@ -0,0 +1,73 @@
+import pytest
+
+import columnar
+
+
+def _entry(frame, label, conf=0.5):
+    return {'frame_count': frame, 'timestamp': f'2026-01-01T00:00:{frame:02d}', 'label': label, 'confidence': conf}
+
+
+def _filled(maxlen, labels):
+    buf = columnar.DetectionColumns(maxlen)
+    for i, label in enumerate(labels):
+        buf.append(_entry(i + 1, label, 0.5 + i / 100))
+    return buf
+
+
+def test_rows_round_trip_as_dicts():
+    buf = _filled(10, 'AB')
+    assert list(buf) == [_entry(1, 'A', 0.5), _entry(2, 'B', 0.51)]
+    assert buf[-1]['label'] == 'B'
+    with pytest.raises(IndexError):
+        buf[2]
+
+
+def test_eviction_keeps_the_newest_rows_and_sequence_numbers():
+    buf = _filled(3, 'AABBC')
+    assert len(buf) == 3
+    assert (buf.first_seq, buf.seq) == (2, 5)
+    assert [r['frame_count'] for r in buf] == [3, 4, 5]
+
+
+def test_since_returns_rows_from_a_sequence_number():
+    buf = _filled(3, 'AABBC')
+    assert [r['frame_count'] for r in buf.since(4)] == [5]
+    assert buf.since(5) == []
+    # Older than the retained rows: everything that is left
+    assert [r['frame_count'] for r in buf.since(0)] == [3, 4, 5]
+
+
+def test_clear_and_drop_keep_the_sequence_monotonic():
+    buf = _filled(5, 'ABC')
+    assert buf.drop_oldest(1) == 1
+    assert buf[0]['label'] == 'B'
+    assert buf.first_seq == 1
+    buf.clear()
+    assert not buf
+    assert (buf.first_seq, buf.seq) == (3, 3)
+    buf.append(_entry(9, 'D'))
+    assert buf.since(3) == [_entry(9, 'D')]
+
+
+def test_rebase_renumbers_rows_and_pinned_paths_survive_a_new_path_fn():
+    buf = columnar.DetectionColumns(5, path_fn=lambda n, ts: f'frame_{n:05d}.jpg')
+    for i, label in enumerate('ABC'):
+        buf.append(_entry(i + 1, label))
+    buf.append(dict(_entry(4, 'D'), frame_path='elsewhere.jpg'))
+    buf.pin_paths()
+    buf.rebase(1 << 40)
+    buf.path_fn = lambda n, ts: f'frame_7_{n:05d}.jpg'
+    assert (buf.first_seq, buf.seq) == (1 << 40, (1 << 40) + 4)
+    assert [r['frame_path'] for r in buf] == ['frame_00001.jpg', 'frame_00002.jpg', 'frame_00003.jpg', 'elsewhere.jpg']
+    buf.append(_entry(5, 'E'))
+    assert buf.since((1 << 40) + 4)[0]['frame_path'] == 'frame_7_00005.jpg'
+
+
+def test_histogram_runs_and_confidence_stats():
+    buf = _filled(10, 'AABBBC')
+    assert buf.label_histogram() == {'A': 2, 'B': 3, 'C': 1}
+    assert [(r['label'], r['start_frame'], r['end_frame']) for r in buf.runs()] == [
+        ('A', 1, 2), ('B', 3, 5), ('C', 6, 6)]
+    stats = buf.confidence_stats('B')
+    assert stats['count'] == 3
+    assert stats['min'] == pytest.approx(0.52)
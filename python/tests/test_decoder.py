@@ -0,0 +1,40 @@
+import decoder
+
+
+def _rows(*runs):
+    rows = []
+    for label, frames, conf in runs:
+        rows += [{'label': label, 'confidence': conf}] * frames
+    return rows
+
+
+def test_confident_runs_decode_to_words_split_at_separators():
+    rows = _rows(('C', 5, 0.95), ('A', 5, 0.9), ('T', 5, 0.9), ('space', 3, 0.9),
+                 ('D', 4, 0.9), ('O', 4, 0.9), ('G', 4, 0.9))
+    decoded = decoder.decode_frames(rows)
+    assert decoded.text == 'cat dog'
+    assert [w['raw'] for w in decoded.words] == ['CAT', 'DOG']
+    assert decoded.confidence > 0.7
+
+
+def test_short_uncertain_transition_is_dropped():
+    rows = _rows(('D', 5, 0.9), ('X', 1, 0.3), ('O', 5, 0.9), ('G', 5, 0.9))
+    assert decoder.decode_frames(rows).text == 'dog'
+
+
+def test_one_run_may_cover_a_double_letter():
+    rows = _rows(('H', 5, 0.9), ('E', 5, 0.9), ('L', 6, 0.9), ('O', 5, 0.9))
+    assert decoder.decode_frames(rows).text == 'hello'
+
+
+def test_rows_without_letters_decode_to_nothing():
+    for rows in ([], [{'label': 'space'}], _rows(('none', 4, 0.9))):
+        decoded = decoder.decode_frames(rows)
+        assert decoded.text == ''
+        assert decoded.words == []
+
+
+def test_unknown_letters_are_kept_with_low_confidence():
+    decoded = decoder.decode_text('xqzv')
+    assert decoded.text == 'xqzv'
+    assert decoded.confidence < 0.5
@@ -0,0 +1,45 @@
+import json
+import random
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import stages
+
+UTILS_JS = Path(__file__).resolve().parents[2] / 'js' / 'detection-utils.js'
+
+# Loads the browser module with a stub localStorage and prints its logs for the rows on stdin
+HARNESS = """
+const fs = require('fs');
+const store = {};
+global.window = { localStorage: { getItem: (k) => store[k] ?? null, setItem: (k, v) => { store[k] = v; } } };
+eval(fs.readFileSync(process.argv[1], 'utf8'));
+const rows = JSON.parse(fs.readFileSync(0, 'utf8'));
+const utils = window.DetectionUtils;
+process.stdout.write(JSON.stringify(rows.map((r) => ({
+    compacted: utils.compactDetectionRanges(r),
+    corrected: utils.generateCorrectedLog(r),
+}))));
+"""
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='node is not installed')
+def test_browser_logs_match_the_server_stages():
+    rng = random.Random(7)
+    labels = list('HELOWRDTCAI') + ['sp', 'space', '_', 'fn', 'none']
+    cases = []
+    for _ in range(100):
+        frame, rows = 0, []
+        for _ in range(rng.randint(0, 40)):
+            frame += rng.choice((1, 1, 2))
+            rows.append({'frame_count': frame, 'label': rng.choice(labels), 'confidence': 0.9})
+        cases.append(rows)
+    out = subprocess.run(
+        ['node', '-e', HARNESS, str(UTILS_JS)], input=json.dumps(cases),
+        capture_output=True, text=True, check=True, timeout=60,
+    )
+    for rows, got in zip(cases, json.loads(out.stdout)):
+        compacted = stages.compact_ranges(rows)
+        assert got == {'compacted': compacted, 'corrected': stages.correct_words(compacted)}
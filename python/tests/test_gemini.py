@@ -0,0 +1,76 @@
+import threading
+import time
+import types
+
+import pytest
+
+import gemini
+
+
+class _FakeGenai:
+    """Stands in for ``google.genai``: ``Client`` fails while ``broken`` is set."""
+
+    def __init__(self):
+        self.broken = True
+        self.created = 0
+
+    def Client(self, api_key):
+        if self.broken:
+            raise RuntimeError('bad key')
+        self.created += 1
+        models = types.SimpleNamespace(generate_content=lambda model, contents: types.SimpleNamespace(text=' hi '))
+        return types.SimpleNamespace(models=models)
+
+
+def _backend(pool_size=1, acquire_timeout=0.05):
+    backend = gemini.GeminiBackend(api_key='k', pool_size=pool_size, acquire_timeout=acquire_timeout)
+    backend._genai = _FakeGenai()
+    return backend
+
+
+def test_failed_client_construction_returns_the_slot():
+    backend = _backend()
+    for _ in range(3):
+        with pytest.raises(gemini.AnalyzeConfigError):
+            backend.generate('p', 'm')
+    assert backend._created == 0
+    backend._genai.broken = False
+    assert backend.generate('p', 'm') == 'hi'
+    assert backend._created == 1
+
+
+def test_exhausted_pool_raises_busy_instead_of_blocking():
+    backend = _backend()
+    backend._genai.broken = False
+    held = backend._acquire()
+    with pytest.raises(gemini.AnalyzeBusy):
+        backend._acquire()
+    backend._pool.put(held)
+    assert backend._acquire() is held
+
+
+def test_analyzer_caches_and_coalesces():
+    stub = gemini.StubBackend(delay=0.1)
+    analyzer = gemini.Analyzer(stub, max_concurrency=2, max_pending=0)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(analyzer.analyze(' h  i '))) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert stub.calls == 1
+    assert sorted(source for _, source in results) == ['coalesced', 'coalesced', 'remote']
+    assert analyzer.analyze('H I') == ('hi', 'cache')
+
+
+def test_analyzer_rejects_past_max_pending():
+    analyzer = gemini.Analyzer(gemini.StubBackend(delay=0.2), max_concurrency=1, max_pending=0)
+    worker = threading.Thread(target=analyzer.analyze, args=('a',))
+    worker.start()
+    while not analyzer._inflight:
+        time.sleep(0.001)
+    try:
+        with pytest.raises(gemini.AnalyzeBusy):
+            analyzer.analyze('b')
+    finally:
+        worker.join()
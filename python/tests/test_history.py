@@ -0,0 +1,77 @@
+import pytest
+
+import history
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = history.HistoryStore(tmp_path / 'h.sqlite3', batch_size=4, flush_interval=0.01)
+    base = 1_700_000_000.0
+    for frame in range(1, 11):
+        store.add({'frame_count': frame, 'timestamp': base + frame, 'label': 'A' if frame <= 5 else 'B',
+                   'confidence': 0.9}, 'alice')
+    for frame in range(1, 4):
+        store.add({'frame_count': frame, 'timestamp': base + 100 + frame, 'label': 'C', 'confidence': 0.5}, 'bob')
+    store.flush()
+    return store
+
+
+def test_query_by_session_and_frame_range(store):
+    rows = store.query(session='alice', frame_from=3, frame_to=6)
+    assert [r['frame_count'] for r in rows] == [3, 4, 5, 6]
+    assert {r['session'] for r in rows} == {'alice'}
+
+
+def test_query_by_time_window_labels_order_and_limit(store):
+    base = 1_700_000_000.0
+    rows = store.query(since=base + 4, until=base + 103, labels=['B', 'C'], newest_first=True, limit=3)
+    assert [(r['session'], r['frame_count']) for r in rows] == [('bob', 3), ('bob', 2), ('bob', 1)]
+    rows = store.query(labels=['B'], limit=2)
+    assert [r['frame_count'] for r in rows] == [6, 7]
+
+
+def test_sessions_summary(store):
+    summary = {s['session']: s for s in store.sessions()}
+    assert summary['alice']['rows'] == 10
+    assert summary['alice']['frame_range'] == '1-10'
+    assert summary['bob']['rows'] == 3
+
+
+def test_query_args_parses_request_parameters():
+    params = history.query_args({'session': 's', 'frame_from': '2', 'label': 'A,B', 'since': '2024-01-01T00:00:00',
+                                 'order': 'desc', 'limit': ''})
+    assert params['session'] == 's'
+    assert params['frame_from'] == 2 and params['frame_to'] is None
+    assert params['labels'] == ['A', 'B']
+    assert params['since'] == history.to_epoch('2024-01-01T00:00:00')
+    assert params['newest_first'] is True
+    assert params['limit'] == 1000
+    with pytest.raises(ValueError):
+        history.query_args({'frame_from': 'x'})
+
+
+def test_frame_ranges_need_a_session(store):
+    with pytest.raises(ValueError):
+        store.query(frame_from=3)
+    with pytest.raises(ValueError):
+        history.query_args({'frame_to': '9'})
+
+
+@pytest.mark.parametrize('filters', [
+    {},
+    {'session': 'alice'},
+    {'session': 'alice', 'frame_from': 3, 'frame_to': 6},
+    {'session': 'alice', 'frame_from': 3, 'newest_first': True},
+    {'since': 1.0, 'until': 2.0},
+    {'labels': ['A', 'B']},
+    {'labels': ['A'], 'since': 1.0},
+    {'session': 'alice', 'since': 1.0},
+    {'session': 'alice', 'labels': ['A']},
+])
+def test_every_supported_filter_uses_an_index(store, filters):
+    args = dict.fromkeys(('session', 'frame_from', 'frame_to', 'since', 'until', 'labels'), None)
+    args.update(filters, limit=10, newest_first=filters.get('newest_first', False))
+    sql, params = history._select(**args)
+    plan = [row[3] for row in store._reader().execute('EXPLAIN QUERY PLAN ' + sql, params)]
+    access = [step for step in plan if 'detections' in step]
+    assert access and all('USING INDEX' in step or 'USING COVERING INDEX' in step for step in access), plan
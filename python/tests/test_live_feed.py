@@ -0,0 +1,41 @@
+import io
+import time
+
+import live_feed
+
+
+def test_viewer_slots_are_capped_and_returned():
+    feed = live_feed.LiveFeed(max_viewers=2)
+    assert feed.acquire_viewer()
+    assert feed.acquire_viewer()
+    assert not feed.acquire_viewer()
+    feed.release_viewer()
+    assert feed.acquire_viewer()
+    assert feed.viewers == 2
+
+
+def test_uncapped_feed_admits_everyone():
+    feed = live_feed.LiveFeed()
+    assert all(feed.acquire_viewer() for _ in range(10))
+
+
+def test_stream_ends_after_max_seconds_while_frames_keep_coming():
+    feed = live_feed.LiveFeed()
+    feed.publish(b'jpeg1')
+    stream = feed.mjpeg(idle_timeout=5.0, max_seconds=0.2)
+    started = time.monotonic()
+    parts = []
+    for part in stream:
+        parts.append(part)
+        feed.publish(b'jpeg%d' % (len(parts) + 1))
+        time.sleep(0.02)
+    assert time.monotonic() - started < 1.0
+    assert len(parts) > 1
+    frames = [jpeg for _, jpeg in live_feed.read_mjpeg(io.BytesIO(b''.join(parts)))]
+    assert frames[:2] == [b'jpeg1', b'jpeg2']
+
+
+def test_stream_ends_when_idle():
+    feed = live_feed.LiveFeed()
+    feed.publish(b'only')
+    assert len(list(feed.mjpeg(idle_timeout=0.05))) == 1
@@ -0,0 +1,141 @@
+import random
+import threading
+
+import pytest
+from flask import Flask, request
+
+import columnar
+import log_views
+
+
+@pytest.fixture
+def env():
+    buf = columnar.DetectionColumns(50)
+    lock = threading.Lock()
+    views = log_views.LogViews(buf, lock)
+    app = Flask(__name__)
+
+    @app.route('/logs/<view>')
+    def logs(view):
+        return views.response(view)
+
+    @app.route('/detections')
+    def detections():
+        return views.response('raw', limit=int(request.args.get('limit', '4')))
+
+    state = {'frame': 0}
+
+    def add(*labels):
+        for label in labels:
+            state['frame'] += 1
+            buf.append({'frame_count': state['frame'], 'timestamp': 't', 'label': label, 'confidence': 0.9})
+
+    return buf, app.test_client(), add
+
+
+def _apply(entries, response):
+    replace = response.headers.get('X-Log-Delta-Replace')
+    if replace is None:
+        return response.get_json()
+    del entries[:int(response.headers['X-Log-Delta-Drop'])]
+    if int(replace):
+        del entries[-int(replace):]
+    return entries + response.get_json()
+
+
+def test_full_response_is_versioned_and_revalidates(env):
+    _, client, add = env
+    add('A', 'B')
+    first = client.get('/logs/raw')
+    assert len(first.get_json()) == 2
+    assert first.headers['X-Log-Seq'] == '2'
+    assert 'X-Log-Delta-Replace' not in first.headers
+    again = client.get('/logs/raw', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_raw_delta_has_its_own_etag(env):
+    _, client, add = env
+    add('A', 'B')
+    full = client.get('/logs/raw')
+    add('C')
+    delta = client.get('/logs/raw?since=2')
+    assert [row['label'] for row in delta.get_json()] == ['C']
+    assert delta.headers['X-Log-Delta-Replace'] == '0'
+    assert delta.headers['X-Log-Seq'] == '3'
+    assert delta.headers['ETag'] != full.headers['ETag']
+    assert delta.headers['ETag'] != client.get('/logs/raw').headers['ETag']
+    assert client.get('/logs/raw?since=3').status_code == 304
+
+
+@pytest.mark.parametrize('view', log_views.VIEWS)
+def test_applying_deltas_reproduces_the_full_view(env, view):
+    _, client, add = env
+    rng = random.Random(view)
+    entries, query = [], ''
+    # Long enough to fill the 50-row buffer and evict
+    for _ in range(60):
+        add(*rng.choices(['A', 'B', 'C', 'sp', 'none'], k=rng.randint(0, 3)))
+        response = client.get(f'/logs/{view}{query}')
+        if response.status_code == 200:
+            entries = _apply(entries, response)
+        query = f"?since={response.headers['X-Log-Seq']}&first={response.headers['X-Log-First-Seq']}"
+        assert entries == client.get(f'/logs/{view}').get_json()
+
+
+def test_raw_delta_drops_evicted_rows(env):
+    buf, client, add = env
+    add(*('A' * 50))
+    add('B', 'C')
+    delta = client.get('/logs/raw?since=50&first=0')
+    assert delta.headers['X-Log-Delta-Drop'] == '2'
+    assert [r['label'] for r in delta.get_json()] == ['B', 'C']
+    # Derived views start over, and so does a client that does not say what it holds
+    assert 'X-Log-Delta-Replace' not in client.get('/logs/compacted?since=50&first=0').headers
+    assert 'X-Log-Delta-Replace' not in client.get('/logs/raw?since=50').headers
+
+
+def test_compacted_delta_replaces_the_grown_run(env):
+    _, client, add = env
+    add('A', 'B')
+    add('B', 'C')
+    delta = client.get('/logs/compacted?since=2')
+    assert delta.headers['X-Log-Delta-Replace'] == '1'
+    assert delta.get_json() == [{'frameRange': '2-3', 'label': 'B'}, {'frameRange': '4-4', 'label': 'C'}]
+
+
+def test_evicted_or_cleared_rows_force_a_full_response(env):
+    buf, client, add = env
+    add(*'AB')
+    buf.clear()
+    add('C')
+    response = client.get('/logs/raw?since=2')
+    assert 'X-Log-Delta-Replace' not in response.headers
+    assert [row['label'] for row in response.get_json()] == ['C']
+    add(*('D' * 60))
+    assert 'X-Log-Delta-Replace' not in client.get('/logs/raw?since=3').headers
+
+
+def test_since_from_another_sequence_space_gets_a_full_response(env):
+    buf, client, add = env
+    add(*'AB')
+    # A gunicorn worker numbers its rows from its own base, so a peer's since never matches
+    buf.rebase(1 << 40)
+    add('C')
+    response = client.get('/logs/raw?since=2&first=0')
+    assert 'X-Log-Delta-Replace' not in response.headers
+    assert [row['label'] for row in response.get_json()] == ['A', 'B', 'C']
+    assert response.headers['X-Log-First-Seq'] == str(1 << 40)
+
+
+def test_limit_applies_to_full_and_delta_responses(env):
+    _, client, add = env
+    add(*'ABCDE')
+    assert [r['label'] for r in client.get('/detections?limit=2').get_json()] == ['D', 'E']
+    assert len(client.get('/detections?limit=0').get_json()) == 5
+    assert len(client.get('/detections?limit=-3').get_json()) == 5
+    add(*'FGH')
+    delta = client.get('/detections?limit=2&since=5')
+    assert [r['label'] for r in delta.get_json()] == ['G', 'H']
+    assert delta.headers['ETag'] != client.get('/detections?limit=0&since=5').headers['ETag']
+    assert client.get('/detections?limit=2').headers['ETag'] != client.get('/detections?limit=3').headers['ETag']
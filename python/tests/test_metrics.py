@@ -0,0 +1,62 @@
+import metrics
+
+
+def _reset_sessions(monkeypatch, limit, idle):
+    monkeypatch.setattr(metrics, 'MAX_SESSIONS', limit)
+    monkeypatch.setattr(metrics, 'SESSION_IDLE_S', idle)
+    monkeypatch.setattr(metrics, '_sessions', metrics.OrderedDict())
+
+
+def test_counter_and_render():
+    c = metrics.counter('test_render_total', 'Test counter.', ('endpoint',))
+    c.inc(endpoint='a')
+    c.inc(2, endpoint='a')
+    assert c.value(endpoint='a') == 3
+    assert 'sparthack_test_render_total{endpoint="a"} 3' in metrics.render()
+
+
+def test_histogram_snapshot_is_cumulative():
+    h = metrics.histogram('test_hist_seconds', 'Test histogram.', buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 5.0):
+        h.observe(v)
+    snap = h.snapshot()
+    assert snap['count'] == 3
+    assert snap['buckets'] == [(0.1, 1), (1.0, 2)]
+
+
+def test_session_label_bounds_series(monkeypatch):
+    _reset_sessions(monkeypatch, limit=2, idle=3600)
+    c = metrics.counter('test_sessions_total', 'Test per-session counter.', ('session',))
+    for session in ('a', 'b', 'c', 'd', 'a'):
+        c.inc(session=session)
+    lines = [l for l in c.collect() if not l.startswith('#')]
+    assert sorted(lines) == [
+        'sparthack_test_sessions_total{session="a"} 2',
+        'sparthack_test_sessions_total{session="b"} 1',
+        'sparthack_test_sessions_total{session="other"} 2',
+    ]
+    # Reads do not claim a place
+    assert c.value(session='e') == 2
+    assert list(metrics._sessions) == ['b', 'a']
+
+
+def test_idle_session_gives_its_place_and_series_away(monkeypatch):
+    _reset_sessions(monkeypatch, limit=1, idle=0)
+    c = metrics.counter('test_idle_sessions_total', 'Test per-session counter.', ('session',))
+    c.inc(session='old')
+    c.inc(session='new')
+    lines = [l for l in c.collect() if not l.startswith('#')]
+    assert lines == ['sparthack_test_idle_sessions_total{session="new"} 1']
+
+
+def test_session_falls_back_to_the_client_address():
+    from flask import Flask, request
+
+    app = Flask(__name__)
+    with app.test_request_context('/send-frame', headers={'X-Session-Id': 'tab-1'}):
+        assert metrics.session_from_request(request) == 'tab-1'
+    with app.test_request_context('/send-frame', environ_base={'REMOTE_ADDR': '10.0.0.7'}):
+        assert metrics.session_from_request(request) == 'client-10.0.0.7'
+    with app.test_request_context('/send-frame', environ_base={'REMOTE_ADDR': '10.0.0.1'},
+                                  headers={'X-Forwarded-For': '192.168.1.5, 10.0.0.1'}):
+        assert metrics.session_from_request(request) == 'client-192.168.1.5'
@@ -0,0 +1,106 @@
+import gc
+import threading
+import weakref
+
+import numpy as np
+
+import model_reload
+import stages
+
+
+class FakeModel:
+    def __init__(self, weights, imgsz=640, names=None):
+        self.weights = weights
+        self.overrides = {'imgsz': imgsz}
+        self.names = names or {0: 'A', 1: 'B'}
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def predict(self, source, **kwargs):
+        self.started.set()
+        self.release.wait(5)
+        return []
+
+
+def _slot(tmp_path, on_swap=None, imgsz=320):
+    weights = tmp_path / 'new.pt'
+    weights.write_bytes(b'weights')
+    slot = model_reload.ModelSlot(
+        stages.ModelHandle(tmp_path / 'old.pt', FakeModel('old')),
+        loader=lambda path: FakeModel(path, imgsz=imgsz, names={0: 'A', 1: 'B', 2: 'C'}),
+        on_swap=on_swap,
+    )
+    return slot, weights
+
+
+def test_swap_frees_the_old_model_even_if_callers_keep_the_handle(tmp_path):
+    slot, weights = _slot(tmp_path)
+    with slot.acquire() as kept:
+        old_model = weakref.ref(kept.get())
+        slot.reload(weights, wait=True)
+        # Still borrowed: retired, not freed
+        assert slot.stats()['retired'] == [0]
+        assert old_model() is not None
+    gc.collect()
+    assert slot.stats()['retired'] == []
+    assert old_model() is None
+    assert slot.current.weights == str(weights)
+    assert slot.stats()['generation'] == 1
+
+
+def test_in_flight_inference_finishes_on_the_old_weights(tmp_path):
+    slot, weights = _slot(tmp_path)
+    old = slot.current.get()
+    old.release.clear()
+    done = []
+
+    def infer():
+        with slot.acquire() as handle:
+            stages.predict(handle, np.zeros((8, 8, 3), dtype=np.uint8), 0.5, 0.5, 1)
+            done.append(handle.weights)
+
+    t = threading.Thread(target=infer)
+    t.start()
+    assert old.started.wait(5)
+    slot.reload(weights, wait=True)
+    assert slot.stats()['in_flight'] == {'0': 1}
+    old.release.set()
+    t.join(5)
+    assert done == [str(tmp_path / 'old.pt')]
+    assert slot.stats()['retired'] == []
+
+
+def test_on_swap_sees_the_new_handle_and_failures_keep_the_old(tmp_path):
+    swapped = []
+    slot, weights = _slot(tmp_path, on_swap=lambda handle: swapped.append(handle.input_size))
+    slot.reload(tmp_path / 'missing.pt', wait=True)
+    assert slot.stats()['last_reload']['status'] == 'failed'
+    assert slot.current.weights == str(tmp_path / 'old.pt')
+    slot.reload(weights, wait=True)
+    assert swapped == [320]
+
+
+def test_derived_state_follows_the_new_model(tmp_path, monkeypatch):
+    import autotune
+    import sidecar
+
+    monkeypatch.delenv('AUTOTUNE_IMGSZ_MAX', raising=False)
+    tuner = autotune.AutoTuner('t-swap', target=0.1, imgsz_max=640, imgsz_min=320, imgsz_step=64, stride_max=2)
+    tuner.level = len(tuner.ladder) - 1
+    autotune.follow_model(tuner, 416)
+    assert tuner.ladder[0] == (416, 1)
+    assert (tuner.imgsz, tuner.stride) == (320, 2)
+
+    path = tmp_path / 'scores.topk.bin'
+    writer = sidecar.SidecarWriter(path, {0: 'A', 1: 'B'}, k=2)
+    writer.add(1, 0, np.array([0.9, 0.1], dtype=np.float32))
+    writer.set_names({0: 'A', 1: 'B', 2: 'C'})
+    writer.add(2, 0, np.array([0.1, 0.2, 0.7], dtype=np.float32))
+    writer.flush()
+    records, header = sidecar.load(path)
+    assert header['names'] == ['A', 'B', 'C']
+    assert records['frame'].tolist() == [2]
+    # Records written for the old classes are kept next to it
+    old = np.fromfile(path.with_suffix('.bin.old'), dtype=sidecar.record_dtype(2))
+    assert old['frame'].tolist() == [1]
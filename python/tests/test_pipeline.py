@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+import pipeline
+from pipeline import STOP, Pipeline, PipelineBusy, PipelineError, Stage
+
+
+def test_inline_stages_thread_the_context():
+    p = Pipeline('t-inline', [
+        Stage('double', lambda x: {'y': x * 2}, inputs=('x',), outputs=('y',)),
+        Stage('add', lambda x, y: {'z': x + y}, inputs=('x', 'y'), outputs=('z',)),
+    ], provided=('x',))
+    assert p.all_inline
+    assert p.run({'x': 3})['z'] == 9
+
+
+def test_stop_ends_the_item():
+    seen = []
+    p = Pipeline('t-stop', [
+        Stage('gate', lambda x: STOP if x < 0 else None, inputs=('x',)),
+        Stage('record', lambda x: seen.append(x), inputs=('x',)),
+    ], provided=('x',))
+    assert p.run({'x': -1})['stopped']
+    p.run({'x': 1})
+    assert seen == [1]
+
+
+def test_missing_inputs_are_rejected():
+    with pytest.raises(PipelineError):
+        Pipeline('t-invalid', [Stage('a', lambda y: {}, inputs=('y',))], provided=('x',))
+    with pytest.raises(PipelineError):
+        Stage('a', None, executor='gpu')
+
+
+def test_executor_spec_parsing():
+    assert pipeline.parse_executor_spec('predict=thread:2:batch=4:wait=10,log=inline') == {
+        'predict': {'executor': 'thread', 'workers': 2, 'batch_size': 4, 'batch_wait': 0.01},
+        'log': {'executor': 'inline'},
+    }
+
+
+def test_threaded_stage_batches_items():
+    sizes = []
+
+    def batch(items):
+        sizes.append(len(items))
+        return [{'y': item['x'] + 1} for item in items]
+
+    p = Pipeline('t-batch', [
+        Stage('inc', None, inputs=('x',), outputs=('y',), batch_fn=batch),
+    ], provided=('x',)).configure({'inc': {'executor': 'thread', 'workers': 1, 'batch_size': 8, 'batch_wait': 0.2}})
+    futures = [p.submit({'x': i}) for i in range(8)]
+    assert [f.result(5)['y'] for f in futures] == list(range(1, 9))
+    assert sum(sizes) == 8 and max(sizes) > 1
+
+
+def test_stage_errors_reach_the_caller():
+    def boom(x):
+        raise ValueError('bad frame')
+
+    p = Pipeline('t-error', [Stage('boom', boom, inputs=('x',), executor='thread')], provided=('x',))
+    with pytest.raises(ValueError, match='bad frame'):
+        p.run({'x': 1}, timeout=5)
+
+
+def test_full_queue_raises_busy():
+    release = threading.Event()
+    p = Pipeline('t-busy', [
+        Stage('slow', lambda x: release.wait(5) and None, inputs=('x',), executor='thread', queue_size=1),
+    ], provided=('x',), submit_timeout=0.05)
+    first = p.submit({'x': 1})
+    # One item running in the worker, one waiting in the queue, the next one is refused
+    futures = [p.submit({'x': i}) for i in range(2, 5)]
+    release.set()
+    errors = [f.exception(5) for f in futures]
+    assert any(isinstance(e, PipelineBusy) for e in errors)
+    assert first.result(5)['x'] == 1
+
+
+def _pid(x):
+    import os
+    return {'pid': os.getpid()}
+
+
+def test_only_process_safe_stages_run_in_a_process_pool():
+    import os
+    with pytest.raises(PipelineError, match='process pool'):
+        Stage('counter', _pid, inputs=('x',), outputs=('pid',), executor='process')
+    p = Pipeline('t-process', [
+        Stage('pure', _pid, inputs=('x',), outputs=('pid',), process_safe=True),
+        Stage('stateful', lambda pid: None, inputs=('pid',)),
+    ], provided=('x',))
+    with pytest.raises(PipelineError, match='stateful'):
+        p.configure({'stateful': {'executor': 'process'}})
+    p.configure({'pure': {'executor': 'process', 'workers': 1}, 'stateful': {'executor': 'inline'}})
+    assert p.run({'x': 1})['pid'] != os.getpid()
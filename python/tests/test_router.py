@@ -0,0 +1,138 @@
+import random
+import socket
+import threading
+
+import pytest
+from flask import Flask
+
+import columnar
+import log_views
+import router
+
+
+def _sessions(n=2000):
+    return [f'session-{i}' for i in range(n)]
+
+
+def test_ring_is_deterministic_and_spreads_sessions():
+    urls = [f'http://b{i}' for i in range(4)]
+    ring = router.HashRing(urls, vnodes=64)
+    assert ring.lookup('s1') == router.HashRing(reversed(urls), vnodes=64).lookup('s1')
+    owners = [ring.lookup(s) for s in _sessions()]
+    assert set(owners) == set(urls)
+    assert min(owners.count(u) for u in urls) > 2000 / 4 * 0.5
+    assert router.HashRing([]).lookup('s1') is None
+
+
+def test_adding_or_removing_a_backend_moves_only_its_share():
+    urls = [f'http://b{i}' for i in range(4)]
+    before = router.HashRing(urls)
+    grown = router.HashRing(urls + ['http://b4'])
+    moved = [s for s in _sessions() if before.lookup(s) != grown.lookup(s)]
+    # Only sessions the new backend takes over move, about 1/5 of them
+    assert all(grown.lookup(s) == 'http://b4' for s in moved)
+    assert 0.1 < len(moved) / 2000 < 0.3
+    shrunk = router.HashRing(urls[1:])
+    assert all(shrunk.lookup(s) == before.lookup(s) for s in _sessions() if before.lookup(s) != urls[0])
+
+
+class _AppBackend:
+    """A ``router.Backend`` stand-in serving a LogViews app through the Flask test client."""
+
+    url = 'http://shard'
+
+    def __init__(self, views):
+        app = Flask(__name__)
+
+        @app.route('/logs/<view>')
+        def logs(view):
+            return views.response(view)
+
+        self.client = app.test_client()
+        self.requests = []
+
+    def request(self, method, path, body=None, headers=None, stream=False, timeout=None):
+        self.requests.append(path)
+        response = self.client.open(path, method=method)
+        return response.status_code, list(response.headers.items()), response.data
+
+
+@pytest.mark.parametrize('view', router.LOG_VIEWS)
+def test_shard_log_mirror_follows_deltas(view):
+    buf = columnar.DetectionColumns(40)
+    backend = _AppBackend(log_views.LogViews(buf, threading.Lock()))
+    mirror = router._ShardLog()
+    rng = random.Random(view)
+    frame = 0
+    for step in range(40):
+        for label in rng.choices(['A', 'B', 'sp', 'none'], k=rng.randint(0, 3)):
+            frame += 1
+            buf.append({'frame_count': frame, 'timestamp': 't', 'label': label, 'confidence': 0.8})
+        if step == 25:
+            buf.clear()
+        mirror.refresh(backend, view)
+        assert mirror.entries == backend.client.get(f'/logs/{view}').get_json()
+        assert mirror.seq == buf.seq
+    assert any('since=' in path for path in backend.requests)
+
+
+def _healthy_router(url):
+    r = router.Router([url])
+    r._mark(r.backends[url], True)
+    return r
+
+
+def test_read_timeout_fails_the_request_but_not_the_backend(monkeypatch):
+    monkeypatch.setattr(router, 'TIMEOUT_S', 0.2)
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(8)    # accepts connections, never answers
+    url = f'http://127.0.0.1:{server.getsockname()[1]}'
+    try:
+        r = _healthy_router(url)
+        for _ in range(router.HEALTH_FAILS + 1):
+            with pytest.raises(router.BackendUnavailable) as info:
+                r.forward('s1', 'GET', '/health', b'', {})
+            assert not info.value.connect
+        backend = r.backends[url]
+        assert backend.healthy and backend.failures == 0
+        assert r.ring.nodes == [url]
+    finally:
+        server.close()
+
+
+def test_refused_connection_takes_the_backend_out_at_once():
+    probe = socket.socket()
+    probe.bind(('127.0.0.1', 0))
+    url = f'http://127.0.0.1:{probe.getsockname()[1]}'
+    probe.close()
+    r = _healthy_router(url)
+    # Refused: out of the ring at once, and the retry finds no other owner
+    with pytest.raises(router.BackendUnavailable, match='no healthy backends'):
+        r.forward('s1', 'GET', '/health', b'', {})
+    assert not r.backends[url].healthy
+    assert r.ring.nodes == []
+
+
+def test_proxy_keys_sessionless_clients_by_address(monkeypatch):
+    seen = []
+
+    class _Backend:
+        url = 'http://b0'
+
+    def forward(session, method, target, body, headers, stream):
+        seen.append((session, headers['X-Session-Id'], headers['X-Forwarded-For']))
+        return _Backend(), (200, [], b'ok')
+
+    monkeypatch.setattr(router.router, 'forward', forward)
+    client = router.app.test_client()
+    client.get('/capabilities', headers={'X-Session-Id': 'tab-1'}, environ_base={'REMOTE_ADDR': '10.0.0.2'})
+    client.get('/capabilities', environ_base={'REMOTE_ADDR': '10.0.0.3'})
+    client.get('/capabilities', environ_base={'REMOTE_ADDR': '10.0.0.4'})
+    client.get('/capabilities', headers={'X-Forwarded-For': '192.168.1.5'}, environ_base={'REMOTE_ADDR': '10.0.0.1'})
+    assert seen == [
+        ('tab-1', 'tab-1', '10.0.0.2'),
+        ('client-10.0.0.3', 'client-10.0.0.3', '10.0.0.3'),
+        ('client-10.0.0.4', 'client-10.0.0.4', '10.0.0.4'),
+        ('client-192.168.1.5', 'client-192.168.1.5', '192.168.1.5, 10.0.0.1'),
+    ]
@@ -0,0 +1,48 @@
+import decoder
+import stages
+
+
+def _rows(labels, conf=0.9):
+    return [{'frame_count': i + 1, 'label': label, 'confidence': conf} for i, label in enumerate(labels)]
+
+
+def test_compact_ranges_keeps_the_log_file_shape():
+    rows = _rows('HHHEELLLLOO') + [{'frame_count': 12, 'label': 'none'}] + [[13, 0.8, 'H'], [14, 0.7, 'I']]
+    assert stages.compact_ranges(rows) == [
+        {'frameRange': '1-3', 'label': 'H'},
+        {'frameRange': '4-5', 'label': 'E'},
+        {'frameRange': '6-9', 'label': 'L'},
+        {'frameRange': '10-11', 'label': 'O'},
+        {'frameRange': '12-12', 'label': 'none'},
+        {'frameRange': '13-13', 'label': 'H'},
+        {'frameRange': '14-14', 'label': 'I'},
+    ]
+
+
+def test_compact_runs_adds_frames_and_confidence():
+    rows = [{'frame_count': 1, 'label': 'A', 'confidence': 0.8}, {'frame_count': 2, 'label': 'A', 'confidence': 0.6}]
+    assert stages.compact_runs(rows) == [{'frameRange': '1-2', 'label': 'A', 'frames': 2, 'confidence': 0.7}]
+
+
+def test_correct_words_matches_within_two_edits():
+    rows = _rows(['W', 'O', 'R', 'L', 'F', 'sp', 'X', 'Q', 'Z', 'J', 'V'])
+    corrected = stages.correct_words(stages.compact_ranges(rows))
+    assert corrected[0] == {'frame': '1-5', 'string': 'world'}
+    # Nothing within two edits: the raw letters are kept
+    assert corrected[1]['string'] == 'XQZJV'
+    assert set(corrected[1]) == {'frame', 'string'}
+
+
+def test_match_word():
+    assert decoder.match_word('THE') == 'the'
+    assert decoder.match_word('thw') == 'the'
+    assert decoder.levenshtein('kitten', 'sitting') == 3
+
+
+def test_decode_words_exposes_raw_and_confidence():
+    words = stages.decode_words(stages.compact_runs(_rows('HHHEELLLLOO')))
+    assert len(words) == 1
+    assert words[0]['frame'] == '1-11'
+    assert words[0]['string'] == 'hello'
+    assert words[0]['raw'] == 'HELO'
+    assert 0.0 < words[0]['confidence'] <= 1.0
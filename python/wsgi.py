@@ -0,0 +1,54 @@
+"""
+WSGI entry point for production serving under a pre-forking server.
+
+    gunicorn -c python/gunicorn.conf.py wsgi:app
+
+``SERVER_APP`` picks which server to expose:
+    ingest  python/server.py (frame ingest + realtime detection, default)
+    detect  server.py at the repo root (/detect-frame, /analyze)
+
+Both servers load YOLO weights at import time, so with ``preload_app``
+the weights are loaded once in the gunicorn master and every forked
+worker shares those pages copy-on-write.
+"""
+from __future__ import annotations
+
+import importlib
+import importlib.util
+import os
+import sys
+from pathlib import Path
+
+PYTHON_DIR = Path(__file__).resolve().parent
+ROOT_DIR = PYTHON_DIR.parent
+
+if str(PYTHON_DIR) not in sys.path:
+    sys.path.insert(0, str(PYTHON_DIR))
+
+_module = None
+
+
+def load_server_module(kind: str | None = None):
+    """Import (once) and return the server module selected by ``kind``/SERVER_APP."""
+    global _module
+    if _module is not None:
+        return _module
+    kind = (kind or os.environ.get('SERVER_APP', 'ingest')).lower()
+    if kind == 'ingest':
+        _module = importlib.import_module('server')
+    elif kind == 'detect':
+        spec = importlib.util.spec_from_file_location('detect_server', ROOT_DIR / 'server.py')
+        _module = importlib.util.module_from_spec(spec)
+        sys.modules['detect_server'] = _module
+        spec.loader.exec_module(_module)
+    else:
+        raise ValueError(f"Unknown SERVER_APP {kind!r} (expected 'ingest' or 'detect')")
+    return _module
+
+
+def create_app(kind: str | None = None):
+    """App factory for gunicorn (``wsgi:create_app()``) and other WSGI servers."""
+    return load_server_module(kind).app
+
+
+app = create_app()
@@ -1,9 +1,17 @@
 import argparse
 import json
+import sys
+import threading
+import time
 from collections import deque
+from datetime import datetime
 from pathlib import Path
 
-from ultralytics import YOLO
+sys.path.insert(0, str(Path(__file__).resolve().parent / "python"))
+
+import capture  # noqa: E402
+import detection_bus  # noqa: E402
+import sidecar  # noqa: E402
 
 
 
@@ -27,6 +35,21 @@ def find_latest_weights():
     return candidates[-1] if candidates else None
 
 
+def write_rows(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        if not rows:
+            f.write("[]\n")
+        else:
+            f.write("[\n")
+            for i, row in enumerate(rows):
+                line = json.dumps(row, ensure_ascii=False)
+                if i < len(rows) - 1:
+                    f.write(f"  {line},\n")
+                else:
+                    f.write(f"  {line}\n")
+            f.write("]\n")
+
+
 def main():
     ap = argparse.ArgumentParser(description="Realtime ASL detector using webcam")
     ap.add_argument("--weights", default=None, help="path to trained weights")
@@ -38,6 +61,14 @@ def main():
     ap.add_argument("--camera", default=0, help="camera index")
     ap.add_argument("--auto-camera", action="store_true", help="auto-pick first working camera")
     ap.add_argument("--out", default="detections.json", help="output JSON file")
+    ap.add_argument("--no-file", action="store_true", help="do not write --out at all (publish only)")
+    ap.add_argument(
+        "--publish",
+        nargs="?",
+        const=detection_bus.DEFAULT_ADDRESS,
+        default=None,
+        help=f"publish detections on a local socket (default address: {detection_bus.DEFAULT_ADDRESS})",
+    )
     ap.add_argument("--max-entries", type=int, default=100, help="max rows to keep in JSON")
     ap.add_argument(
         "--log-empty",
@@ -45,6 +76,15 @@ def main():
         help="log frames with no detection as [frame, 0.0, 'none']",
     )
     ap.add_argument("--write-every", type=int, default=1, help="write JSON every N frames")
+    ap.add_argument("--topk", type=int, default=0, help="store top-k class scores per frame in a sidecar (0 = off)")
+    ap.add_argument("--topk-full", action="store_true", help="store the full class-score vector instead of top-k")
+    ap.add_argument("--topk-conf", type=float, default=0.05, help="lowest score kept as a top-k alternative")
+    ap.add_argument("--sidecar", default=None, help="sidecar path (default: <out>.topk.bin)")
+    ap.add_argument("--headless", action="store_true", help="no preview window")
+    ap.add_argument("--width", type=int, default=None, help="requested capture width")
+    ap.add_argument("--height", type=int, default=None, help="requested capture height")
+    ap.add_argument("--latency-every", type=float, default=5.0, help="print a latency summary every N seconds (0 = off)")
+    ap.add_argument("--latency-log", default=None, help="append per-frame capture-to-result latency to this CSV")
     args = ap.parse_args()
 
     weights = args.weights
@@ -55,6 +95,8 @@ def main():
         else:
             raise FileNotFoundError("No weights found. Train first or pass --weights path.")
 
+    # Imported here so batch_detect.py's decode processes can import the helpers above without torch
+    from ultralytics import YOLO
     model = YOLO(weights)
     if args.auto_camera:
         cam = find_working_camera()
@@ -65,47 +107,140 @@ def main():
     buffer = deque(maxlen=args.max_entries)
     frame_idx = 0
 
-    # stream=True yields results frame-by-frame
-    for result in model.predict(
-        source=args.camera,
-        stream=True,
-        imgsz=args.imgsz,
-        conf=args.conf,
-        iou=args.iou,
-        max_det=args.max_det,
-        device=args.device,
-        show=True,
-    ):
-        frame_idx += 1
-        entry = None
-        if result.boxes is not None and len(result.boxes) > 0:
-            confs = result.boxes.conf
-            best_idx = int(confs.argmax().item())
-            best_conf = float(confs[best_idx].item())
-            best_cls = int(result.boxes.cls[best_idx].item())
-            label = model.names.get(best_cls, str(best_cls))
-            entry = [frame_idx, best_conf, label]
-        elif args.log_empty:
-            entry = [frame_idx, 0.0, "none"]
-
-        if entry is not None:
-            buffer.append(entry)
-
-        if frame_idx % args.write_every == 0:
-            rows = list(buffer)
-            with open(args.out, "w", encoding="utf-8") as f:
-                if not rows:
-                    f.write("[]\n")
-                else:
-                    f.write("[\n")
-                    for i, row in enumerate(rows):
-                        line = json.dumps(row, ensure_ascii=False)
-                        if i < len(rows) - 1:
-                            f.write(f"  {line},\n")
-                        else:
-                            f.write(f"  {line}\n")
-                    f.write("]\n")
-
+    scores_out = None
+    if args.topk > 0 or args.topk_full:
+        sidecar_path = args.sidecar or str(Path(args.out).with_suffix(".topk.bin"))
+        scores_out = sidecar.SidecarWriter(sidecar_path, model.names, args.topk, args.topk_full)
+
+    cap = capture.LatestFrameCapture(
+        args.camera,
+        width=args.width,
+        height=args.height,
+        # Video files are processed frame by frame; live cameras always use the newest frame
+        drop=str(args.camera).isdigit(),
+    ).start()
+    latency = capture.LatencyStats()
+    publisher = detection_bus.Publisher(args.publish) if args.publish else None
+    if publisher is not None:
+        print(f"Publishing detections on {args.publish}")
+    # The JSON file is now just one (optional) sink, written off the inference thread
+    sink = None if args.no_file else detection_bus.JsonFileSink(args.out, write_rows)
+    latency_log = open(args.latency_log, "a", encoding="utf-8") if args.latency_log else None
+    if latency_log is not None and latency_log.tell() == 0:
+        latency_log.write("frame,capture_seq,latency_ms,inference_ms,dropped\n")
+    stop = threading.Event()
+    preview = {"image": None, "seq": 0}
+    preview_lock = threading.Lock()
+
+    def inference_loop():
+        nonlocal frame_idx
+        last_report = time.monotonic()
+        while not stop.is_set():
+            frame = cap.read(timeout=0.5)
+            if frame is None:
+                if cap.eof:
+                    break
+                continue
+            t0 = time.monotonic()
+            result = model.predict(
+                source=frame.image,
+                imgsz=args.imgsz,
+                conf=min(args.conf, args.topk_conf) if scores_out else args.conf,
+                iou=args.iou,
+                max_det=max(args.max_det, scores_out.k) if scores_out else args.max_det,
+                device=args.device,
+                verbose=False,
+            )[0]
+            done = time.monotonic()
+            frame_idx += 1
+            entry = None
+            if scores_out is not None:
+                scores_out.add_result(frame_idx, frame.captured_ns // 1000, result)
+            best_idx = None
+            best_conf = 0.0
+            if result.boxes is not None and len(result.boxes) > 0:
+                confs = result.boxes.conf
+                best_idx = int(confs.argmax().item())
+                best_conf = float(confs[best_idx].item())
+            if best_idx is not None and best_conf >= args.conf:
+                best_cls = int(result.boxes.cls[best_idx].item())
+                label = model.names.get(best_cls, str(best_cls))
+                entry = [frame_idx, best_conf, label]
+            elif args.log_empty:
+                entry = [frame_idx, 0.0, "none"]
+
+            if entry is not None:
+                buffer.append(entry)
+                if publisher is not None:
+                    publisher.publish({
+                        "frame_count": entry[0],
+                        "timestamp": datetime.fromtimestamp(frame.captured_ns / 1e9).isoformat(),
+                        "label": entry[2],
+                        "confidence": round(entry[1], 4),
+                        "latency_ms": round((done - frame.captured) * 1000, 1),
+                    })
+
+            if frame_idx % args.write_every == 0:
+                if scores_out is not None:
+                    scores_out.flush()
+                if sink is not None:
+                    sink.update(list(buffer))
+
+            latency.add(done - frame.captured)
+            if latency_log is not None:
+                latency_log.write(
+                    f"{frame_idx},{frame.seq},{(done - frame.captured) * 1000:.2f},"
+                    f"{(done - t0) * 1000:.2f},{cap.dropped}\n"
+                )
+            if not args.headless:
+                with preview_lock:
+                    preview["image"] = result.plot()
+                    preview["seq"] = frame_idx
+            if args.latency_every > 0 and done - last_report >= args.latency_every:
+                summary = latency.summary()
+                print(
+                    f"frames {frame_idx} | captured {cap.captured} dropped {cap.dropped} | "
+                    f"capture->result p50 {summary.get('p50_ms')} ms p95 {summary.get('p95_ms')} ms"
+                )
+                last_report = done
+        stop.set()
+
+    worker = threading.Thread(target=inference_loop, name="inference", daemon=True)
+    worker.start()
+    try:
+        # The preview runs on the main thread (required by some GUI backends) and never
+        # blocks inference: it only shows whichever annotated frame is newest.
+        shown = 0
+        while not stop.is_set():
+            if args.headless:
+                stop.wait(0.5)
+                continue
+            with preview_lock:
+                image, seq = preview["image"], preview["seq"]
+            if image is not None and seq != shown:
+                cv2.imshow("realtime_detect", image)
+                shown = seq
+            if cv2.waitKey(10) & 0xFF == ord("q"):
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        worker.join(timeout=5.0)
+        cap.stop()
+        if scores_out is not None:
+            scores_out.flush()
+        if sink is not None:
+            sink.update(list(buffer))
+            sink.close()
+        if publisher is not None:
+            publisher.close()
+        if latency_log is not None:
+            latency_log.close()
+        if not args.headless:
+            cv2.destroyAllWindows()
+        summary = latency.summary()
+        print(f"Processed {frame_idx} frames ({cap.dropped} dropped as stale); capture->result latency: {summary}")
 
 if __name__ == "__main__":
     main()
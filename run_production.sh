@@ -0,0 +1,33 @@
+#!/bin/bash
+
+# Production server: gunicorn with pre-forked workers sharing one preloaded model.
+# Tunables (see python/gunicorn.conf.py): SERVER_APP, SERVER_WORKERS, SERVER_THREADS,
+# TORCH_NUM_THREADS, BACKEND_PORT, GRACEFUL_TIMEOUT
+#
+# Every open /feed.mjpg viewer occupies one of a worker's SERVER_THREADS request threads
+# for as long as it streams. FEED_MAX_VIEWERS (default 2 per worker) answers 503 past the
+# cap and FEED_MAX_SECONDS (default 300) ends each stream so viewers reconnect; keep
+# FEED_MAX_VIEWERS below SERVER_THREADS or viewers starve frame ingest.
+
+SCRIPT_DIR="$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )"
+cd "$SCRIPT_DIR"
+
+# Load environment variables
+if [ -f .env ]; then
+    export $(cat .env | grep -v '^#' | xargs)
+fi
+
+if ! command -v gunicorn &> /dev/null; then
+    echo "❌ Error: gunicorn is not installed (pip install -r python/requirements.txt)"
+    exit 1
+fi
+
+echo "======================================================"
+echo "Starting production server"
+echo "  App:     ${SERVER_APP:-ingest}"
+echo "  Port:    ${BACKEND_PORT:-5000}"
+echo "  Workers: ${SERVER_WORKERS:-auto} x ${SERVER_THREADS:-4} threads"
+echo "======================================================"
+
+# exec so SIGTERM/SIGINT reach the gunicorn master, which drains workers gracefully
+exec gunicorn -c python/gunicorn.conf.py wsgi:app
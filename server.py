@@ -1,17 +1,33 @@
 from __future__ import annotations
 
-import io
 import json
 import os
-from collections import deque
+import sys
+import time
+from contextlib import nullcontext
 from datetime import datetime
 from pathlib import Path
+from threading import Lock
 
-import cv2
-import numpy as np
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
-from PIL import Image
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT / 'python'))
+
+import admission  # noqa: E402
+import autotune  # noqa: E402
+import cascade  # noqa: E402
+import columnar  # noqa: E402
+import decoder  # noqa: E402
+import detection_bus  # noqa: E402
+import gemini  # noqa: E402
+import history  # noqa: E402
+import log_views  # noqa: E402
+import metrics  # noqa: E402
+import model_reload  # noqa: E402
+import pipeline  # noqa: E402
+import stages  # noqa: E402
 
 try:
     from ultralytics import YOLO
@@ -19,32 +35,206 @@ except Exception:
     YOLO = None
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['Retry-After'])
 
-ROOT = Path(__file__).resolve().parent
 DETECTIONS_LOG = ROOT / 'detections.json'
-WEIGHTS_PATH = Path(r'C:\Users\32876\Downloads\newyolo\lastest.pt')
+WEIGHTS_PATH = Path(os.environ.get('YOLO_WEIGHTS', r'C:\Users\32876\Downloads\newyolo\lastest.pt'))
 MAX_ENTRIES = int(os.environ.get('MAX_ENTRIES', '100'))
 CONF = float(os.environ.get('YOLO_CONF', '0.6'))
 IOU = float(os.environ.get('YOLO_IOU', '0.5'))
 MAX_DET = int(os.environ.get('YOLO_MAX_DET', '1'))
-GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-2.0-flash')
+# Local decodes at or above this confidence skip the Gemini call (set > 1 to always go remote)
+LOCAL_DECODE_THRESHOLD = float(os.environ.get('LOCAL_DECODE_THRESHOLD', '0.6'))
+# Advertised via /capabilities; CAPTURE_SIZE defaults to the model input size
+CAPTURE_SIZE = int(os.environ.get('CAPTURE_SIZE', '0'))
+CAPTURE_JPEG_QUALITY = int(os.environ.get('CAPTURE_JPEG_QUALITY', '70'))
+CAPTURE_MAX_FPS = float(os.environ.get('CAPTURE_MAX_FPS', '30'))
+# Subscribe to realtime_detect.py --publish at this address (unset = off)
+DETECTION_BUS = os.environ.get('DETECTION_BUS_SUBSCRIBE', '')
 
-buffer = deque(maxlen=MAX_ENTRIES)
+buffer = columnar.DetectionColumns(MAX_ENTRIES)
+# The columns are not thread-safe: request threads, the bus subscriber and /reset share them
+buffer_lock = Lock()
+views = log_views.LogViews(buffer, buffer_lock)
+analyzer = gemini.analyzer_from_env()
+history_store = history.store_from_env(ROOT / 'detections.sqlite3')
 model = None
 if YOLO is not None and WEIGHTS_PATH.exists():
     model = YOLO(str(WEIGHTS_PATH))
 
 
+def on_model_swap(handle):
+    global model, MODEL_INPUT_SIZE
+    model = handle.full.get() if isinstance(handle, cascade.Cascade) else handle.get()
+    # Derived from the model at startup: follow the new weights
+    if not CAPTURE_SIZE:
+        MODEL_INPUT_SIZE = handle.input_size
+    autotune.follow_model(tuner, handle.input_size)
+
+
+# Inference borrows the model from here; MODEL_WATCH_INTERVAL_S reloads it when the weights file changes.
+# With CASCADE_WEIGHTS, a small model answers confident frames and the YOLO model the rest.
+models = model_reload.ModelSlot(
+    cascade.cascade_from_env(stages.ModelHandle(WEIGHTS_PATH, model)) if model is not None else None,
+    loader=(lambda path: YOLO(path)) if YOLO is not None else None,
+    on_swap=on_model_swap,
+)
+weights_watcher = model_reload.watcher_from_env(models, WEIGHTS_PATH)
+MODEL_INPUT_SIZE = CAPTURE_SIZE or (models.current.input_size if models.current is not None else 0)
+
+
 def write_detections():
+    with buffer_lock:
+        rows = list(buffer)
     with open(DETECTIONS_LOG, 'w', encoding='utf-8') as f:
-        json.dump(list(buffer), f, ensure_ascii=False, indent=2)
+        json.dump(rows, f, ensure_ascii=False, indent=2)
         f.write('\n')
 
 
+def on_bus_detection(message: dict):
+    entry = {
+        'frame_count': message.get('frame_count'),
+        'timestamp': message.get('timestamp') or datetime.now().isoformat(),
+        'label': message.get('label', 'none'),
+        'confidence': message.get('confidence', 0.0),
+    }
+    with buffer_lock:
+        buffer.append(entry)
+    metrics.FRAMES_TOTAL.inc(endpoint='bus', session='realtime')
+    if history_store is not None:
+        history_store.add(entry, message.get('session', 'realtime'))
+
+
+bus_subscriber = None
+_bus_pid = None
+
+
+def start_background_tasks():
+    """Start per-process background threads (called again in each forked worker)"""
+    global bus_subscriber, _bus_pid
+    if weights_watcher is not None:
+        weights_watcher.start()
+    # The subscriber thread does not survive fork: each worker opens its own subscription
+    if DETECTION_BUS and _bus_pid != os.getpid():
+        if bus_subscriber is not None:
+            bus_subscriber.close()
+        bus_subscriber = detection_bus.subscribe(DETECTION_BUS, on_bus_detection)
+        _bus_pid = os.getpid()
+
+
+def configure_worker(worker_id: int, workers: int, seq_base: int = 0):
+    """Per-process setup in a forked gunicorn worker (see python/server.py configure_worker)"""
+    global DETECTIONS_LOG
+    if workers > 1:
+        DETECTIONS_LOG = DETECTIONS_LOG.with_name(f'{DETECTIONS_LOG.stem}.{worker_id}{DETECTIONS_LOG.suffix}')
+        with buffer_lock:
+            buffer.rebase(seq_base)
+
+
+# Under gunicorn's preload_app the master imports this module; gunicorn.conf.py starts the
+# threads from post_fork instead, so no thread is running (or holding a lock) at fork
+if os.environ.get('SERVER_PRELOADED') != '1':
+    start_background_tasks()
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is not None:
+        labels = {
+            'endpoint': request.url_rule.rule if request.url_rule else 'unmatched',
+            'method': request.method,
+            'status': response.status_code,
+        }
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, **labels)
+        metrics.REQUESTS_TOTAL.inc(**labels)
+    return response
+
+
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'ok', 'model_loaded': model is not None}), 200
+    body = {'status': 'ok', 'model_loaded': model is not None}
+    if admission_control is not None:
+        body['admission'] = admission_control.stats()
+    if tuner is not None:
+        body['autotune'] = tuner.stats()
+    if isinstance(models.current, cascade.Cascade):
+        body['cascade'] = models.current.stats()
+    if models.current is not None:
+        body['model'] = models.stats()
+    if bus_subscriber is not None:
+        body['bus'] = {'address': DETECTION_BUS, 'last_seq': bus_subscriber.last_seq, 'gaps': bus_subscriber.gaps}
+    return jsonify(body), 200
+
+
+# ----- /detect-frame pipeline (executors tunable via PIPELINE_DETECT_FRAME) -----
+
+def decode_stage(data: bytes, max_side: int):
+    return {'frame': stages.decode_image(data, max_side)}
+
+
+def predict_stage(frame):
+    with models.acquire() as handle:
+        started = time.perf_counter()
+        prediction = stages.predict(handle, frame, CONF, IOU, MAX_DET, imgsz=tuner.imgsz if tuner else None)
+    if tuner is not None:
+        tuner.observe(time.perf_counter() - started)
+    return {'prediction': prediction}
+
+
+def predict_batch_stage(items: list[dict]) -> list[dict]:
+    with models.acquire() as handle:
+        started = time.perf_counter()
+        preds = stages.predict_batch(
+            handle, [item['frame'] for item in items], CONF, IOU, MAX_DET, imgsz=tuner.imgsz if tuner else None,
+        )
+    if tuner is not None:
+        tuner.observe(time.perf_counter() - started, frames=len(items))
+    return [{'prediction': pred} for pred in preds]
+
+
+def label_stage(prediction):
+    label, conf, _ = prediction.best()
+    if label is None:
+        label, conf = 'none', 0.0
+    elif str(label).lower() == 'sp':
+        label = 'G'
+    return {'label': label, 'confidence': conf}
+
+
+def log_write_stage(label: str, confidence: float, session: str):
+    with buffer_lock:
+        entry = {
+            'frame_count': (buffer[-1]['frame_count'] + 1) if buffer else 1,
+            'timestamp': datetime.now().isoformat(),
+            'label': label,
+            'confidence': confidence,
+        }
+        buffer.append(entry)
+    if history_store is not None:
+        history_store.add(entry, session)
+    write_detections()
+    return {'entry': entry}
+
+
+detect_pipeline = pipeline.Pipeline('detect-frame', [
+    # decode and label only use their inputs, so they may run in a process pool; predict
+    # needs the swappable model and the auto-tuner, log_write the shared buffer
+    pipeline.Stage('decode', decode_stage, ('data', 'max_side'), ('frame',), process_safe=True),
+    pipeline.Stage('predict', predict_stage, ('frame',), ('prediction',), batch_fn=predict_batch_stage),
+    pipeline.Stage('label', label_stage, ('prediction',), ('label', 'confidence'), process_safe=True),
+    pipeline.Stage('log_write', log_write_stage, ('label', 'confidence', 'session'), ('entry',)),
+], provided=('data', 'max_side', 'session'))
+admission_control = admission.controller_from_env('detect-frame')
+tuner = autotune.tuner_from_env(
+    'detect-frame', models.current.input_size if models.current is not None else 0,
+    backlog_fn=lambda: admission_control.waiting if admission_control is not None else 0,
+)
 
 
 @app.route('/detect-frame', methods=['POST'])
@@ -52,51 +242,38 @@ def detect_frame():
     if model is None:
         return jsonify({'error': 'model not loaded'}), 500
 
-    if 'frame' not in request.files:
-        return jsonify({'error': 'frame missing'}), 400
+    session = metrics.session_from_request(request)
+    with metrics.stage('parse', 'detect-frame', session):
+        if 'frame' not in request.files:
+            return jsonify({'error': 'frame missing'}), 400
 
-    frame_file = request.files['frame']
-    data = frame_file.read()
+        frame_file = request.files['frame']
+        data = frame_file.read()
     if not data:
         return jsonify({'error': 'empty frame'}), 400
+    if tuner is not None and not tuner.should_infer(session):
+        return jsonify({'status': 'skipped', 'stride': tuner.stride}), 200
 
     try:
-        image = Image.open(io.BytesIO(data))
-        frame = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-    except Exception:
-        return jsonify({'error': 'invalid image'}), 400
-
-    results = model.predict(
-        source=frame,
-        conf=CONF,
-        iou=IOU,
-        max_det=MAX_DET,
-        verbose=False,
-    )
-
-    label = 'none'
-    conf = 0.0
-    if results:
-        r = results[0]
-        if r.boxes is not None and len(r.boxes) > 0:
-            confs = r.boxes.conf
-            best_idx = int(confs.argmax().item())
-            conf = float(confs[best_idx].item())
-            best_cls = int(r.boxes.cls[best_idx].item())
-            label = r.names.get(best_cls, str(best_cls))
-            if str(label).lower() == 'sp':
-                label = 'G'
+        slot = admission_control.admit(session) if admission_control is not None else nullcontext()
+    except admission.Rejected as e:
+        response = jsonify({'error': 'busy', 'reason': e.reason})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, e.status
 
-    entry = {
-        'frame_count': (buffer[-1]['frame_count'] + 1) if buffer else 1,
-        'timestamp': datetime.now().isoformat(),
-        'label': label,
-        'confidence': conf,
-    }
-    buffer.append(entry)
-    write_detections()
+    try:
+        with slot:
+            ctx = detect_pipeline.run({'data': data, 'max_side': MODEL_INPUT_SIZE, 'session': session})
+    except stages.InvalidImage:
+        return jsonify({'error': 'invalid image'}), 400
+    except pipeline.PipelineBusy:
+        response = jsonify({'error': 'busy'})
+        response.headers['Retry-After'] = '1'
+        return response, 503
 
-    return jsonify({'status': 'ok', 'label': label, 'confidence': conf}), 200
+    metrics.FRAMES_TOTAL.inc(endpoint='detect-frame', session=session)
+    entry = ctx['entry']
+    return jsonify({'status': 'ok', 'label': entry['label'], 'confidence': entry['confidence']}), 200
 
 
 @app.route('/detections', methods=['GET'])
@@ -105,13 +282,74 @@ def detections():
         limit = int(request.args.get('limit', '4'))
     except Exception:
         limit = 4
-    rows = list(buffer)[-limit:]
-    return jsonify(rows), 200
+    # Same rows as before (limit <= 0: all of them); also versioned (ETag/304, ?since= delta, gzip)
+    # like /logs/*, with deltas trimmed to the newest `limit` rows as well
+    return views.response('raw', limit=limit)
+
+
+@app.route('/capabilities', methods=['GET'])
+def capabilities():
+    return jsonify({
+        'input_size': MODEL_INPUT_SIZE,
+        'jpeg_quality': CAPTURE_JPEG_QUALITY,
+        'max_fps': CAPTURE_MAX_FPS,
+        'accepts_letterboxed': True,
+        'detection': model is not None,
+    }), 200
+
+
+@app.route('/logs/raw', methods=['GET'])
+def logs_raw():
+    return views.response('raw')
+
+
+@app.route('/logs/compacted', methods=['GET'])
+def logs_compacted():
+    return views.response('compacted')
+
+
+@app.route('/logs/corrected', methods=['GET'])
+def logs_corrected():
+    return views.response('corrected')
+
+
+@app.route('/logs/runs', methods=['GET'])
+def logs_runs():
+    return views.response('runs')
+
+
+@app.route('/logs/words', methods=['GET'])
+def logs_words():
+    return views.response('words')
+
+
+@app.route('/pipeline', methods=['GET'])
+def pipeline_config():
+    return jsonify({detect_pipeline.name: detect_pipeline.describe()}), 200
+
+
+@app.route('/history', methods=['GET'])
+def history_query():
+    if history_store is None:
+        return jsonify({'error': 'history store disabled'}), 404
+    try:
+        params = history.query_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'invalid query: {e}'}), 400
+    return jsonify(history_store.query(**params)), 200
+
+
+@app.route('/history/sessions', methods=['GET'])
+def history_sessions():
+    if history_store is None:
+        return jsonify({'error': 'history store disabled'}), 404
+    return jsonify(history_store.sessions()), 200
 
 
 @app.route('/reset', methods=['POST'])
 def reset():
-    buffer.clear()
+    with buffer_lock:
+        buffer.clear()
     write_detections()
     return jsonify({'status': 'ok'}), 200
 
@@ -120,36 +358,73 @@ def reset():
 def analyze():
     payload = request.get_json(silent=True) or {}
     text = str(payload.get('text', '')).strip()
-    if not text:
+    frames = payload.get('frames')
+    if payload.get('from_buffer'):
+        with buffer_lock:
+            frames = list(buffer)
+    if frames is not None and (not isinstance(frames, list) or not all(isinstance(f, dict) for f in frames)):
+        return jsonify({'error': 'frames must be a list of detection objects'}), 400
+    if not text and not frames:
         return jsonify({'error': 'text missing'}), 400
 
-    api_key = os.environ.get('GEMINI_API_KEY')
-    if not api_key:
-        return jsonify({'error': 'GEMINI_API_KEY not set'}), 500
-
-    try:
-        from google import genai
-    except Exception as exc:
-        return jsonify({'error': 'Gemini SDK not installed', 'detail': str(exc)}), 500
+    started = time.perf_counter()
+    decoded = decoder.decode_frames(frames) if frames else decoder.decode_text(text)
+    if decoded.text and decoded.confidence >= LOCAL_DECODE_THRESHOLD:
+        print(f'[analyze] local decode: {decoded.text} ({decoded.confidence:.2f})')
+        gemini.ANALYZE_REQUESTS.inc(source='local')
+        metrics.ANALYZE_SECONDS.observe(time.perf_counter() - started, outcome='local')
+        return jsonify({
+            'result': decoded.text,
+            'source': 'local',
+            'local_confidence': decoded.confidence,
+            'words': decoded.words,
+        }), 200
+    if not text:
+        text = ' '.join(w['raw'] for w in decoded.words).strip()
+        if not text:
+            # Nothing but separators/unknown rows: there is nothing to ask Gemini about
+            return jsonify({'error': 'text missing'}), 400
 
     try:
         print('[analyze] prompt letters:', text)
-        client = genai.Client(api_key=api_key)
-        prompt = (
-            'Guess the actual word or sentence from these letters. '
-            'Letters may be missing or noisy. Return only the best guess.\n'
-            f'Letters: {text}'
-        )
-        response = client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=prompt,
-        )
-        result_text = getattr(response, 'text', '') or ''
-        print('[analyze] result:', result_text.strip())
-        return jsonify({'result': result_text.strip()}), 200
-    except Exception as exc:
-        print('[analyze] error:', exc)
-        return jsonify({'error': 'Gemini request failed', 'detail': str(exc)}), 500
+        result_text, source = analyzer.analyze(text)
+        print(f'[analyze] result ({source}):', result_text)
+        metrics.ANALYZE_SECONDS.observe(time.perf_counter() - started, outcome=source)
+        return jsonify({
+            'result': result_text,
+            'source': source,
+            'local_confidence': decoded.confidence,
+        }), 200
+    except gemini.AnalyzeError as exc:
+        print('[analyze] error:', exc.message, exc.detail)
+        metrics.ANALYZE_SECONDS.observe(time.perf_counter() - started, outcome='error')
+        body = {'error': exc.message}
+        if exc.detail:
+            body['detail'] = exc.detail
+        response = jsonify(body)
+        if isinstance(exc, gemini.AnalyzeBusy):
+            response.headers['Retry-After'] = '1'
+        return response, exc.status
+
+
+@app.route('/analyze/stats', methods=['GET'])
+def analyze_stats():
+    counts = {
+        source: int(gemini.ANALYZE_REQUESTS.value(source=source))
+        for source in ('local', 'cache', 'coalesced', 'remote', 'error', 'timeout', 'rejected')
+    }
+    answered = counts['local'] + counts['cache'] + counts['coalesced'] + counts['remote']
+    return jsonify({
+        'counts': counts,
+        'threshold': LOCAL_DECODE_THRESHOLD,
+        'local_ratio': (counts['local'] / answered) if answered else None,
+        'remote_calls': counts['remote'],
+    }), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
 
 
 if __name__ == '__main__':